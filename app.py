@@ -1,111 +1,168 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, current_app, render_template, request, redirect, url_for, session, flash, jsonify
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
-import razorpay
-import requests
+import db_pool
+import database
+from catalog_cache import catalog
+import product_search
+import fulfilment
+import cart_service
+import order_service
+import assets
+import rollups
+import db_manager
+import metrics
+import inventory
+import serving
+import page_cache
+import payments
+import pricing
+import shipping_quotes
+import passwords
+import custom_designs
 import json
+import math
 import os
 from datetime import datetime
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-app = Flask(__name__)
-app.secret_key = os.urandom(24)
+# Views register through route() and create_app() adds them to the app it
+# builds, keeping the bare endpoint names the templates pass to url_for().
+# Integration clients (payments.get_client(), shiprocket.get_client()) are
+# built on first use, so a process that never takes a payment never imports
+# the Razorpay SDK. Background workers start with the first request, i.e. in
+# each worker process after gunicorn forks. Under PRELOAD_APP gunicorn.conf.py
+# calls warm() in the master so workers fork with compiled templates and a
+# filled catalog cache, but no open database connections.
+_routes = []
 
-# Razorpay configuration
-RAZORPAY_KEY_ID = 'your_razorpay_key_id'
-RAZORPAY_KEY_SECRET = 'your_razorpay_key_secret'
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
-
-# Shiprocket configuration
-SHIPROCKET_EMAIL = 'your_shiprocket_email'
-SHIPROCKET_PASSWORD = 'your_shiprocket_password'
-SHIPROCKET_TOKEN = None
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
 
 def get_db_connection():
-    conn = sqlite3.connect('data/inventory.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def get_shiprocket_token():
-    global SHIPROCKET_TOKEN
-    if SHIPROCKET_TOKEN:
-        return SHIPROCKET_TOKEN
-    
-    url = "https://apiv2.shiprocket.in/v1/external/auth/login"
-    payload = {
-        "email": SHIPROCKET_EMAIL,
-        "password": SHIPROCKET_PASSWORD
-    }
-    headers = {
-        "Content-Type": "application/json"
-    }
-    
-    response = requests.post(url, data=json.dumps(payload), headers=headers)
-    if response.status_code == 200:
-        SHIPROCKET_TOKEN = response.json().get('token')
-        return SHIPROCKET_TOKEN
-    return None
+    return db_pool.get_connection()
 
-@app.route('/')
-def index():
+def start_background_work():
+    fulfilment.start_workers()
+    inventory.start_sweeper()
+    custom_designs.start_workers()
+
+def create_app(config=None):
+    """Build the storefront app; config overrides settings read from the environment"""
+    app = Flask(__name__, static_folder='Static', static_url_path='/static')
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+    # Proxies in front of the app that append to X-Forwarded-For; 0 trusts none
+    app.config['PROXY_HOPS'] = int(os.environ.get('PROXY_HOPS', 0))
+    app.config.update(config or {})
+    if not app.config['SECRET_KEY']:
+        # Fine for one dev process; separate workers would reject each other's sessions
+        app.logger.warning('SECRET_KEY is not set; using a random key for this process')
+        app.config['SECRET_KEY'] = os.urandom(24)
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    assets.init_app(app)
+    metrics.init_app(app)
+    serving.init_app(app)
+    custom_designs.init_app(app)
+    if app.config['PROXY_HOPS']:
+        # request.remote_addr becomes the client's address, for the login throttle and /metrics
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_HOPS'])
+
+    # Bring an existing database up to the current schema version
     conn = get_db_connection()
-    featured_products = conn.execute('SELECT * FROM products LIMIT 6').fetchall()
-    customizable_products = conn.execute('SELECT * FROM products WHERE customizable = 1 LIMIT 4').fetchall()
-    product_ids = [p['id'] for p in featured_products + customizable_products]
-    placeholders = ','.join(['?'] * len(product_ids))
-    product_imgs = conn.execute(f'SELECT * FROM product_images WHERE is_primary = 1 AND product_id IN ({placeholders})', product_ids)
-    product_imgs_dict = {img['product_id']: img['image_url'] for img in product_imgs}
-    featured_product_imgs = {p['id']: product_imgs_dict.get(p['id'], 'default.jpg') for p in featured_products}
-    customizable_product_imgs = {p['id']: product_imgs_dict.get(p['id'], 'default.jpg') for p in customizable_products}
+    database.migrate(conn)
     conn.close()
-    return render_template('index.html', featured_products=featured_products, customizable_products=customizable_products, featured_product_imgs=featured_product_imgs, customizable_product_imgs=customizable_product_imgs)
 
-@app.route('/search')
+    app.before_first_request(start_background_work)
+    return app
+
+def warm(app):
+    """Compile templates, fill the catalog cache and import the payment SDK, then close connections"""
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+    conn = get_db_connection()
+    catalog.featured(conn)
+    catalog.customizable(conn)
+    conn.close()
+    payments.preload()
+    # Connections must not cross a fork; workers open their own
+    db_pool.close_all()
+
+# The homepage and product pages render through page_cache, which only calls
+# these loaders when the catalog changed since the page was last rendered.
+def _index_context(conn):
+    featured_products, featured_product_imgs = catalog.featured(conn)
+    customizable_products, customizable_product_imgs = catalog.customizable(conn)
+    return dict(featured_products=featured_products, customizable_products=customizable_products, featured_product_imgs=featured_product_imgs, customizable_product_imgs=customizable_product_imgs)
+
+@route('/')
+def index():
+    return page_cache.render('index.html', (), _index_context)
+
+@route('/search')
 def search():
     query = request.args.get('q', '')
     category = request.args.get('category', '')
+    cursor = request.args.get('after')
     
     conn = get_db_connection()
-    if category:
-        products = conn.execute('SELECT * FROM products WHERE name LIKE ? AND category = ?', 
-                               ('%'+query+'%', category)).fetchall()
-    else:
-        products = conn.execute('SELECT * FROM products WHERE name LIKE ?', 
-                               ('%'+query+'%',)).fetchall()
-    product_imgs = conn.execute('SELECT * FROM product_images WHERE product_id IN ?', (products['id'],)).fetchall()
+    results = product_search.search_products(conn, query, category or None, cursor)
     conn.close()
-    return render_template('index.html', products=products, product_imgs=product_imgs, search_query=query)
+    return render_template('search.html', search_query=query, category=category, **results)
 
-@app.route('/product/<int:product_id>')
-def product_detail(product_id):
-    conn = get_db_connection()
-    product = conn.execute('SELECT * FROM products WHERE id = ?', (product_id,)).fetchone()
-    product_img = conn.execute('SELECT * FROM product_images WHERE product_id = ?', (product_id,)).fetchone()
-    conn.close()
+def _product_context(conn, product_id):
+    product, product_img = catalog.get_product(conn, product_id)
     if product is None:
+        return None
+    return dict(product=product, product_img=product_img)
+
+@route('/product/<int:product_id>')
+def product_detail(product_id):
+    response = page_cache.render('product.html', (product_id,), lambda conn: _product_context(conn, product_id))
+    if response is None:
         flash('Product not found', 'danger')
         return redirect(url_for('index'))
-    return render_template('product.html', product=product, product_img=product_img)
+    return response
 
-@app.route('/customize/<int:product_id>', methods=['GET', 'POST'])
+@route('/customize/<int:product_id>', methods=['GET', 'POST'])
 def customize(product_id):
     if 'user_id' not in session:
         flash('Please login to customize products', 'warning')
         return redirect(url_for('login'))
     
     conn = get_db_connection()
-    product = conn.execute('SELECT * FROM products WHERE id = ?', (product_id,)).fetchone()
-    product_img = conn.execute('SELECT * FROM product_images WHERE is_primary = 1 AND product_id = ?', (product_id,)).fetchone()
+    product, product_img = catalog.get_product(conn, product_id)
+    # Closed before the body is read, so a slow upload doesn't hold a connection
+    conn.close()
+    if product is None:
+        flash('Product not found', 'danger')
+        return redirect(url_for('index'))
+    price = pricing.unit_price(product, custom=True)
     
     if request.method == 'POST':
-        customization = request.form.get('customization')
-        price = float(product['price']) + 100  # Additional customization charge
+        customization = (request.form.get('customization') or '').strip()
+        design = request.files.get('design')
+        upload = None
+        if design and design.filename:
+            try:
+                upload = custom_designs.save_upload(design)
+            except custom_designs.InvalidDesign as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('customize', product_id=product_id))
+        if not customization and upload is None:
+            flash('Add your text or a photo to customize this product', 'warning')
+            return redirect(url_for('customize', product_id=product_id))
         
-        # Save the custom product (in a real app, you'd save the customized image)
+        # The photo is rendered into preview and print files in the background
+        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('''
-        INSERT INTO custom_products (base_product_id, user_id, customization_details, length, width, height, price)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (product_id, session['user_id'], customization, 10, 1, 1, price))
+        INSERT INTO custom_products (base_product_id, user_id, customization_details, design_data, price, render_status)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (product_id, session['user_id'], customization or 'Photo upload',
+              json.dumps({'upload': upload}) if upload else None, price, 'pending' if upload else None))
         custom_product_id = cursor.lastrowid
         
         # Add to cart
@@ -116,13 +173,17 @@ def customize(product_id):
         
         conn.commit()
         conn.close()
+        if upload:
+            custom_designs.enqueue(custom_product_id)
+        cart_service.invalidate(session['user_id'])
         flash('Custom product added to cart!', 'success')
         return redirect(url_for('cart'))
     
-    conn.close()
-    return render_template('customize.html', product=product, product_img=product_img)
+    return render_template('customize.html', product=product, product_img=product_img,
+                           base_price=pricing.unit_price(product), price=price,
+                           max_upload_mb=custom_designs.MAX_UPLOAD_BYTES // (1024 * 1024))
 
-@app.route('/add_to_cart', methods=['POST'])
+@route('/add_to_cart', methods=['POST'])
 def add_to_cart():
     if 'user_id' not in session:
         flash('Please login first', 'warning')
@@ -132,174 +193,193 @@ def add_to_cart():
     
     product_id = request.form.get('product_id')
     quantity = int(request.form.get('quantity', 1))
+    if quantity < 1:
+        return jsonify({'success': False, 'message': 'Quantity must be at least 1'})
     
     conn = get_db_connection()
-    
-    # Check if product already in cart
-    existing = conn.execute('''
-    SELECT * FROM cart 
-    WHERE user_id = ? AND product_id = ? AND custom_product_id IS NULL
-    ''', (session['user_id'], product_id)).fetchone()
-    
-    if existing:
-        new_quantity = existing['quantity'] + quantity
-        conn.execute('''
-        UPDATE cart SET quantity = ? 
-        WHERE id = ?
-        ''', (new_quantity, existing['id']))
-    else:
-        conn.execute('''
-        INSERT INTO cart (user_id, product_id, quantity)
-        VALUES (?, ?, ?)
-        ''', (session['user_id'], product_id, quantity))
-    
+    # Stock is only held at checkout; this just stops obviously unfillable carts
+    if cart_service.add_item(conn, session['user_id'], product_id, quantity) is None:
+        product = conn.execute('SELECT stock_quantity FROM products WHERE id = ?', (product_id,)).fetchone()
+        conn.close()
+        available = product['stock_quantity'] if product else 0
+        return jsonify({'success': False, 'message': f'Only {max(available or 0, 0)} left in stock'})
     conn.commit()
     conn.close()
+    cart_service.invalidate(session['user_id'])
     flash('Custom product added to cart!', 'success')
     return jsonify({'success': True, 'message': 'Product added to cart'})
 
-@app.route('/cart')
+@route('/cart')
 def cart():
     if 'user_id' not in session:
         flash('Please login to view your cart', 'warning')
         return redirect(url_for('login'))
     
     conn = get_db_connection()
-    cart_items = conn.execute('''
-    SELECT c.id, c.quantity, 
-           p.id as product_id, p.name as product_name, p.price as product_price, i.image_url as product_image,
-           cp.id as custom_product_id, cp.customization_details, cp.price as custom_price
-    FROM cart c
-    LEFT JOIN products p ON c.product_id = p.id
-    LEFT JOIN custom_products cp ON c.custom_product_id = cp.id
-    LEFT JOIN product_images i ON (c.product_id = i.product_id OR c.custom_product_id = i.product_id)
-    WHERE c.user_id = ?
-    ''', (session['user_id'],)).fetchall()
-    
-    subtotal = 0
-    for item in cart_items:
-        if item['custom_product_id']:
-            subtotal += item['custom_price'] * item['quantity']
-        else:
-            subtotal += item['product_price'] * item['quantity']
-    
-    shipping_charges = 0
-    total = subtotal
-    if subtotal < 999:
-        shipping_charges = 99
-    else:
-        shipping_charges = 0
-    total = subtotal + shipping_charges
+    cart_view = cart_service.get_cart(conn, session['user_id'])
+    conn.close()
+    return render_template('cart.html', cart_items=cart_view['items'], subtotal=cart_view['subtotal'], tax_total=cart_view['tax_total'], shipping_charges=cart_view['shipping_charges'], total=cart_view['total'])
+
+@route('/cart_count')
+def cart_count():
+    if 'user_id' not in session:
+        return jsonify({'count': 0})
     
+    conn = get_db_connection()
+    count = cart_service.cart_count(conn, session['user_id'])
     conn.close()
-    return render_template('cart.html', cart_items=cart_items, subtotal=subtotal, shipping_charges=shipping_charges, total=total)
+    return jsonify({'count': count})
 
-@app.route('/update_cart', methods=['POST'])
+@route('/update_cart', methods=['POST'])
 def update_cart():
-    cart_id = request.form.get('cart_id')
-    quantity = int(request.form.get('quantity', 1))
+    if 'user_id' not in session:
+        return jsonify({'login_required': True})
+    cart_id = request.form.get('cart_id', type=int)
+    quantity = request.form.get('quantity', 1, type=int)
+    if cart_id is None:
+        return jsonify({'success': False, 'message': 'cart_id is required'}), 400
     
-    if quantity <= 0:
-        conn = get_db_connection()
-        conn.execute('DELETE FROM cart WHERE id = ?', (cart_id,))
-        conn.commit()
-        conn.close()
+    conn = get_db_connection()
+    updated, removed = cart_service.set_quantities(conn, session['user_id'], [(cart_id, quantity)])
+    conn.close()
+    if not (updated or removed):
+        return jsonify({'success': False, 'message': 'Item not found in your cart'}), 404
+    if removed:
         return jsonify({'success': True, 'message': 'Item removed from cart'})
+    return jsonify({'success': True, 'message': 'Cart updated'})
+
+@route('/update_cart_batch', methods=['POST'])
+def update_cart_batch():
+    """Several quantity changes in one transaction; quantity 0 removes a line"""
+    if 'user_id' not in session:
+        return jsonify({'login_required': True})
+    data = request.get_json(silent=True)
+    try:
+        if data is not None:
+            changes = [(int(item['cart_id']), int(item['quantity'])) for item in data.get('items', [])]
+        else:
+            changes = list(zip(map(int, request.form.getlist('cart_id')), map(int, request.form.getlist('quantity'))))
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'success': False, 'message': 'Expected a list of cart_id and quantity pairs'}), 400
+    if not changes:
+        return jsonify({'success': True, 'updated': 0, 'removed': 0})
     
     conn = get_db_connection()
-    conn.execute('UPDATE cart SET quantity = ? WHERE id = ?', (quantity, cart_id))
-    conn.commit()
+    updated, removed = cart_service.set_quantities(conn, session['user_id'], changes)
     conn.close()
-    return jsonify({'success': True, 'message': 'Cart updated'})
+    return jsonify({'success': True, 'updated': updated, 'removed': removed})
 
-@app.route('/remove_from_cart/<int:cart_id>')
+@route('/remove_from_cart/<int:cart_id>')
 def remove_from_cart(cart_id):
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
     conn = get_db_connection()
-    conn.execute('DELETE FROM cart WHERE id = ?', (cart_id,))
-    conn.commit()
+    updated, removed = cart_service.set_quantities(conn, session['user_id'], [(cart_id, 0)])
     conn.close()
-    flash('Item removed from cart', 'success')
+    if removed:
+        flash('Item removed from cart', 'success')
     return redirect(url_for('cart'))
 
-@app.route('/checkout', methods=['GET', 'POST'])
+def out_of_stock_message(cart_items, product_ids):
+    names = {item['stock_product_id']: item['product_name'] or item['customization_details'] for item in cart_items}
+    return 'Not enough stock for: ' + ', '.join(str(names.get(pid, pid)) for pid in product_ids)
+
+@route('/checkout', methods=['GET', 'POST'])
 def checkout():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
     conn = get_db_connection()
     
-    # Get cart items
-    cart_items = conn.execute('''
-    SELECT c.id, c.quantity, 
-           p.id as product_id, p.name as product_name, p.price as product_price,
-           cp.id as custom_product_id, cp.customization_details, cp.price as custom_price
-    FROM cart c
-    LEFT JOIN products p ON c.product_id = p.id
-    LEFT JOIN custom_products cp ON c.custom_product_id = cp.id
-    WHERE c.user_id = ?
-    ''', (session['user_id'],)).fetchall()
-    
+    cart_view = cart_service.get_cart(conn, session['user_id'])
+    cart_items = cart_view['items']
     if not cart_items:
+        conn.close()
         flash('Your cart is empty', 'warning')
         return redirect(url_for('index'))
-    
-    # Calculate total
-    total = 0
-    for item in cart_items:
-        if item['custom_product_id']:
-            total += item['custom_price'] * item['quantity']
-        else:
-            total += item['product_price'] * item['quantity']
+    total = cart_view['total']
     
     # Get user details
     user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
     
     if request.method == 'POST':
-        # Create Razorpay order
-        razorpay_order = razorpay_client.order.create({
-            'amount': int(total * 100),  # amount in paise
-            'currency': 'INR',
-            'receipt': f'order_{datetime.now().strftime("%Y%m%d%H%M%S")}',
-            'payment_capture': '1'
-        })
-        
-        # Create order in database
-        cursor = conn.cursor()
-        cursor.execute('''
-        INSERT INTO orders (user_id, total_amount, razorpay_order_id, shipping_address)
-        VALUES (?, ?, ?, ?)
-        ''', (session['user_id'], total, razorpay_order['id'], request.form.get('address')))
-        order_id = cursor.lastrowid
+        shipping = order_service.shipping_details(request.form)
+        order_number = order_service.new_order_number()
+        short = inventory.shortages(conn, cart_items)
+        conn.close()
+        if short:
+            flash(out_of_stock_message(cart_items, short), 'warning')
+            return redirect(url_for('cart'))
         
-        # Add order items
-        for item in cart_items:
-            if item['custom_product_id']:
-                cursor.execute('''
-                INSERT INTO order_items (order_id, custom_product_id, quantity, price)
-                VALUES (?, ?, ?, ?)
-                ''', (order_id, item['custom_product_id'], item['quantity'], item['custom_price']))
-            else:
-                cursor.execute('''
-                INSERT INTO order_items (order_id, product_id, quantity, price)
-                VALUES (?, ?, ?, ?)
-                ''', (order_id, item['product_id'], item['quantity'], item['product_price']))
+        # An unknown quote (Shiprocket unreachable) doesn't hold up the order
+        quote = shipping_quotes.quote(shipping['pincode'], shipping_quotes.package_for(cart_items))
+        if quote is None:
+            flash('Please enter a valid 6-digit pincode.', 'warning')
+            return redirect(url_for('checkout'))
+        if quote['serviceable'] is False:
+            flash(f"Sorry, we can't deliver to pincode {shipping['pincode']} yet.", 'warning')
+            return redirect(url_for('checkout'))
         
-        # Clear cart
-        conn.execute('DELETE FROM cart WHERE user_id = ?', (session['user_id'],))
+        # Create the Razorpay order before taking the database write lock
+        try:
+            with metrics.external_call('razorpay', 'order.create'):
+                razorpay_order = payments.get_client().order.create({
+                    'amount': int(round(total * 100)),  # amount in paise
+                    'currency': 'INR',
+                    'receipt': order_number,
+                    'payment_capture': '1'
+                })
+        except Exception:
+            current_app.logger.exception('Razorpay order creation failed for %s', order_number)
+            flash('Could not start the payment. Please try again.', 'danger')
+            return redirect(url_for('checkout'))
         
-        conn.commit()
-        conn.close()
+        conn = get_db_connection()
+        try:
+            order_service.place_order(conn, session['user_id'], cart_view, shipping, order_number, razorpay_order['id'])
+        except order_service.CartChanged:
+            order_service.record_unplaced(conn, session['user_id'], order_number, razorpay_order['id'], total, 'cart_changed')
+            flash('Your cart changed while checking out. Please review it and try again.', 'warning')
+            return redirect(url_for('cart'))
+        except inventory.OutOfStock as e:
+            order_service.record_unplaced(conn, session['user_id'], order_number, razorpay_order['id'], total, 'out_of_stock')
+            flash(out_of_stock_message(cart_items, e.product_ids), 'warning')
+            return redirect(url_for('cart'))
+        except sqlite3.Error:
+            # Nothing was charged yet; the Razorpay order is kept so it can be cancelled
+            current_app.logger.exception('Order %s not saved; Razorpay order %s left unused', order_number, razorpay_order['id'])
+            order_service.record_unplaced(conn, session['user_id'], order_number, razorpay_order['id'], total, 'db_error')
+            flash('Could not place your order. Please try again.', 'danger')
+            return redirect(url_for('checkout'))
+        finally:
+            conn.close()
+        cart_service.invalidate(session['user_id'])
         
         return render_template('checkout.html', 
                              razorpay_order_id=razorpay_order['id'],
-                             razorpay_key=RAZORPAY_KEY_ID,
+                             razorpay_key=payments.RAZORPAY_KEY_ID,
                              amount=total,
                              user=user)
     
     conn.close()
-    return render_template('checkout.html', cart_items=cart_items, total=total, user=user)
+    return render_template('checkout.html', cart_items=cart_items, subtotal=cart_view['subtotal'], tax_total=cart_view['tax_total'], shipping_charges=cart_view['shipping_charges'], total=total, user=user)
+
+@route('/shipping_quote')
+def shipping_quote():
+    if 'user_id' not in session:
+        return jsonify({'login_required': True})
+    
+    conn = get_db_connection()
+    cart_view = cart_service.get_cart(conn, session['user_id'])
+    conn.close()
+    if not cart_view['items']:
+        return jsonify({'success': False, 'message': 'Your cart is empty'}), 400
+    quote = shipping_quotes.quote(request.args.get('pincode'), shipping_quotes.package_for(cart_view['items']))
+    if quote is None:
+        return jsonify({'success': False, 'message': 'Enter a valid 6-digit pincode'}), 400
+    return jsonify(dict(quote, success=True))
 
-@app.route('/payment_success', methods=['POST'])
+@route('/payment_success', methods=['POST'])
 def payment_success():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -316,103 +396,43 @@ def payment_success():
     }
     
     try:
-        razorpay_client.utility.verify_payment_signature(params)
+        with metrics.external_call('razorpay', 'verify_payment_signature'):
+            payments.get_client().utility.verify_payment_signature(params)
         
         conn = get_db_connection()
+        order = conn.execute('SELECT id FROM orders WHERE razorpay_order_id = ? AND user_id = ?',
+                             (razorpay_order_id, session['user_id'])).fetchone()
+        if order is None:
+            conn.close()
+            # A genuine payment for no order of this user; unplaced_payment_orders may hold its Razorpay order
+            current_app.logger.warning('Payment %s for unknown Razorpay order %s from user %s',
+                                       razorpay_payment_id, razorpay_order_id, session['user_id'])
+            flash('We could not find the order for this payment. Please contact support.', 'danger')
+            return redirect(url_for('account'))
         
-        # Update order status
+        # Mark the order paid, commit its stock holds and queue its shipment in one transaction;
+        # the Shiprocket call happens in the fulfilment workers
         conn.execute('''
-        UPDATE orders SET payment_status = 'paid' 
-        WHERE razorpay_order_id = ?
-        ''', (razorpay_order_id,))
-        
-        # Get order details for Shiprocket
-        order = conn.execute('''
-        SELECT o.*, u.username, u.email, u.phone 
-        FROM orders o
-        JOIN users u ON o.user_id = u.id
-        WHERE o.razorpay_order_id = ?
-        ''', (razorpay_order_id,)).fetchone()
-        
-        order_items = conn.execute('''
-        SELECT oi.*, p.name as product_name, cp.customization_details
-        FROM order_items oi
-        LEFT JOIN products p ON oi.product_id = p.id
-        LEFT JOIN custom_products cp ON oi.custom_product_id = cp.id
-        WHERE oi.order_id = ?
-        ''', (order['id'],)).fetchall()
-        
-        # Create Shiprocket shipment
-        token = get_shiprocket_token()
-        if token:
-            shipment_items = []
-            for item in order_items:
-                shipment_items.append({
-                    "name": item['product_name'] or f"Custom {item['customization_details']}",
-                    "sku": str(item['product_id'] or item['custom_product_id']),
-                    "units": item['quantity'],
-                    "selling_price": str(item['price'])
-                })
-            
-            shipment_data = {
-                "order_id": razorpay_order_id,
-                "order_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "pickup_location": "Primary",
-                "channel_id": "",
-                "comment": "",
-                "billing_customer_name": order['username'],
-                "billing_last_name": "",
-                "billing_address": order['shipping_address'],
-                "billing_address_2": "",
-                "billing_city": "Mumbai",
-                "billing_pincode": "400001",
-                "billing_state": "Maharashtra",
-                "billing_country": "India",
-                "billing_email": order['email'],
-                "billing_phone": order['phone'],
-                "shipping_is_billing": True,
-                "order_items": shipment_items,
-                "payment_method": "Prepaid",
-                "shipping_charges": 0,
-                "giftwrap_charges": 0,
-                "transaction_charges": 0,
-                "total_discount": 0,
-                "sub_total": order['total_amount'],
-                "length": 10,
-                "breadth": 15,
-                "height": 20,
-                "weight": 0.5
-            }
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {token}"
-            }
-            
-            response = requests.post(
-                "https://apiv2.shiprocket.in/v1/external/orders/create/adhoc",
-                data=json.dumps(shipment_data),
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                shipment_id = response.json().get('shipment_id')
-                conn.execute('''
-                UPDATE orders SET shiprocket_shipment_id = ?
-                WHERE id = ?
-                ''', (shipment_id, order['id']))
-                conn.commit()
-        
+        UPDATE orders SET payment_status = 'paid', paid_at = CURRENT_TIMESTAMP,
+                          razorpay_payment_id = ?, razorpay_signature = ?,
+                          status = CASE WHEN status = 'cancelled' THEN 'pending' ELSE status END
+        WHERE id = ?
+        ''', (razorpay_payment_id, razorpay_signature, order['id']))
+        inventory.commit(conn, order['id'])
+        fulfilment.enqueue(conn, order['id'], razorpay_order_id)
+        conn.commit()
         conn.close()
+        fulfilment.wake()
+        
         flash('Payment successful! Your order has been placed.', 'success')
         return redirect(url_for('account'))
     
-    except Exception as e:
-        print(f"Payment verification failed: {str(e)}")
+    except Exception:
+        current_app.logger.exception('Payment verification failed for %s', razorpay_order_id)
         flash('Payment verification failed. Please contact support.', 'danger')
         return redirect(url_for('checkout'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email_username = request.form.get('email')
@@ -420,33 +440,55 @@ def login():
         address = request.form.get('address')
         phone = request.form.get('phone')
         
+        # Checked before the user lookup and the hash, so a flood costs almost nothing
+        retry_after = passwords.throttle(request.remote_addr, email_username)
+        if retry_after:
+            flash(f'Too many login attempts. Please try again in {math.ceil(retry_after)} seconds.', 'danger')
+            return render_template('login.html'), 429, {'Retry-After': str(math.ceil(retry_after))}
+        
         conn = get_db_connection()
         user = conn.execute('SELECT * FROM users WHERE email = ? OR username = ?', (email_username,email_username)).fetchone()
         conn.close()
         
-        if user and check_password_hash(user['password'], password):
+        if user and passwords.verify(user['password'], password):
+            if passwords.needs_rehash(user['password']):
+                # Hashed under an older PASSWORD_METHOD; skip it if the password changed meanwhile
+                new_hash = passwords.hash_password(password)
+                conn = get_db_connection()
+                conn.execute('UPDATE users SET password = ? WHERE id = ? AND password = ?',
+                             (new_hash, user['id'], user['password']))
+                conn.commit()
+                conn.close()
             session['user_id'] = user['id']
             session['username'] = user['username']
+            session['is_admin'] = bool(user['is_admin'])
             flash('Login successful!', 'success')
             return redirect(url_for('index'))
         else:
+            passwords.record_failure(request.remote_addr, email_username)
             flash('Invalid email or password', 'danger')
     
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
         email = request.form.get('email')
         password = request.form.get('password')
         
+        retry_after = passwords.throttle(request.remote_addr)
+        if retry_after:
+            flash(f'Too many attempts. Please try again in {math.ceil(retry_after)} seconds.', 'danger')
+            return render_template('register.html'), 429, {'Retry-After': str(math.ceil(retry_after))}
+        password_hash = passwords.hash_password(password)
+        
         conn = get_db_connection()
         try:
             conn.execute('''
             INSERT INTO users (username, email, password)
             VALUES (?, ?, ?)
-            ''', (username, email, generate_password_hash(password)))
+            ''', (username, email, password_hash))
             conn.commit()
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('login'))
@@ -457,29 +499,93 @@ def register():
     
     return render_template('register.html')
 
-@app.route('/account')
+@route('/account')
 def account():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
     conn = get_db_connection()
     user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    orders = conn.execute('''
-    SELECT o.*, 
-           (SELECT COUNT(*) FROM order_items WHERE order_id = o.id) as item_count
-    FROM orders o
-    WHERE o.user_id = ?
-    ORDER BY o.order_date DESC
-    ''', (session['user_id'],)).fetchall()
+    counts = order_service.order_counts(conn, session['user_id'])
+    orders, next_cursor = order_service.order_history(conn, session['user_id'], after=request.args.get('after'))
     conn.close()
+    for order in orders:
+        order['created_at'] = datetime.fromisoformat(order['created_at'])
     
-    return render_template('account.html', user=user, orders=orders)
+    return render_template('account.html', user=user, recent_orders=orders, next_cursor=next_cursor,
+                           paging=bool(request.args.get('after')), order_count=counts['total'],
+                           pending_orders=counts['pending'], completed_orders=counts['completed'])
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     session.clear()
     flash('You have been logged out', 'info')
     return redirect(url_for('index'))
 
+def admin_order_view(order):
+    order = dict(order)
+    order['user'] = {'username': order.pop('username', None)}
+    order['created_at'] = datetime.fromisoformat(order['created_at'])
+    return order
+
+@route('/admin')
+def admin_dashboard():
+    if not session.get('is_admin'):
+        flash('Please login as an administrator', 'warning')
+        return redirect(url_for('login'))
+    
+    conn = get_db_connection()
+    stats = rollups.dashboard_stats(conn, datetime.utcnow().strftime('%Y-%m-%d'))
+    recent_orders = conn.execute('''
+    SELECT o.id, o.order_number, o.status, o.total, o.created_at, u.username
+    FROM orders o
+    JOIN users u ON o.user_id = u.id
+    ORDER BY o.created_at DESC, o.id DESC
+    LIMIT 10
+    ''').fetchall()
+    conn.close()
+    
+    return render_template('Admin/dashboard.html', recent_orders=[admin_order_view(o) for o in recent_orders], **stats)
+
+
+ORDER_STATUSES = ('pending', 'processing', 'completed', 'cancelled')
+PAYMENT_STATUSES = ('pending', 'paid', 'failed')
+
+@route('/admin/orders')
+def admin_orders():
+    if not session.get('is_admin'):
+        flash('Please login as an administrator', 'warning')
+        return redirect(url_for('login'))
+    
+    filters = {key: request.args.get(key) or None
+               for key in ('status', 'payment_status', 'date_from', 'date_to')}
+    page = db_manager.list_orders(after=request.args.get('after'), **filters)
+    
+    return render_template('Admin/orders.html',
+                           orders=[admin_order_view(o) for o in page['rows']],
+                           next_cursor=page['next_cursor'],
+                           query_ms=page['query_ms'],
+                           filters=filters,
+                           order_statuses=ORDER_STATUSES,
+                           payment_statuses=PAYMENT_STATUSES)
+
+@route('/admin/products')
+def admin_products():
+    if not session.get('is_admin'):
+        flash('Please login as an administrator', 'warning')
+        return redirect(url_for('login'))
+    
+    filters = {key: request.args.get(key) or None for key in ('category', 'status')}
+    page = db_manager.list_products(after=request.args.get('after'), **filters)
+    
+    return render_template('Admin/products.html',
+                           products=page['rows'],
+                           next_cursor=page['next_cursor'],
+                           query_ms=page['query_ms'],
+                           filters=filters,
+                           categories=db_manager.list_categories())
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,164 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Fingerprinted static assets.
+#
+# `python assets.py build` copies every file under Static/ to
+# Static/dist/<path>.<hash>.<ext>, writes .gz (and .br when brotli is
+# installed) next to compressible ones, and records the mapping in
+# Static/dist/manifest.json. init_app() makes url_for('static', ...) emit the
+# fingerprinted names and serves them with far-future immutable caching,
+# picking a precompressed copy when the client accepts it. Files go out
+# through send_file, which hands the open file to the server's
+# wsgi.file_wrapper (sendfile under gunicorn) instead of copying it through
+# Python.
+
+STATIC_DIR = 'Static'
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Already content-addressed by image_pipeline
+PASSTHROUGH_DIRS = ('images/derived/',)
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+CSS_URL_RE = re.compile(r'''url\((['"]?)(?!data:|https?:|//)([^'")]+)\1\)''')
+
+
+def _fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _is_compressible(path):
+    mimetype = mimetypes.guess_type(path)[0] or ''
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def _source_files(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        rel_root = os.path.relpath(root, static_dir).replace(os.sep, '/')
+        if rel_root == DIST_DIR or rel_root.startswith(DIST_DIR + '/'):
+            dirs[:] = []
+            continue
+        for name in sorted(files):
+            path = name if rel_root == '.' else f'{rel_root}/{name}'
+            if not path.startswith(PASSTHROUGH_DIRS):
+                yield path
+
+
+def _rewrite_css(data, css_path, manifest):
+    base = os.path.dirname(css_path)
+
+    def replace(match):
+        target = os.path.normpath(os.path.join(base, match.group(2))).replace(os.sep, '/')
+        if target not in manifest:
+            return match.group(0)
+        relative = os.path.relpath(manifest[target], os.path.dirname(manifest.get(css_path, css_path)))
+        return f"url({match.group(1)}{relative.replace(os.sep, '/')}{match.group(1)})"
+
+    return CSS_URL_RE.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(static_dir=STATIC_DIR):
+    """Write fingerprinted, precompressed copies and return the manifest"""
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+
+    manifest = {}
+    # Stylesheets last so their url() references can point at fingerprinted files
+    paths = sorted(_source_files(static_dir), key=lambda p: p.endswith('.css'))
+    for path in paths:
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = _rewrite_css(data, path, manifest)
+        stem, ext = os.path.splitext(path)
+        built = f'{DIST_DIR}/{stem}.{_fingerprint(data)}{ext}'
+        out_path = os.path.join(static_dir, built)
+        _write(out_path, data)
+        if _is_compressible(path):
+            _write(f'{out_path}.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write(f'{out_path}.br', brotli.compress(data, quality=11))
+        manifest[path] = built
+
+    _write(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _is_immutable(filename):
+    return filename.startswith((DIST_DIR + '/',) + PASSTHROUGH_DIRS)
+
+
+def init_app(app):
+    """Rewrite static URLs to fingerprinted names and serve them with long-lived caching"""
+    static_dir = app.static_folder
+    manifest = load_manifest(static_dir)
+    app.extensions['asset_manifest'] = manifest
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def static(filename):
+        if not _is_immutable(filename):
+            return send_from_directory(static_dir, filename, conditional=True)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[name] and os.path.isfile(os.path.join(static_dir, filename + suffix)):
+                encoding = name
+                filename += suffix
+                break
+
+        response = send_from_directory(static_dir, filename, mimetype=mimetype,
+                                       conditional=True, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    app.view_functions['static'] = static
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['build']:
+        print('usage: python assets.py build')
+        sys.exit(2)
+    built = build()
+    print(f'Fingerprinted {len(built)} asset(s) into {STATIC_DIR}/{DIST_DIR}')
@@ -0,0 +1,104 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Checkout throughput: concurrent users each fill a cart and place an order
+# through order_service.place_order against a scratch database. Every order
+# reserves stock (see inventory.py), so products are stocked with BENCH_STOCK
+# units, more than any run can sell. Carts are filled through
+# cart_service.add_item with --items distinct products, adding bench
+# products when the catalog has fewer.
+#
+#   python benchmarks/checkout_bench.py [--items 10] [--seconds 5]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cart_service  # noqa: E402
+import database  # noqa: E402
+import db_pool  # noqa: E402
+import order_service  # noqa: E402
+
+CONCURRENCY = (1, 8, 32)
+BENCH_STOCK = 10 ** 9
+SHIPPING = {'name': 'Bench', 'email': 'bench@example.com', 'phone': '9999999999',
+            'address': '1 Bench Road', 'city': 'Mumbai', 'state': 'Maharashtra', 'pincode': '400001'}
+
+
+def create_users(db_path, count):
+    conn = db_pool.get_connection(db_path)
+    start = conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0] + 1
+    conn.executemany('INSERT INTO users (username, email, password) VALUES (?, ?, ?)',
+                     [(f'bench{i}', f'bench{i}@example.com', 'x') for i in range(start, start + count)])
+    conn.commit()
+    ids = [row[0] for row in conn.execute('SELECT id FROM users WHERE id >= ?', (start,))]
+    conn.close()
+    return ids
+
+
+def checkout_loop(db_path, user_id, product_ids, items, deadline, counts, errors):
+    placed = 0
+    while time.perf_counter() < deadline:
+        conn = db_pool.get_connection(db_path)
+        try:
+            for product_id in product_ids[:items]:
+                cart_service.add_item(conn, user_id, product_id, 1)
+            conn.commit()
+            view = cart_service.get_cart(conn, user_id)
+            order_service.place_order(conn, user_id, view, SHIPPING,
+                                      order_service.new_order_number(), f'order_bench_{user_id}_{placed}')
+            placed += 1
+        except Exception as e:
+            errors.append(repr(e))
+        finally:
+            conn.close()
+    counts.append(placed)
+
+
+def run(db_path, users, product_ids, items, seconds):
+    counts, errors = [], []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=checkout_loop, args=(db_path, u, product_ids, items, deadline, counts, errors))
+               for u in users]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkout throughput at increasing concurrency')
+    parser.add_argument('--items', type=int, default=10, help='cart lines per order')
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration of each concurrency level')
+    args = parser.parse_args()
+    items, seconds = args.items, args.seconds
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        database.init_db(db_path)
+        conn = db_pool.get_connection(db_path)
+        existing = conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        conn.executemany('INSERT INTO products (name, slug, price) VALUES (?, ?, 100)',
+                         [(f'Bench product {i}', f'bench-product-{i}') for i in range(existing, items)])
+        conn.execute('UPDATE products SET stock_quantity = ?', (BENCH_STOCK,))
+        conn.commit()
+        product_ids = [row[0] for row in conn.execute('SELECT id FROM products ORDER BY id')]
+        conn.close()
+
+        print(f'{"users":>6} {"orders/s":>10} {"errors":>7}   ({items} items per order, {seconds:.0f}s each)')
+        for concurrency in CONCURRENCY:
+            users = create_users(db_path, concurrency)
+            throughput, errors = run(db_path, users, product_ids, items, seconds)
+            print(f'{concurrency:>6} {throughput:>10.1f} {len(errors):>7}')
+            if errors:
+                print(f'       first error: {errors[0]}')
+        db_pool.get_pool(db_path).close_all()
+
+
+if __name__ == '__main__':
+    main()
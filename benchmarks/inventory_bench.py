@@ -0,0 +1,136 @@
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+# Flash-sale contention: hundreds of buyers check out the same SKU at once.
+#
+#   python benchmarks/inventory_bench.py [--stock 100] [--buyers 300] [--naive]
+#
+# Every buyer has one unit in their cart and all of them call
+# order_service.place_order together (released by a barrier). The run checks
+# that exactly min(stock, buyers) orders went through, stock never went
+# negative and the held reservations match what was sold. --naive also runs
+# a read-then-update version of the stock check for comparison, which
+# oversells because concurrent buyers read the same stock level.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cart_service  # noqa: E402
+import database  # noqa: E402
+import db_pool  # noqa: E402
+import inventory  # noqa: E402
+import order_service  # noqa: E402
+
+SHIPPING = {'name': 'Bench', 'email': 'bench@example.com', 'phone': '9999999999',
+            'address': '1 Bench Road', 'city': 'Mumbai', 'state': 'Maharashtra', 'pincode': '400001'}
+
+
+def setup(db_path, stock, buyers):
+    database.init_db(db_path)
+    conn = db_pool.get_connection(db_path)
+    product_id = conn.execute('SELECT MIN(id) FROM products').fetchone()[0]
+    conn.execute('UPDATE products SET stock_quantity = ? WHERE id = ?', (stock, product_id))
+    first = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM users').fetchone()[0]
+    conn.executemany('INSERT INTO users (id, username, email, password) VALUES (?, ?, ?, ?)',
+                     [(i, f'buyer{i}', f'buyer{i}@example.com', 'x') for i in range(first, first + buyers)])
+    conn.executemany('INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, 1)',
+                     [(i, product_id) for i in range(first, first + buyers)])
+    conn.commit()
+    conn.close()
+    return product_id, list(range(first, first + buyers))
+
+
+def reserve_buyer(db_path, user_id, product_id, barrier, outcomes):
+    conn = db_pool.get_connection(db_path)
+    try:
+        view = cart_service.build_cart_view(conn, user_id)
+        view['version'] = cart_service.cart_stamp(conn, user_id)[0]
+        barrier.wait()
+        order_service.place_order(conn, user_id, view, SHIPPING, order_service.new_order_number(),
+                                  f'order_bench_{user_id}')
+        outcomes.append('sold')
+    except inventory.OutOfStock:
+        outcomes.append('rejected')
+    except sqlite3.Error as e:
+        outcomes.append(f'error: {e}')
+    finally:
+        conn.close()
+
+
+def naive_buyer(db_path, user_id, product_id, barrier, outcomes):
+    conn = db_pool.get_connection(db_path)
+    try:
+        barrier.wait()
+        stock = conn.execute('SELECT stock_quantity FROM products WHERE id = ?', (product_id,)).fetchone()[0]
+        if stock < 1:
+            outcomes.append('rejected')
+            return
+        time.sleep(0)  # the gap between check and write that a real request has
+        conn.execute('UPDATE products SET stock_quantity = ? WHERE id = ?', (stock - 1, product_id))
+        conn.commit()
+        outcomes.append('sold')
+    except sqlite3.Error as e:
+        outcomes.append(f'error: {e}')
+    finally:
+        conn.close()
+
+
+def run(label, buyer, stock, buyers):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'inventory.db')
+        product_id, users = setup(db_path, stock, buyers)
+        barrier = threading.Barrier(len(users))
+        outcomes = []
+        threads = [threading.Thread(target=buyer, args=(db_path, u, product_id, barrier, outcomes)) for u in users]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        conn = db_pool.get_connection(db_path)
+        final_stock = conn.execute('SELECT stock_quantity FROM products WHERE id = ?', (product_id,)).fetchone()[0]
+        held = conn.execute("SELECT COALESCE(SUM(quantity), 0) FROM stock_reservations WHERE status = 'held'") \
+            .fetchone()[0]
+        conn.close()
+        db_pool.get_pool(db_path).close_all()
+
+    sold = outcomes.count('sold')
+    errors = [o for o in outcomes if o.startswith('error')]
+    oversold = max(0, sold - stock)
+    # The stock column and the sales must agree: stock - sold units left
+    correct = sold == min(stock, buyers) and final_stock == stock - sold and not errors
+    if label == 'reserve':
+        correct = correct and held == sold
+    print(f'{label:<8}{buyers:>8}{stock:>7}{sold:>6}{outcomes.count("rejected"):>10}{len(errors):>8}'
+          f'{final_stock:>7}{oversold:>10}{elapsed * 1000:>10.0f}{len(users) / elapsed:>12.0f}   '
+          f'{"ok" if correct else "WRONG"}')
+    if errors:
+        print(f'        first error: {errors[0]}')
+    return correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent checkouts of one SKU')
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--buyers', type=int, nargs='+', default=[50, 300, 600])
+    parser.add_argument('--naive', action='store_true', help='also run an unguarded read-then-update')
+    args = parser.parse_args()
+
+    print(f'{"mode":<8}{"buyers":>8}{"stock":>7}{"sold":>6}{"rejected":>10}{"errors":>8}'
+          f'{"left":>7}{"oversold":>10}{"ms":>10}{"checkouts/s":>12}')
+    ok = True
+    for buyers in args.buyers:
+        ok &= run('reserve', reserve_buyer, args.stock, buyers)
+        if args.naive:
+            run('naive', naive_buyer, args.stock, buyers)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
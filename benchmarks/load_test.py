@@ -0,0 +1,372 @@
+import argparse
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Concurrent load test of the storefront routes against local Razorpay and
+# Shiprocket stubs.
+#
+#   python benchmarks/load_test.py [--db seeded.db] [--users 16] [--seconds 20]
+#       [--stub-latency-ms 50] [--in-process] [--save-baseline | --compare]
+#
+# Without --db a scratch database is seeded with benchmarks/seed.py defaults.
+# The app is served by a threaded werkzeug server (or driven through Flask's
+# test client with --in-process, which leaves HTTP out of the numbers) and
+# each virtual user logs in as a seeded customer, then loops over a weighted
+# mix of routes, including the full add-to-cart -> checkout -> payment flow.
+# Reports p50/p95/p99 latency and throughput per route. --save-baseline
+# stores the results; --compare fails when a route's p95 regressed by more
+# than --tolerance against the stored baseline.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import db_pool  # noqa: E402
+import seed  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baselines', 'load_test.json')
+RAZORPAY_SECRET = 'load-test-secret'
+
+# Relative weight of each scenario in the mix
+SCENARIOS = {
+    'index': 20,
+    'search': 20,
+    'product_detail': 25,
+    'cart': 10,
+    'add_to_cart': 10,
+    'account': 5,
+    'checkout': 10,
+}
+
+ORDER_ID_RE = re.compile(r'"order_id":\s*"([^"]+)"')
+
+
+# ==================== STUBS ====================
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Canned JSON for the Razorpay and Shiprocket endpoints the app calls"""
+
+    latency = 0.0
+    counter = itertools.count(1)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        time.sleep(self.latency)
+        n = next(self.counter)
+        if self.path.endswith('/orders'):
+            body = {'id': f'order_stub{n}', 'entity': 'order', 'status': 'created'}
+        elif self.path.endswith('/auth/login'):
+            body = {'token': 'stub-token'}
+        elif self.path.endswith('/orders/create/adhoc'):
+            body = {'order_id': n, 'shipment_id': n, 'status': 'NEW'}
+        else:
+            self.send_error(404)
+            return
+        self.send_json(body)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        next(self.counter)
+        if self.path.split('?')[0].endswith('/courier/serviceability/'):
+            self.send_json({'status': 200, 'data': {'available_courier_companies': [
+                {'courier_name': 'Stub Surface', 'rate': 69.0, 'estimated_delivery_days': '5'},
+                {'courier_name': 'Stub Air', 'rate': 112.0, 'estimated_delivery_days': '2'},
+            ]}})
+        else:
+            self.send_error(404)
+
+    def send_json(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(latency):
+    handler = type('Stub', (StubHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+# ==================== CLIENTS ====================
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None):
+        response = self.session.request(method, self.base_url + path, data=data, allow_redirects=False)
+        return response.status_code, response.text
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+
+class VirtualUser:
+    """One logged-in customer running the scenario mix and timing every request"""
+
+    def __init__(self, client, username, product_ids, rng, results):
+        self.client = client
+        self.username = username
+        self.product_ids = product_ids
+        self.rng = rng
+        self.results = results
+
+    def call(self, route, method, path, data=None):
+        start = time.perf_counter()
+        try:
+            status, body = self.client.request(method, path, data)
+        except requests.RequestException:
+            status, body = 599, ''
+        self.results.record(route, time.perf_counter() - start, status >= 400)
+        return status, body
+
+    def login(self):
+        self.call('login', 'POST', '/login', {'email': self.username, 'password': seed.SEED_PASSWORD})
+
+    def add_to_cart(self):
+        self.call('add_to_cart', 'POST', '/add_to_cart',
+                  {'product_id': self.rng.choice(self.product_ids), 'quantity': self.rng.randint(1, 2)})
+
+    def checkout(self):
+        self.add_to_cart()
+        self.call('checkout_page', 'GET', '/checkout')
+        status, body = self.call('checkout_submit', 'POST', '/checkout', {
+            'name': 'Load Test', 'email': f'{self.username}@example.com', 'phone': '9999999999',
+            'address': '1 Load Street', 'city': 'Mumbai', 'state': 'Maharashtra', 'pincode': '400001'})
+        match = ORDER_ID_RE.search(body)
+        if status != 200 or not match:
+            return
+        order_id = match.group(1)
+        payment_id = f'pay_{order_id}'
+        signature = hmac.new(RAZORPAY_SECRET.encode(), f'{order_id}|{payment_id}'.encode(),
+                             hashlib.sha256).hexdigest()
+        self.call('payment_success', 'POST', '/payment_success', {
+            'razorpay_order_id': order_id, 'razorpay_payment_id': payment_id, 'razorpay_signature': signature})
+
+    def step(self, scenario):
+        if scenario == 'index':
+            self.call('index', 'GET', '/')
+        elif scenario == 'search':
+            self.call('search', 'GET', f'/search?q={self.rng.choice(seed.WORDS)}')
+        elif scenario == 'product_detail':
+            self.call('product_detail', 'GET', f'/product/{self.rng.choice(self.product_ids)}')
+        elif scenario == 'cart':
+            self.call('cart', 'GET', '/cart')
+        elif scenario == 'add_to_cart':
+            self.add_to_cart()
+        elif scenario == 'account':
+            self.call('account', 'GET', '/account')
+        elif scenario == 'checkout':
+            self.checkout()
+
+    def run(self, deadline):
+        scenarios, weights = zip(*SCENARIOS.items())
+        while time.perf_counter() < deadline:
+            self.step(self.rng.choices(scenarios, weights)[0])
+
+
+# ==================== RESULTS ====================
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.enabled = False
+
+    def record(self, route, seconds, failed):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            self.errors[route] = self.errors.get(route, 0) + failed
+
+    def summary(self, duration):
+        routes = {}
+        for route, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            routes[route] = {
+                'requests': len(samples),
+                'errors': self.errors[route],
+                'rps': len(samples) / duration,
+                'p50_ms': percentile(samples, 50) * 1000,
+                'p95_ms': percentile(samples, 95) * 1000,
+                'p99_ms': percentile(samples, 99) * 1000,
+            }
+        return routes
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of sorted samples"""
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, round(pct / 100 * len(samples) + 0.5) - 1))
+    return samples[rank]
+
+
+def print_table(routes, baseline=None):
+    print(f'{"route":<18}{"reqs":>8}{"err":>6}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+          + (f'{"base p95":>10}{"delta":>8}' if baseline else ''))
+    for route, r in routes.items():
+        line = (f'{route:<18}{r["requests"]:>8}{r["errors"]:>6}{r["rps"]:>9.1f}'
+                f'{r["p50_ms"]:>9.1f}{r["p95_ms"]:>9.1f}{r["p99_ms"]:>9.1f}')
+        base = (baseline or {}).get(route)
+        if base:
+            line += f'{base["p95_ms"]:>10.1f}{(r["p95_ms"] / base["p95_ms"] - 1) * 100 if base["p95_ms"] else 0:>7.0f}%'
+        print(line)
+
+
+def regressions(routes, baseline, tolerance, floor_ms=2.0):
+    """Routes whose p95 grew by more than tolerance (and floor_ms) over the baseline"""
+    failed = []
+    for route, r in routes.items():
+        base = baseline.get(route)
+        if base and r['p95_ms'] > base['p95_ms'] * (1 + tolerance) and r['p95_ms'] - base['p95_ms'] > floor_ms:
+            failed.append(route)
+    return failed
+
+
+# ==================== DRIVER ====================
+
+def customers(db_path, count):
+    conn = db_pool.get_connection(db_path)
+    usernames = [row[0] for row in conn.execute(
+        "SELECT username FROM users WHERE username LIKE 'seed%' ORDER BY id LIMIT ?", (count,))]
+    product_ids = [row[0] for row in conn.execute('SELECT id FROM products ORDER BY RANDOM() LIMIT 2000')]
+    conn.close()
+    return usernames, product_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent load test of the storefront routes')
+    parser.add_argument('--db', help='seeded database (default: a scratch database seeded now)')
+    parser.add_argument('--users', type=int, default=16, help='concurrent virtual users')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--stub-latency-ms', type=float, default=50, help='simulated Razorpay/Shiprocket latency')
+    parser.add_argument('--in-process', action='store_true', help="use Flask's test client instead of HTTP")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true', help='exit 1 if a route regressed against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 growth for --compare')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    scratch = None
+    db_path = args.db
+    if db_path is None:
+        scratch = tempfile.TemporaryDirectory()
+        db_path = os.path.join(scratch.name, 'load.db')
+        seed.seed(db_path)
+
+    stub, stub_url = start_stub(args.stub_latency_ms / 1000)
+    os.environ.update({
+        'INVENTORY_DB': db_path,
+        'RAZORPAY_BASE_URL': f'{stub_url}/v1',
+        'RAZORPAY_KEY_SECRET': RAZORPAY_SECRET,
+        'SHIPROCKET_BASE_URL': stub_url,
+    })
+    # seed already imported db_pool, which read INVENTORY_DB at import time
+    db_pool.DB_PATH = db_path
+    import app as storefront  # noqa: E402  (reads the environment above at import)
+    import fulfilment  # noqa: E402
+
+    server = None
+    if args.in_process:
+        make_client = lambda: InProcessClient(storefront.app)  # noqa: E731
+    else:
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, storefront.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        make_client = lambda: HttpClient(f'http://127.0.0.1:{server.server_port}')  # noqa: E731
+
+    usernames, product_ids = customers(db_path, args.users)
+    if len(usernames) < args.users:
+        sys.exit(f'{db_path} has only {len(usernames)} seeded customers; seed more with benchmarks/seed.py')
+
+    results = Results()
+    vus = [VirtualUser(make_client(), name, product_ids, random.Random(i), results)
+           for i, name in enumerate(usernames)]
+    for vu in vus:
+        vu.login()
+
+    deadline = time.perf_counter() + args.warmup + args.seconds
+    threads = [threading.Thread(target=vu.run, args=(deadline,)) for vu in vus]
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+    results.enabled = True
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    duration = time.perf_counter() - start
+
+    fulfilment.stop_workers()
+    if server is not None:
+        server.shutdown()
+    stub.shutdown()
+
+    routes = results.summary(duration)
+    total = sum(r['requests'] for r in routes.values())
+    mode = 'in-process' if args.in_process else 'HTTP'
+    print(f'{args.users} users, {duration:.1f}s, {mode}, stub latency {args.stub_latency_ms:g} ms: '
+          f'{total} requests, {total / duration:.1f} req/s')
+
+    baseline = None
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['routes']
+    print_table(routes, baseline)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'settings': {'users': args.users, 'seconds': args.seconds, 'in_process': args.in_process,
+                             'stub_latency_ms': args.stub_latency_ms, 'db': args.db or 'seed.py defaults'},
+                'routes': routes,
+            }, f, indent=2)
+        print(f'Baseline written to {args.baseline}')
+
+    if scratch is not None:
+        scratch.cleanup()
+    if baseline is not None:
+        failed = regressions(routes, baseline, args.tolerance)
+        if failed:
+            print(f'p95 regressed by more than {args.tolerance:.0%}: {", ".join(failed)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
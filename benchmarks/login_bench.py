@@ -0,0 +1,146 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Login bursts mixed with browsing: does password hashing stall other routes?
+#
+#   python benchmarks/login_bench.py [--browsers 16] [--logins 8] [--seconds 15]
+#       [--workers 1] [--threads 8] [--hash-workers 1] [--accounts 2000]
+#
+# A gunicorn server (sync mode, see gunicorn.conf.py) is started twice on one
+# scratch database: once with HASH_WORKERS=0, hashing inline on the request
+# threads as login() used to, and once with --hash-workers pool threads.
+# --browsers users loop over the home, product and search pages while
+# --logins users log in over and over, each cycling through its own share of
+# --accounts seeded customers, and one attacker posts wrong passwords for a
+# single account as fast as it can. The tables give latency per route; the
+# attacker's 429s are turned away before any hash is made. The per-IP limit
+# is lifted because every request comes from 127.0.0.1.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import load_test  # noqa: E402
+import seed  # noqa: E402
+from serving_bench import free_port  # noqa: E402
+
+import requests  # noqa: E402
+
+
+def start_server(env, log):
+    port = free_port()
+    env = dict(env, BIND=f'127.0.0.1:{port}')
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                               cwd=ROOT, env=env, stdout=log, stderr=log)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            sys.exit(f'gunicorn exited:\n{log.read().decode()}')
+        try:
+            requests.get(base_url + '/cart_count', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    sys.exit('gunicorn did not start within 30s')
+
+
+def browse(base_url, product_ids, results, deadline, offset):
+    client = load_test.HttpClient(base_url)
+    paths = [('index', '/'), ('search', '/search?q=gift')]
+    i = offset
+    while time.perf_counter() < deadline:
+        i += 1
+        route, path = paths[i % 2] if i % 3 else ('product_detail', f'/product/{product_ids[i % len(product_ids)]}')
+        start = time.perf_counter()
+        status, _ = client.request('GET', path)
+        results.record(route, time.perf_counter() - start, status >= 400)
+
+
+def log_in(base_url, usernames, results, deadline):
+    i = 0
+    while time.perf_counter() < deadline:
+        client = load_test.HttpClient(base_url)
+        start = time.perf_counter()
+        status, _ = client.request('POST', '/login', {'email': usernames[i % len(usernames)],
+                                                      'password': seed.SEED_PASSWORD})
+        results.record('login', time.perf_counter() - start, status != 302)
+        i += 1
+
+
+def attack(base_url, username, results, deadline, rejected):
+    client = load_test.HttpClient(base_url)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        status, _ = client.request('POST', '/login', {'email': username, 'password': 'wrong-password'})
+        results.record('login_flood', time.perf_counter() - start, status not in (200, 429))
+        rejected[status == 429] += 1
+
+
+def run(label, env, usernames, product_ids, args, log):
+    process, base_url = start_server(env, log)
+    try:
+        results = load_test.Results()
+        rejected = [0, 0]
+        deadline = time.perf_counter() + args.warmup + args.seconds
+        threads = [threading.Thread(target=browse, args=(base_url, product_ids, results, deadline, i))
+                   for i in range(args.browsers)]
+        threads += [threading.Thread(target=log_in, args=(base_url, usernames[i:-1:args.logins], results, deadline))
+                    for i in range(args.logins)]
+        threads.append(threading.Thread(target=attack, args=(base_url, usernames[-1], results, deadline, rejected)))
+        for t in threads:
+            t.start()
+        time.sleep(args.warmup)
+        results.enabled = True
+        start = time.perf_counter()
+        for t in threads:
+            t.join()
+        routes = results.summary(time.perf_counter() - start)
+    finally:
+        process.terminate()
+        process.wait(10)
+    print(f'\n{label}')
+    load_test.print_table(routes)
+    print(f'attacker: {rejected[1]} of {sum(rejected)} attempts rejected with 429 before hashing')
+    return routes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login latency and its effect on other routes')
+    parser.add_argument('--browsers', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--hash-workers', type=int, default=1)
+    parser.add_argument('--accounts', type=int, default=2000, help='seeded customers the logins cycle through')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = os.path.join(scratch, 'login.db')
+        seed.seed(db_path, products=2000, users=args.accounts + 1, orders=1000, carts=0)
+        usernames, product_ids = load_test.customers(db_path, args.accounts + 1)
+        env = dict(os.environ, INVENTORY_DB=db_path, SECRET_KEY='login-bench-secret', SERVER_MODE='sync',
+                   WEB_WORKERS=str(args.workers), WEB_THREADS=str(args.threads), LOGIN_IP_BURST='1000000')
+        summaries = {}
+        for label, hash_workers in (('inline', 0), ('pool', args.hash_workers)):
+            with open(os.path.join(scratch, f'gunicorn-{label}.log'), 'w+b') as log:
+                summaries[label] = run(f'{label}: HASH_WORKERS={hash_workers}, {args.workers} worker(s) x '
+                                       f'{args.threads} threads, {args.browsers} browsers, {args.logins} logins',
+                                       dict(env, HASH_WORKERS=str(hash_workers)), usernames, product_ids, args, log)
+
+    print('\np99 ms        inline     pool')
+    for route in ('index', 'product_detail', 'search', 'login'):
+        inline, pool = (summaries[label].get(route, {}).get('p99_ms', 0) for label in ('inline', 'pool'))
+        print(f'{route:<14}{inline:>7.0f}{pool:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
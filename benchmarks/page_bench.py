@@ -0,0 +1,84 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Homepage and product page cost with and without the rendered-page cache.
+#
+#   python benchmarks/page_bench.py [--products 2000] [--requests 2000]
+#
+# Requests go through the Flask test client, so the numbers are the app's own
+# work without network or server overhead. "render" clears page_cache before
+# every request (the catalog cache stays warm, as it was before pages were
+# cached), "cached" serves repeat views and "304" sends the page's ETag back
+# in If-None-Match. SQL statements per request come from metrics.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def sql_per_request(metrics):
+    totals = {}
+    for name, labels, suffix, value in metrics.registry.samples():
+        if name == 'sql_statements_per_request' and suffix in ('_sum', '_count'):
+            totals[suffix] = totals.get(suffix, 0) + value
+    return totals.get('_sum', 0) / totals['_count'] if totals.get('_count') else 0
+
+
+def measure(client, paths, count, before=None, etags=None):
+    import metrics
+    metrics.registry.reset()
+    latencies = []
+    for i in range(count):
+        path = paths[i % len(paths)]
+        if before:
+            before()
+        headers = {'If-None-Match': etags[path]} if etags else {}
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        assert response.status_code == (304 if etags else 200), (path, response.status_code)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1], sql_per_request(metrics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare rendered and cached catalog pages')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--pages', type=int, default=50, help='distinct product pages requested')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = os.path.join(scratch, 'pages.db')
+        # db_pool reads INVENTORY_DB on import, so set it before the app's modules load
+        os.environ.update(INVENTORY_DB=db_path, SECRET_KEY='page-bench-secret')
+        os.chdir(ROOT)
+        import seed
+        seed.seed(db_path, products=args.products, users=10, orders=0, carts=0)
+        import app as storefront
+        import page_cache
+
+        client = storefront.app.test_client()
+        conn = storefront.get_db_connection()
+        product_ids = [row[0] for row in conn.execute('SELECT id FROM products ORDER BY id LIMIT ?', (args.pages,))]
+        conn.close()
+        routes = {'index': ['/'], 'product_detail': [f'/product/{i}' for i in product_ids]}
+        print(f'\n{"route":<16}{"mode":<8}{"p50 us":>9}{"p99 us":>9}{"sql/req":>9}')
+        for route, paths in routes.items():
+            for path in paths:
+                client.get(path)
+            etags = {path: client.get(path).headers['ETag'] for path in paths}
+            for mode, options in (('render', {'before': page_cache.pages.clear}), ('cached', {}),
+                                  ('304', {'etags': etags})):
+                p50, p99, sql = measure(client, paths, args.requests, **options)
+                print(f'{route:<16}{mode:<8}{p50:>9.0f}{p99:>9.0f}{sql:>9.1f}')
+        stats = page_cache.pages.stats()
+        print(f'\npage cache: {stats["entries"]} entries, {stats["bytes"] / 1024:.0f} KiB, '
+              f'hits {stats["hits"]}, misses {stats["misses"]}')
+
+
+if __name__ == '__main__':
+    main()
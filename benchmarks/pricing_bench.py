@@ -0,0 +1,83 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Pricing a very large cart: one query plus one pricing.price_cart() pass.
+#
+#   python benchmarks/pricing_bench.py [--lines 10000] [--custom 0.1] [--runs 20]
+#
+# One user gets --lines cart rows over distinct products (a --custom share of
+# them as custom products), then the run times CART_VIEW_SQL on its own,
+# price_cart() over rows already fetched, and build_cart_view() doing both, as
+# cart() and checkout() do on a cache miss. Rates are loaded before timing;
+# reloading them only happens when catalog_version moves.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cart_service  # noqa: E402
+import db_pool  # noqa: E402
+import pricing  # noqa: E402
+import seed  # noqa: E402
+
+
+def fill_cart(conn, user_id, lines, custom_share):
+    product_ids = [row[0] for row in conn.execute('SELECT id FROM products ORDER BY id LIMIT ?', (lines,))]
+    if len(product_ids) < lines:
+        sys.exit(f'only {len(product_ids)} products; seed more with --products')
+    custom_every = round(1 / custom_share) if custom_share else 0
+    conn.execute('BEGIN')
+    for i, product_id in enumerate(product_ids):
+        if custom_every and i % custom_every == 0:
+            custom_id = conn.execute('''
+            INSERT INTO custom_products (base_product_id, user_id, customization_details, price)
+            VALUES (?, ?, ?, 0)
+            ''', (product_id, user_id, f'Name: bench {i}')).lastrowid
+            conn.execute('INSERT INTO cart (user_id, custom_product_id, quantity) VALUES (?, ?, 1)',
+                         (user_id, custom_id))
+        else:
+            conn.execute('INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)',
+                         (user_id, product_id, 1 + i % 3))
+    conn.commit()
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time pricing a cart of many lines')
+    parser.add_argument('--lines', type=int, default=10000)
+    parser.add_argument('--custom', type=float, default=0.1, help='share of lines that are custom products')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = os.path.join(scratch, 'pricing.db')
+        seed.seed(db_path, products=max(args.lines, 1000), users=10, orders=0, carts=0)
+        conn = db_pool.get_connection(db_path)
+        user_id = conn.execute('SELECT MIN(id) FROM users WHERE is_admin = 0').fetchone()[0]
+        fill_cart(conn, user_id, args.lines, args.custom)
+        rates = pricing.rates.sync(conn)
+
+        query_ms, rows = timed(lambda: conn.execute(cart_service.CART_VIEW_SQL, (user_id,)).fetchall(), args.runs)
+        price_ms, view = timed(lambda: pricing.price_cart(rows, rates), args.runs)
+        build_ms, _ = timed(lambda: cart_service.build_cart_view(conn, user_id), args.runs)
+        conn.close()
+
+    print(f'\n{len(rows)} lines, {view["count"]} units, median of {args.runs} runs')
+    for label, ms in (('CART_VIEW_SQL', query_ms), ('price_cart()', price_ms), ('build_cart_view()', build_ms)):
+        print(f'  {label:<20}{ms:>9.1f} ms{ms * 1000 / len(rows):>9.2f} us/line')
+    print(f'  subtotal {view["subtotal"]:.2f}, GST {view["tax_total"]:.2f}, '
+          f'shipping {view["shipping_charges"]:.2f} for {view["weight"]:.1f} kg, total {view["total"]:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Shipping quote lookups against a slow Shiprocket stub.
+#
+#   python benchmarks/quote_bench.py [--threads 32] [--lookups 200] [--pincodes 300]
+#       [--stub-latency-ms 150]
+#
+# --threads shoppers each ask shipping_quotes.quote() for --lookups random
+# pincodes out of --pincodes, with parcels of 0.2-3 kg, repeating the same
+# lookups in three phases on one scratch database: "cold" starts with empty
+# caches, so concurrent lookups of one prefix and band share an upstream
+# call; "warm" is served from memory; "restart" clears the in-process cache,
+# as a new worker would start, and is served from the shipping_quotes table.
+# Upstream calls are counted around the Shiprocket client's serviceability(),
+# the other columns come from the cache_lookups_total metric.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def count_calls(client):
+    calls = [0]
+    lock = threading.Lock()
+    serviceability = client.serviceability
+
+    def counted(*args, **kwargs):
+        with lock:
+            calls[0] += 1
+        return serviceability(*args, **kwargs)
+
+    client.serviceability = counted
+    return calls
+
+
+def lookup_counts(metrics):
+    counts = {}
+    for name, labels, _, value in metrics.registry.samples():
+        if name == 'cache_lookups_total' and ('cache', 'shipping_quote') in labels:
+            counts[dict(labels)['result']] = value
+    return counts
+
+
+def run_phase(shipping_quotes, pincodes, args):
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def shopper(n):
+        # Same lookups in every phase
+        rng = random.Random(n)
+        barrier.wait()
+        for _ in range(args.lookups):
+            package = {'length': 20, 'breadth': 15, 'height': 10, 'weight': rng.uniform(0.2, 3)}
+            start = time.perf_counter()
+            shipping_quotes.quote(rng.choice(pincodes), package)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=shopper, args=(n,)) for n in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return wall, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shipping quote cache and coalescing under load')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--pincodes', type=int, default=300)
+    parser.add_argument('--stub-latency-ms', type=float, default=150)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # db_pool reads INVENTORY_DB on import, which load_test already does
+        os.environ['INVENTORY_DB'] = os.path.join(scratch, 'quotes.db')
+        import load_test
+        stub, stub_url = load_test.start_stub(args.stub_latency_ms / 1000)
+        os.environ['SHIPROCKET_BASE_URL'] = stub_url
+        import database
+        import metrics
+        import shipping_quotes
+        import shiprocket
+        database.init_db()
+        calls = count_calls(shiprocket.get_client())
+
+        rng = random.Random(1)
+        pincodes = [str(rng.randint(110000, 855999)) for _ in range(args.pincodes)]
+        print(f'\n{args.threads} threads x {args.lookups} lookups, {args.pincodes} pincodes, '
+              f'{args.stub_latency_ms:g} ms upstream')
+        results = ('hit', 'coalesced', 'stored')
+        print(f'{"phase":<10}{"wall s":>8}{"p50 ms":>9}{"p99 ms":>9}{"upstream":>10}'
+              + ''.join(f'{result:>11}' for result in results))
+        for phase in ('cold', 'warm', 'restart'):
+            if phase == 'restart':
+                shipping_quotes.quotes.clear()
+            before, counts = calls[0], lookup_counts(metrics)
+            wall, p50, p99 = run_phase(shipping_quotes, pincodes, args)
+            after = lookup_counts(metrics)
+            print(f'{phase:<10}{wall:>8.2f}{p50:>9.2f}{p99:>9.1f}{calls[0] - before:>10}'
+                  + ''.join(f'{after.get(result, 0) - counts.get(result, 0):>11}' for result in results))
+        stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
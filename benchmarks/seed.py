@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+# Synthetic data at production-like volumes for benchmarks and load tests.
+#
+#   python benchmarks/seed.py --db /tmp/big.db --products 100000 --users 1000000 \
+#       --orders 1700000 --items-per-order 3
+#
+# Rows are generated lazily and inserted with executemany in chunks, one
+# transaction per table, under db_manager's relaxed bulk pragmas. Ids continue
+# from whatever the database already holds, so seeding twice adds more data.
+# Every seeded user's password is SEED_PASSWORD, so --db is required and the
+# app's own database (INVENTORY_DB) is refused unless --force is given.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import db_manager  # noqa: E402
+import db_pool  # noqa: E402
+import image_pipeline  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+SEED_PASSWORD = 'bench-password'
+CHUNK_SIZE = 10000
+SEED_IMAGE = 'bandhan.jpeg'
+
+ORDER_STATUSES = ('pending', 'processing', 'completed', 'cancelled')
+CITIES = (('Mumbai', 'Maharashtra', '400001'), ('Delhi', 'Delhi', '110001'),
+          ('Bengaluru', 'Karnataka', '560001'), ('Chennai', 'Tamil Nadu', '600001'),
+          ('Kolkata', 'West Bengal', '700001'), ('Jaipur', 'Rajasthan', '302001'))
+WORDS = ('personalized', 'photo', 'frame', 'mug', 'rakhi', 'bracelet', 'cushion', 'lamp', 'engraved',
+         'wooden', 'silver', 'gold', 'birthday', 'anniversary', 'wedding', 'festive', 'hamper', 'keychain',
+         'clock', 'canvas', 'crystal', 'leather', 'wallet', 'pen', 'plant', 'chocolate', 'candle', 'diary')
+
+
+def product_price(product_id):
+    """Deterministic price, so order totals can be computed without a lookup"""
+    return float(99 + (product_id * 37) % 2400)
+
+
+def next_id(conn, table):
+    return conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+
+
+def chunked(rows, size=CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_batches(conn, label, statements, batches, total=None):
+    """executemany each batch (one row list per statement) inside one transaction"""
+    start = time.perf_counter()
+    count = 0
+    with db_manager.bulk_pragmas(conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for batch in batches:
+                for sql, rows in zip(statements, batch):
+                    conn.executemany(sql, rows)
+                count += len(batch[0])
+                print(f'\r  {label}: {count}/{total or "?"}', end='', file=sys.stderr)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    elapsed = time.perf_counter() - start
+    print(f'\r  {label}: {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} rows/sec)',
+          file=sys.stderr)
+    return count
+
+
+def insert_chunks(conn, label, sql, rows, total=None):
+    return insert_batches(conn, label, [sql], ([chunk] for chunk in chunked(rows)), total)
+
+
+def seed_categories(conn, count):
+    first = next_id(conn, 'categories')
+    rows = ((i, f'Seed Category {i}', f'seed-category-{i}', f'Synthetic category {i}')
+            for i in range(first, first + count))
+    insert_chunks(conn, 'categories', 'INSERT INTO categories (id, name, slug, description) VALUES (?, ?, ?, ?)',
+                  rows, count)
+    return [row[0] for row in conn.execute('SELECT id FROM categories')]
+
+
+def seed_products(conn, rng, count, category_ids):
+    first = next_id(conn, 'products')
+
+    def rows():
+        for i in range(first, first + count):
+            words = rng.sample(WORDS, 3)
+            name = ' '.join(words).title()
+            price = product_price(i)
+            yield (i, f'{name} {i}', f'seed-product-{i}', f'A {" ".join(words)} gift, item {i}.',
+                   f'{words[0].title()} {words[1]}', price, price * 0.9 if i % 4 == 0 else None,
+                   rng.choice(category_ids), rng.randint(0, 500), round(rng.uniform(0.1, 3), 2),
+                   f'SEED-{i}', int(i % 50 == 0), int(i % 5 == 0))
+
+    insert_chunks(conn, 'products', '''
+        INSERT INTO products (id, name, slug, description, short_description, price, sale_price,
+                              category_id, stock_quantity, weight, sku, featured, customizable)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows(), count)
+
+    # One shared original, so derivatives are generated once for every image row
+    variants = None
+    if os.path.exists(os.path.join(image_pipeline.IMAGES_DIR, SEED_IMAGE)):
+        variants = json.dumps(image_pipeline.generate_variants(SEED_IMAGE))
+    images = ((i, SEED_IMAGE, 1, variants or '{}') for i in range(first, first + count))
+    insert_chunks(conn, 'product_images',
+                  'INSERT INTO product_images (product_id, image_url, is_primary, variants) VALUES (?, ?, ?, ?)',
+                  images, count)
+    return first, first + count
+
+
+def seed_users(conn, rng, count):
+    first = next_id(conn, 'users')
+    password = generate_password_hash(SEED_PASSWORD)
+
+    def rows():
+        for i in range(first, first + count):
+            city, state, pincode = rng.choice(CITIES)
+            yield (i, f'seed{i}', f'seed{i}@example.com', password, f'9{i:09d}'[-10:],
+                   f'{i} Seed Street', city, state, pincode)
+
+    insert_chunks(conn, 'users', '''
+        INSERT INTO users (id, username, email, password, phone, address, city, state, pincode)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows(), count)
+    return first, first + count
+
+
+ORDER_SQL = '''
+    INSERT INTO orders (id, user_id, order_number, status, subtotal, shipping_total, tax_total, total,
+                        payment_method, payment_status, razorpay_order_id, shipping_first_name,
+                        shipping_address, shipping_city, shipping_state, shipping_pincode, shipping_phone,
+                        shipping_email, created_at, paid_at, item_count, first_item_name)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+ITEM_SQL = '''
+    INSERT INTO order_items (id, order_id, product_id, product_name, product_price, quantity, subtotal,
+                             tax_amount, weight)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+
+def seed_orders(conn, rng, count, items_per_order, user_range, product_range, days):
+    first = next_id(conn, 'orders')
+    item_ids = iter(range(next_id(conn, 'order_items'), sys.maxsize))
+    now = datetime.utcnow()
+    products = range(*product_range)
+
+    def order_with_items(order_id):
+        created = now - timedelta(seconds=rng.randint(0, days * 86400))
+        paid = rng.random() < 0.8
+        items = []
+        for product_id in rng.sample(products, min(rng.randint(1, 2 * items_per_order - 1), len(products))):
+            quantity = rng.randint(1, 3)
+            price = product_price(product_id)
+            items.append((next(item_ids), order_id, product_id, f'Seed product {product_id}', price, quantity,
+                          price * quantity, 0, 0.5))
+        subtotal = sum(item[6] for item in items)
+        shipping = 0 if subtotal >= 999 else 99
+        city, state, pincode = rng.choice(CITIES)
+        order = (order_id, rng.randrange(*user_range), f'SEED{order_id:012d}',
+                 rng.choice(ORDER_STATUSES) if paid else 'pending', subtotal, shipping, 0, subtotal + shipping,
+                 'razorpay', 'paid' if paid else 'pending', f'order_seed_{order_id}', 'Seed',
+                 f'{order_id} Seed Street', city, state, pincode, '9999999999', 'seed@example.com',
+                 created.strftime('%Y-%m-%d %H:%M:%S'),
+                 (created + timedelta(minutes=2)).strftime('%Y-%m-%d %H:%M:%S') if paid else None,
+                 len(items), items[0][3])
+        return order, items
+
+    def batches():
+        for order_ids in chunked(range(first, first + count)):
+            orders, items = [], []
+            for order_id in order_ids:
+                order, order_items = order_with_items(order_id)
+                orders.append(order)
+                items.extend(order_items)
+            yield orders, items
+
+    insert_batches(conn, 'orders (+ order_items)', [ORDER_SQL, ITEM_SQL], batches(), count)
+
+
+def seed_carts(conn, rng, count, user_range, product_range):
+    users = rng.sample(range(*user_range), min(count, user_range[1] - user_range[0]))
+
+    def rows():
+        for user_id in users:
+            for product_id in rng.sample(range(*product_range), min(rng.randint(1, 5),
+                                                                    product_range[1] - product_range[0])):
+                yield user_id, product_id, rng.randint(1, 3)
+
+    insert_chunks(conn, 'cart', 'INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)', rows())
+
+
+def seed(db_path, categories=20, products=10000, users=10000, orders=20000, items_per_order=3,
+         carts=1000, days=365, seed=1):
+    """Create (or extend) db_path with the given volumes; returns the row counts"""
+    rng = random.Random(seed)
+    database.init_db(db_path)
+    conn = db_pool.get_connection(db_path)
+    try:
+        category_ids = seed_categories(conn, categories)
+        product_range = seed_products(conn, rng, products, category_ids)
+        user_range = seed_users(conn, rng, users)
+        if orders and products and users:
+            seed_orders(conn, rng, orders, items_per_order, user_range, product_range, days)
+        if carts and products and users:
+            seed_carts(conn, rng, carts, user_range, product_range)
+        conn.execute('ANALYZE')
+        conn.commit()
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('categories', 'products', 'users', 'orders', 'order_items', 'cart')}
+    finally:
+        conn.close()
+        db_pool.get_pool(db_path).close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a database with synthetic catalog, users and orders')
+    parser.add_argument('--db', required=True, help='database path, normally a scratch file')
+    parser.add_argument('--force', action='store_true',
+                        help="seed the app's own database (INVENTORY_DB) even so")
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--items-per-order', type=int, default=3, help='average line items per order')
+    parser.add_argument('--carts', type=int, default=1000, help='users with something in their cart')
+    parser.add_argument('--days', type=int, default=365, help='spread orders over this many days')
+    parser.add_argument('--seed', type=int, default=1)
+    args = vars(parser.parse_args())
+
+    db_path, force = args.pop('db'), args.pop('force')
+    if os.path.realpath(db_path) == os.path.realpath(db_pool.DB_PATH) and not force:
+        parser.error(f"{db_path} is the app's database; seeded accounts share a known password. "
+                     'Use a scratch path, or --force if you really mean it.')
+    start = time.perf_counter()
+    counts = seed(db_path, **args)
+    print(f'Seeded {db_path} in {time.perf_counter() - start:.1f}s: '
+          + ', '.join(f'{count} {table}' for table, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
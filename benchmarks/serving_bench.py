@@ -0,0 +1,138 @@
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Sync (gthread) vs async (gevent) gunicorn workers under checkout load.
+#
+#   python benchmarks/serving_bench.py [--users 64] [--seconds 15] [--stub-latency-ms 300]
+#       [--workers 2] [--threads 8] [--connections 1000] [--db-threads 8]
+#
+# Both modes are launched with gunicorn.conf.py against one scratch database
+# and one set of Razorpay/Shiprocket stubs (from load_test.py) that answer
+# after --stub-latency-ms. Every virtual user loops over add-to-cart ->
+# checkout -> payment, so throughput is bounded by how many requests a worker
+# can keep waiting on Razorpay at once. Use the checkout_submit rows to size
+# WEB_THREADS (sync) or to confirm that one async worker is enough.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests  # noqa: E402
+
+import db_pool  # noqa: E402
+import load_test  # noqa: E402
+import seed  # noqa: E402
+
+SECRET_KEY = 'serving-bench-secret'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, env, args, log):
+    port = free_port()
+    env = dict(env, SERVER_MODE=mode, BIND=f'127.0.0.1:{port}', WEB_WORKERS=str(args.workers),
+               WEB_THREADS=str(args.threads), WEB_CONNECTIONS=str(args.connections), DB_THREADS=str(args.db_threads))
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                               cwd=ROOT, env=env, stdout=log, stderr=log)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            sys.exit(f'gunicorn ({mode}) exited:\n{log.read().decode()}')
+        try:
+            requests.get(base_url + '/cart_count', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    sys.exit(f'gunicorn ({mode}) did not start within 30s')
+
+
+def run_mode(mode, env, usernames, product_ids, args, log):
+    process, base_url = start_server(mode, env, args, log)
+    try:
+        results = load_test.Results()
+        vus = [load_test.VirtualUser(load_test.HttpClient(base_url), name, product_ids, random.Random(i), results)
+               for i, name in enumerate(usernames)]
+        for vu in vus:
+            vu.login()
+
+        def loop(vu, deadline):
+            while time.perf_counter() < deadline:
+                vu.checkout()
+
+        deadline = time.perf_counter() + args.warmup + args.seconds
+        threads = [threading.Thread(target=loop, args=(vu, deadline)) for vu in vus]
+        for t in threads:
+            t.start()
+        time.sleep(args.warmup)
+        results.enabled = True
+        start = time.perf_counter()
+        for t in threads:
+            t.join()
+        return results.summary(time.perf_counter() - start)
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sync and async gunicorn workers under checkout load')
+    parser.add_argument('--users', type=int, default=64, help='concurrent virtual users')
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--stub-latency-ms', type=float, default=300, help='simulated Razorpay/Shiprocket latency')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='sync: threads per worker')
+    parser.add_argument('--connections', type=int, default=1000, help='async: requests per worker')
+    parser.add_argument('--db-threads', type=int, default=8, help='async: SQLite threads per worker')
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'], choices=['sync', 'async'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = os.path.join(scratch, 'serving.db')
+        seed.seed(db_path, products=2000, users=max(args.users, 100), orders=2000, carts=0)
+        conn = db_pool.get_connection(db_path)
+        conn.execute('UPDATE products SET stock_quantity = 1000000')
+        conn.commit()
+        conn.close()
+        usernames, product_ids = load_test.customers(db_path, args.users)
+
+        stub, stub_url = load_test.start_stub(args.stub_latency_ms / 1000)
+        env = dict(os.environ, INVENTORY_DB=db_path, RAZORPAY_BASE_URL=f'{stub_url}/v1',
+                   RAZORPAY_KEY_SECRET=load_test.RAZORPAY_SECRET, SHIPROCKET_BASE_URL=stub_url,
+                   SECRET_KEY=SECRET_KEY)
+        summaries = {}
+        for mode in args.modes:
+            # gunicorn logs to a file: an unread pipe would fill up and stall the workers
+            with open(os.path.join(scratch, f'gunicorn-{mode}.log'), 'w+b') as log:
+                routes = run_mode(mode, env, usernames, product_ids, args, log)
+            summaries[mode] = routes
+            total = sum(r['requests'] for r in routes.values())
+            print(f'\n{mode}: {args.workers} workers x '
+                  f'{args.threads if mode == "sync" else args.connections} '
+                  f'{"threads" if mode == "sync" else "connections"}, {args.users} users, '
+                  f'stub latency {args.stub_latency_ms:g} ms: {total / args.seconds:.1f} req/s')
+            load_test.print_table(routes)
+        stub.shutdown()
+
+    if len(summaries) == 2:
+        sync, async_ = (summaries[m].get('checkout_submit', {}) for m in ('sync', 'async'))
+        if sync.get('rps') and async_.get('rps'):
+            print(f'\ncheckout_submit: async {async_["rps"] / sync["rps"]:.1f}x the throughput of sync, '
+                  f'p95 {sync["p95_ms"]:.0f} ms -> {async_["p95_ms"]:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
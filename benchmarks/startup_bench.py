@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Cold start: how long a fresh process takes to import the app and answer its
+# first page, and how long a multi-worker gunicorn takes to serve traffic.
+#
+#   python benchmarks/startup_bench.py [--runs 5] [--workers 4] [--requests 40]
+#
+# The import rows run each measurement in a new interpreter and also report
+# whether the payment and HTTP client libraries were loaded, which a process
+# that never takes a payment shouldn't need. The gunicorn rows start the
+# server with PRELOAD_APP off and on (see gunicorn.conf.py) and time the first
+# response and the first --requests home page hits, which land on workers
+# with cold caches unless the master warmed them before forking.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests  # noqa: E402
+
+import seed  # noqa: E402
+from serving_bench import free_port  # noqa: E402
+
+HEAVY_MODULES = ('razorpay', 'requests', 'gevent')
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import app as storefront
+imported = time.perf_counter()
+client = storefront.app.test_client()
+status = client.get('/').status_code
+first = time.perf_counter()
+client.get('/')
+second = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'first_ms': (first - imported) * 1000,
+                  'second_ms': (second - first) * 1000, 'status': status,
+                  'loaded': [m for m in %r if m in sys.modules]}))
+''' % (HEAVY_MODULES,)
+
+
+def measure_import(env, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, check=True)
+        sample = json.loads(out.stdout.decode().strip().splitlines()[-1])
+        sample['process_ms'] = (time.perf_counter() - start) * 1000
+        samples.append(sample)
+    return samples
+
+
+def measure_gunicorn(env, preload, workers, count, log):
+    port = free_port()
+    env = dict(env, BIND=f'127.0.0.1:{port}', WEB_WORKERS=str(workers), PRELOAD_APP='1' if preload else '0')
+    url = f'http://127.0.0.1:{port}/'
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                               cwd=ROOT, env=env, stdout=log, stderr=log)
+    try:
+        while True:
+            if process.poll() is not None or time.perf_counter() - start > 60:
+                log.seek(0)
+                sys.exit(f'gunicorn did not start:\n{log.read().decode()}')
+            try:
+                if requests.get(url, timeout=5).status_code == 200:
+                    break
+            except requests.RequestException:
+                time.sleep(0.02)
+        ready = time.perf_counter() - start
+        # New connection per request so they spread over the workers
+        latencies = []
+        for _ in range(count):
+            t = time.perf_counter()
+            requests.get(url, headers={'Connection': 'close'}, timeout=10)
+            latencies.append((time.perf_counter() - t) * 1000)
+        return ready * 1000, latencies
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure app import and worker start-up time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=40, help='home page hits timed after start-up')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = os.path.join(scratch, 'startup.db')
+        seed.seed(db_path, products=2000, users=100, orders=1000, carts=0)
+        env = dict(os.environ, INVENTORY_DB=db_path, SECRET_KEY='startup-bench-secret')
+
+        samples = measure_import(env, args.runs)
+        print(f'\nfresh process, median of {args.runs} runs')
+        for key, label in (('process_ms', 'interpreter + import + 2 requests'), ('import_ms', 'import app'),
+                           ('first_ms', 'first GET /'), ('second_ms', 'second GET /')):
+            print(f'  {label:<36}{statistics.median(s[key] for s in samples):>9.1f} ms')
+        print(f'  {"modules loaded":<36}{", ".join(samples[-1]["loaded"]) or "none of " + ", ".join(HEAVY_MODULES)}')
+
+        print(f'\ngunicorn, {args.workers} workers')
+        print(f'  {"preload":<10}{"ready ms":>10}{"p50 ms":>9}{"p95 ms":>9}{"max ms":>9}')
+        for preload in (False, True):
+            with open(os.path.join(scratch, 'gunicorn.log'), 'w+b') as log:
+                ready, latencies = measure_gunicorn(env, preload, args.workers, args.requests, log)
+            latencies.sort()
+            print(f'  {"on" if preload else "off":<10}{ready:>10.0f}{statistics.median(latencies):>9.1f}'
+                  f'{latencies[int(len(latencies) * 0.95) - 1]:>9.1f}{latencies[-1]:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
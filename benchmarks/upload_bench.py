@@ -0,0 +1,113 @@
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Photo uploads to /customize: request time and memory against upload size.
+#
+#   python benchmarks/upload_bench.py [--sizes 5,10,14] [--runs 5] [--pixels 3000x2000]
+#
+# Each run posts a --pixels JPEG padded out to the given size in MB (or left
+# as it is if already larger), as a phone photo with a large EXIF block would
+# be, through the Flask test client against a scratch database. The multipart body is read from a file, so the
+# traced peak is what the app itself holds while parsing and storing the
+# upload. Rendering happens afterwards on the custom_designs workers; the
+# last column is the time from the response until the custom product's
+# preview and print files are ready.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BOUNDARY = 'upload-bench-boundary'
+
+
+def write_body(path, photo, size):
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="customization"\r\n\r\n\r\n'
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="design"; filename="photo.jpg"\r\n'
+            'Content-Type: image/jpeg\r\n\r\n').encode()
+    tail = f'\r\n--{BOUNDARY}--\r\n'.encode()
+    with open(path, 'wb') as out:
+        out.write(head)
+        out.write(photo)
+        # Bytes after the end-of-image marker are ignored by decoders
+        padding = max(0, size - len(photo))
+        chunk = os.urandom(1024 * 1024)
+        while padding > 0:
+            out.write(chunk[:padding])
+            padding -= len(chunk)
+        out.write(tail)
+    return os.path.getsize(path)
+
+
+def wait_rendered(db_pool, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        conn = db_pool.get_connection()
+        pending = conn.execute('''
+        SELECT COUNT(*) FROM custom_products WHERE render_status IN ('pending', 'rendering')
+        ''').fetchone()[0]
+        conn.close()
+        if not pending:
+            return
+        time.sleep(0.01)
+    sys.exit('renders did not finish')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Upload request time and memory against upload size')
+    parser.add_argument('--sizes', default='5,10,14', help='upload sizes in MB')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--pixels', default='3000x2000')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # db_pool reads INVENTORY_DB on import; designs are written under data/ and Static/ as usual
+        os.environ['INVENTORY_DB'] = os.path.join(scratch, 'uploads.db')
+        os.chdir(ROOT)
+        from PIL import Image
+        import database
+        import db_pool
+        database.init_db()
+        import app as storefront
+        client = storefront.app.test_client()
+        client.post('/register', data={'username': 'bench', 'email': 'bench@example.com', 'password': 'bench'})
+        client.post('/login', data={'email': 'bench@example.com', 'password': 'bench'})
+        conn = db_pool.get_connection()
+        product_id = conn.execute('SELECT id FROM products ORDER BY customizable DESC, id LIMIT 1').fetchone()[0]
+        conn.close()
+
+        width, height = (int(n) for n in args.pixels.split('x'))
+        buf = io.BytesIO()
+        Image.effect_noise((width, height), 64).convert('RGB').save(buf, 'JPEG', quality=90)
+        photo = buf.getvalue()
+
+        print(f'\n{width}x{height} photo ({len(photo) / 1e6:.1f} MB before padding), median of {args.runs} runs')
+        print(f'{"upload MB":>10}{"request ms":>12}{"peak MB":>10}{"render ms":>11}')
+        for size_mb in (float(size) for size in args.sizes.split(',')):
+            body_path = os.path.join(scratch, 'body')
+            length = write_body(body_path, photo, int(size_mb * 1024 * 1024))
+            request_ms, peaks, render_ms = [], [], []
+            for run in range(args.runs):
+                with open(body_path, 'rb') as body:
+                    tracemalloc.start()
+                    start = time.perf_counter()
+                    response = client.post(f'/customize/{product_id}', input_stream=body, content_length=length,
+                                           content_type=f'multipart/form-data; boundary={BOUNDARY}')
+                    responded = time.perf_counter()
+                    peaks.append(tracemalloc.get_traced_memory()[1] / 1e6)
+                    tracemalloc.stop()
+                if response.status_code != 302 or not response.location.endswith('/cart'):
+                    sys.exit(f'upload of {size_mb:g} MB was refused')
+                wait_rendered(db_pool)
+                request_ms.append((responded - start) * 1000)
+                render_ms.append((time.perf_counter() - responded) * 1000)
+            print(f'{length / (1024 * 1024):>10.1f}{statistics.median(request_ms):>12.1f}'
+                  f'{statistics.median(peaks):>10.2f}{statistics.median(render_ms):>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
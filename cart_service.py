@@ -0,0 +1,124 @@
+import threading
+from collections import OrderedDict
+
+import pricing
+
+# Cart view model shared by cart(), checkout() and /cart_count.
+#
+# One query loads every line with the pricing columns of its product (the
+# base product for custom lines, shown with its rendered photo preview once
+# custom_designs has made one), and pricing.price_cart() turns them into
+# line totals, GST, shipping and the cart total in one pass. Views are cached
+# per user and stamped with the user's
+# cart_versions row and the catalog version, both bumped by triggers (see
+# database.MIGRATIONS), so a cached view is reused only while neither the
+# cart nor the catalog (including its rates) has changed, in any process.
+#
+# Writes are single statements scoped to the session user: add_item() is an
+# UPSERT against the partial unique index on (user_id, product_id), so a
+# double-clicked "add" can't create two rows, and updates/removals carry
+# user_id in their WHERE clause so one user can't touch another's cart rows.
+
+MAX_CACHED_CARTS = 4096
+
+CART_VIEW_SQL = '''
+SELECT c.id, c.quantity, c.product_id, c.custom_product_id,
+       COALESCE(c.product_id, cp.base_product_id) AS stock_product_id,
+       CASE WHEN c.product_id IS NOT NULL THEN p.name END AS product_name,
+       cp.customization_details,
+       p.price, p.sale_price, p.min_customization_price, p.tax_class, p.shipping_class,
+       p.weight, p.length, p.width, p.height,
+       COALESCE(cp.image_url,
+                (SELECT i.image_url FROM product_images i
+                 WHERE i.product_id = COALESCE(c.product_id, cp.base_product_id) AND i.is_primary = 1
+                 LIMIT 1)) AS product_image
+FROM cart c
+LEFT JOIN custom_products cp ON c.custom_product_id = cp.id
+LEFT JOIN products p ON p.id = COALESCE(c.product_id, cp.base_product_id)
+WHERE c.user_id = ?
+ORDER BY c.id
+'''
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def cart_stamp(conn, user_id):
+    row = conn.execute('''
+    SELECT (SELECT version FROM cart_versions WHERE user_id = ?) AS cart_version,
+           (SELECT version FROM catalog_version WHERE id = 1) AS catalog_version
+    ''', (user_id,)).fetchone()
+    return (row['cart_version'], row['catalog_version'])
+
+
+def build_cart_view(conn, user_id, catalog_version=None):
+    rows = conn.execute(CART_VIEW_SQL, (user_id,)).fetchall()
+    return pricing.price_cart(rows, pricing.rates.sync(conn, catalog_version))
+
+
+def get_cart(conn, user_id):
+    """Cart view for a user, served from cache while it is still current"""
+    stamp = cart_stamp(conn, user_id)
+    with _lock:
+        cached = _cache.get(user_id)
+        if cached is not None and cached[0] == stamp:
+            _cache.move_to_end(user_id)
+            return cached[1]
+    view = build_cart_view(conn, user_id, stamp[1])
+    view['version'] = stamp[0]
+    with _lock:
+        _cache[user_id] = (stamp, view)
+        _cache.move_to_end(user_id)
+        while len(_cache) > MAX_CACHED_CARTS:
+            _cache.popitem(last=False)
+    return view
+
+
+def invalidate(user_id):
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def cart_count(conn, user_id):
+    """Units in the cart, answered from the cart index alone"""
+    row = conn.execute('SELECT COALESCE(SUM(quantity), 0) AS count FROM cart WHERE user_id = ?', (user_id,)).fetchone()
+    return row['count']
+
+
+def add_item(conn, user_id, product_id, quantity):
+    """Add quantity of a product in one statement; returns the new line quantity
+
+    Returns None, writing nothing, if the product is unknown or its stock
+    can't cover the resulting quantity. The caller commits.
+    """
+    row = conn.execute('''
+    INSERT INTO cart (user_id, product_id, quantity)
+    SELECT ?, id, ? FROM products WHERE id = ? AND stock_quantity >= ?
+    ON CONFLICT (user_id, product_id) WHERE custom_product_id IS NULL
+    DO UPDATE SET quantity = cart.quantity + excluded.quantity
+    WHERE cart.quantity + excluded.quantity <= (SELECT stock_quantity FROM products WHERE id = excluded.product_id)
+    RETURNING quantity
+    ''', (user_id, quantity, product_id, quantity)).fetchone()
+    return row['quantity'] if row else None
+
+
+def set_quantities(conn, user_id, changes):
+    """Apply (cart_id, quantity) changes in one transaction; quantity <= 0 removes the line
+
+    Rows that don't belong to user_id are left alone. Returns the number of
+    lines (updated, removed).
+    """
+    updates = [(quantity, cart_id, user_id) for cart_id, quantity in changes if quantity > 0]
+    removals = [(cart_id, user_id) for cart_id, quantity in changes if quantity <= 0]
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        updated = conn.executemany('UPDATE cart SET quantity = ? WHERE id = ? AND user_id = ?', updates).rowcount \
+            if updates else 0
+        removed = conn.executemany('DELETE FROM cart WHERE id = ? AND user_id = ?', removals).rowcount \
+            if removals else 0
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    invalidate(user_id)
+    return updated, removed
@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Read-through cache for catalog reads (products and their images).
+#
+# Every write to products, product_images or categories bumps
+# catalog_version.version through triggers (see database.MIGRATIONS), whether
+# it comes from db_manager or anywhere else. Each read compares the cached
+# version with the stored one (a single primary-key lookup) and drops
+# everything when it moved, so admin edits show up on the next request.
+# Entries are tagged with the version read before they were loaded and only
+# stored or served while that is still the current version, so a load that
+# raced an edit can't put pre-edit data back after the cache was cleared.
+
+MAX_PRODUCTS = 1024
+TTL_SECONDS = 300
+
+FEATURED_LIMIT = 6
+CUSTOMIZABLE_LIMIT = 4
+DEFAULT_IMAGE = {'image_url': 'default.jpg', 'variants': None}
+
+
+def image_record(row):
+    """product_images row as a dict with its variant map decoded"""
+    if row is None:
+        return None
+    image = dict(row)
+    image['variants'] = json.loads(image['variants']) if image.get('variants') else None
+    return image
+
+
+def catalog_version(conn):
+    row = conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()
+    return row['version'] if row else 0
+
+
+class CatalogCache:
+    """LRU + TTL cache of products, primary images and homepage lists"""
+
+    def __init__(self, max_products=MAX_PRODUCTS, ttl=TTL_SECONDS):
+        self.max_products = max_products
+        self.ttl = ttl
+        self.version = None
+        self._products = OrderedDict()
+        self._lists = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self._lock:
+            self._products.clear()
+            self._lists.clear()
+
+    def sync(self, conn):
+        """Drop cached entries if the catalog changed since they were loaded"""
+        version = catalog_version(conn)
+        with self._lock:
+            if version != self.version:
+                self._products.clear()
+                self._lists.clear()
+                self.version = version
+        return version
+
+    def _get(self, store, key, version):
+        with self._lock:
+            entry = store.get(key)
+            if entry is not None and entry[1] != version:
+                del store[key]
+                entry = None
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            if store is self._products:
+                store.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def _put(self, store, key, version, value):
+        with self._lock:
+            # The catalog moved on while this was loading
+            if version != self.version:
+                return
+            store[key] = (time.monotonic() + self.ttl, version, value)
+            if store is self._products:
+                store.move_to_end(key)
+                while len(store) > self.max_products:
+                    store.popitem(last=False)
+
+    def get_product(self, conn, product_id):
+        """Return (product, primary_image) for a product id, either may be None"""
+        version = self.sync(conn)
+        cached = self._get(self._products, product_id, version)
+        if cached is not None:
+            return cached
+        product = conn.execute('SELECT * FROM products WHERE id = ?', (product_id,)).fetchone()
+        image = conn.execute('''
+        SELECT * FROM product_images
+        WHERE product_id = ?
+        ORDER BY is_primary DESC
+        LIMIT 1
+        ''', (product_id,)).fetchone()
+        value = (dict(product) if product else None, image_record(image))
+        self._put(self._products, product_id, version, value)
+        return value
+
+    def _product_list(self, conn, name, query):
+        version = self.sync(conn)
+        cached = self._get(self._lists, name, version)
+        if cached is not None:
+            return cached
+        products = [dict(p) for p in conn.execute(query).fetchall()]
+        product_imgs = primary_images(conn, [p['id'] for p in products])
+        value = (products, {p['id']: product_imgs.get(p['id'], DEFAULT_IMAGE) for p in products})
+        self._put(self._lists, name, version, value)
+        return value
+
+    def featured(self, conn):
+        """Return (products, {product_id: primary image}) for the homepage"""
+        return self._product_list(conn, 'featured', f'SELECT * FROM products LIMIT {FEATURED_LIMIT}')
+
+    def customizable(self, conn):
+        return self._product_list(
+            conn, 'customizable',
+            f'SELECT * FROM products WHERE customizable = 1 LIMIT {CUSTOMIZABLE_LIMIT}')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'products': len(self._products),
+                'version': self.version,
+            }
+
+
+def primary_images(conn, product_ids):
+    """Map product id -> primary image record in one query"""
+    if not product_ids:
+        return {}
+    placeholders = ','.join(['?'] * len(product_ids))
+    rows = conn.execute(f'''
+    SELECT product_id, image_url, variants FROM product_images
+    WHERE is_primary = 1 AND product_id IN ({placeholders})
+    ''', product_ids).fetchall()
+    return {row['product_id']: image_record(row) for row in rows}
+
+
+catalog = CatalogCache()
@@ -0,0 +1,161 @@
+import ast
+import os
+import re
+import sys
+import tempfile
+
+import database
+import db_pool
+
+# Query-plan regression check: every SQL literal passed to execute() in the
+# scanned modules, every module-level *_SQL constant, and every constant an
+# execute() call names (CART_VIEW_SQL, or cart_service.CART_VIEW_SQL from
+# another module) is run through EXPLAIN QUERY PLAN against a freshly
+# initialised schema. A full SCAN of one of the hot tables fails the check;
+# walking an index in ORDER BY order under a LIMIT only reads one page and is
+# allowed.
+#
+#   python check_query_plans.py [--strict] [module.py ...]
+#
+# --strict also fails on statements that no longer prepare against the schema.
+
+HOT_TABLES = {'cart', 'product_images', 'order_items', 'orders'}
+DEFAULT_MODULES = ['app.py', 'catalog_cache.py', 'product_search.py', 'fulfilment.py', 'cart_service.py', 'order_service.py',
+                   'pricing.py', 'shipping_quotes.py', 'custom_designs.py', 'db_manager.py', 'inventory.py']
+EXECUTE_METHODS = {'execute', 'executemany'}
+
+ALIAS_RE = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+TABLE_HOLE_RE = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO|TABLE)\s*$', re.IGNORECASE)
+LIMITED_RE = re.compile(r'\bORDER\s+BY\b.*\bLIMIT\b', re.IGNORECASE | re.DOTALL)
+SQL_KEYWORDS = {'where', 'on', 'left', 'inner', 'join', 'set', 'order', 'group', 'limit', 'values', 'using'}
+
+
+def _sql_text(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        # f-strings mostly interpolate placeholder lists, so each hole becomes one parameter
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            elif TABLE_HOLE_RE.search(''.join(parts)):
+                # A table chosen at run time (db_manager); there is no plan to check
+                return None
+            else:
+                parts.append('?')
+        return ''.join(parts)
+    return None
+
+
+def _parse(path):
+    with open(path) as f:
+        return ast.parse(f.read(), filename=path)
+
+
+def module_constants(tree):
+    """{name: (lineno, sql)} for the module-level string assignments of a parsed module"""
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            sql = _sql_text(node.value)
+            if sql is not None:
+                constants[node.targets[0].id] = (node.lineno, sql)
+    return constants
+
+
+def _resolve(node, constants, directory):
+    sql = _sql_text(node)
+    if sql is not None:
+        return sql
+    if isinstance(node, ast.Name) and node.id in constants:
+        return constants[node.id][1]
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+        # module.CONSTANT, for a module next to the scanned one
+        path = os.path.join(directory, f'{node.value.id}.py')
+        if os.path.exists(path):
+            entry = module_constants(_parse(path)).get(node.attr)
+            if entry is not None:
+                return entry[1]
+    return None
+
+
+def extract_statements(path):
+    tree = _parse(path)
+    constants = module_constants(tree)
+    directory = os.path.dirname(os.path.abspath(path))
+    found = [(lineno, sql) for name, (lineno, sql) in constants.items() if name.endswith('_SQL')]
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+            continue
+        if node.func.attr not in EXECUTE_METHODS or not node.args:
+            continue
+        sql = _resolve(node.args[0], constants, directory)
+        if sql:
+            found.append((node.lineno, sql))
+    # A constant is reported once, at its first line
+    statements = {}
+    for lineno, sql in sorted(found):
+        sql = ' '.join(sql.split())
+        if not sql.upper().startswith('PRAGMA'):
+            statements.setdefault(sql, lineno)
+    return sorted((lineno, sql) for sql, lineno in statements.items())
+
+
+def table_aliases(sql):
+    aliases = {}
+    for table, alias in ALIAS_RE.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def full_scans(conn, sql):
+    params = [None] * sql.count('?')
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    aliases = table_aliases(sql)
+    limited = (LIMITED_RE.search(sql) is not None
+               and not any('TEMP B-TREE FOR ORDER BY' in row['detail'] for row in plan))
+    scans = []
+    for row in plan:
+        detail = row['detail']
+        match = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+        if limited and 'USING' in detail and 'INDEX' in detail:
+            continue
+        if match and aliases.get(match.group(1), match.group(1)) in HOT_TABLES:
+            scans.append(detail)
+    return scans
+
+
+def check(modules, strict=False):
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'plan_check.db')
+        database.init_db(db_path)
+        conn = db_pool.get_connection(db_path)
+        for module in modules:
+            for lineno, sql in extract_statements(module):
+                try:
+                    scans = full_scans(conn, sql)
+                except Exception as e:
+                    print(f'{module}:{lineno}: ERROR {e}: {sql}')
+                    failures += strict
+                    continue
+                if scans:
+                    print(f'{module}:{lineno}: {"; ".join(scans)}: {sql}')
+                    failures += 1
+        conn.close()
+        db_pool.get_pool(db_path).close_all()
+    return failures
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    strict = '--strict' in args
+    modules = [a for a in args if a != '--strict'] or DEFAULT_MODULES
+    failed = check(modules, strict=strict)
+    if failed:
+        print(f'{failed} statement(s) failed the query-plan check')
+        sys.exit(1)
+    print('All hot queries use indexes')
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+
+from flask import flash, redirect, request
+from PIL import Image, ImageOps
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import db_pool
+import serving
+
+# Photo uploads for custom products (a picture for the photo frame or the mug)
+# and their rendering.
+#
+# init_app() makes upload parts stream straight into files under SPOOL_DIR
+# while the request body is parsed, whatever their size, and sets
+# MAX_CONTENT_LENGTH so larger bodies get a 413 before they are read.
+# save_upload() checks from the header alone that the file is a JPEG, PNG or
+# WebP of at most MAX_PIXELS, then copies it in chunks to UPLOAD_DIR under its
+# content hash. Memory use per upload is a chunk, not the file.
+#
+# customize() stores the custom product with render_status 'pending' and
+# queues it. RENDER_WORKERS background threads claim it, crop the photo to
+# the base product's two largest sides, write a PRINT_DPI print file under
+# PRINT_DIR and a PREVIEW_WIDTH preview under Static/images/custom, then set
+# custom_products.image_url, design_data and render_status, bumping the
+# owner's cart_versions row in the same transaction so cached cart views show
+# the preview in every process. No connection is held while rendering, and
+# under gevent the image work runs on OS threads (serving.OffloadExecutor) so
+# it doesn't block the hub. Rows a dead process left pending or half-rendered are queued again
+# when the workers start; the claim keeps two workers off the same row.
+
+logger = logging.getLogger(__name__)
+
+DESIGNS_DIR = os.path.join('data', 'designs')
+SPOOL_DIR = os.path.join(DESIGNS_DIR, 'spool')
+UPLOAD_DIR = os.path.join(DESIGNS_DIR, 'uploads')
+PRINT_DIR = os.path.join(DESIGNS_DIR, 'print')
+IMAGES_DIR = os.path.join('Static', 'images')
+PREVIEW_SUBDIR = 'custom'
+
+MAX_UPLOAD_BYTES = int(os.environ.get('DESIGN_MAX_UPLOAD_MB', 15)) * 1024 * 1024
+# Room for the form fields sent alongside the file
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + 64 * 1024
+MAX_PIXELS = 50_000_000
+ALLOWED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+CHUNK_SIZE = 64 * 1024
+
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+PREVIEW_WIDTH = 800
+PRINT_DPI = 300
+STALE_AFTER = 10 * 60
+
+_queue = queue.Queue()
+_threads = []
+_threads_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class InvalidDesign(Exception):
+    """An upload that isn't a usable photo; the message is shown to the user"""
+
+
+# ==================== UPLOADS ====================
+
+def _spool_file_stream(total_content_length, content_type, filename=None, content_length=None):
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    return tempfile.TemporaryFile('wb+', dir=SPOOL_DIR)
+
+
+def _too_large(error):
+    flash(f'Photos can be at most {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.', 'danger')
+    return redirect(request.url)
+
+
+def init_app(app):
+    """Spool uploads to disk and cap request bodies"""
+    class SpoolingRequest(app.request_class):
+        # werkzeug keeps parts of small bodies in memory, and chunked bodies count as small
+        def _get_file_stream(self, *args, **kwargs):
+            return _spool_file_stream(*args, **kwargs)
+
+    app.request_class = SpoolingRequest
+    if app.config.get('MAX_CONTENT_LENGTH') is None:
+        app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+    app.register_error_handler(RequestEntityTooLarge, _too_large)
+
+
+def save_upload(file):
+    """Check an uploaded photo and store it under UPLOAD_DIR; returns its file name"""
+    stream = file.stream
+    stream.seek(0)
+    try:
+        # Reads the header only; nothing is decoded here
+        with Image.open(stream) as image:
+            fmt, (width, height) = image.format, image.size
+    except (OSError, Image.DecompressionBombError):
+        raise InvalidDesign('Please upload a JPEG, PNG or WebP photo.')
+    if fmt not in ALLOWED_FORMATS:
+        raise InvalidDesign('Please upload a JPEG, PNG or WebP photo.')
+    if width * height > MAX_PIXELS:
+        raise InvalidDesign(f'Photos can be at most {MAX_PIXELS // 1_000_000} megapixels.')
+
+    stream.seek(0)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    out = tempfile.NamedTemporaryFile('wb', dir=UPLOAD_DIR, suffix='.tmp', delete=False)
+    try:
+        with out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise InvalidDesign(f'Photos can be at most {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.')
+                digest.update(chunk)
+                out.write(chunk)
+        name = f'{digest.hexdigest()[:32]}.{ALLOWED_FORMATS[fmt]}'
+        os.replace(out.name, os.path.join(UPLOAD_DIR, name))
+    except BaseException:
+        os.unlink(out.name)
+        raise
+    return name
+
+
+# ==================== RENDERING ====================
+
+def print_size(product):
+    """Print area in pixels at PRINT_DPI: the product's two largest sides in cm"""
+    sides = sorted((product['length'] or 0, product['width'] or 0, product['height'] or 0), reverse=True)
+    return tuple(max(1, round(cm / 2.54 * PRINT_DPI)) for cm in sides[:2])
+
+
+def _save(image, path, **options):
+    tmp_path = f'{path}.tmp'
+    image.save(tmp_path, 'JPEG', **options)
+    os.replace(tmp_path, path)
+
+
+def render_design(upload, size):
+    """Write the print file and preview for an upload; returns what design_data records"""
+    with Image.open(os.path.join(UPLOAD_DIR, upload)) as original:
+        original = ImageOps.exif_transpose(original).convert('RGB')
+        # Print in the photo's orientation
+        if (original.height > original.width) != (size[1] > size[0]):
+            size = (size[1], size[0])
+        printed = ImageOps.fit(original, size, Image.LANCZOS)
+        low_resolution = original.width * original.height < size[0] * size[1]
+
+    name = f'{upload.rsplit(".", 1)[0]}-{size[0]}x{size[1]}.jpg'
+    os.makedirs(PRINT_DIR, exist_ok=True)
+    print_path = os.path.join(PRINT_DIR, name)
+    _save(printed, print_path, quality=95, dpi=(PRINT_DPI, PRINT_DPI))
+
+    if printed.width > PREVIEW_WIDTH:
+        printed = printed.resize((PREVIEW_WIDTH, round(printed.height * PREVIEW_WIDTH / printed.width)), Image.LANCZOS)
+    os.makedirs(os.path.join(IMAGES_DIR, PREVIEW_SUBDIR), exist_ok=True)
+    preview = f'{PREVIEW_SUBDIR}/{name}'
+    _save(printed, os.path.join(IMAGES_DIR, preview), quality=82, optimize=True, progressive=True)
+    return {'preview': preview, 'print': print_path, 'print_size': list(size), 'low_resolution': low_resolution}
+
+
+def _run(fn, *args):
+    global _executor
+    if not serving.cooperative():
+        # The render workers are OS threads already, and PIL releases the GIL while it works
+        return fn(*args)
+    with _executor_lock:
+        if _executor is None:
+            _executor = serving.OffloadExecutor(RENDER_WORKERS)
+    return _executor.submit(fn, *args).result()
+
+
+def claim(conn, custom_product_id):
+    row = conn.execute('''
+    UPDATE custom_products SET render_status = 'rendering', render_claimed_at = ?
+    WHERE id = ? AND render_status = 'pending'
+    RETURNING id, user_id, base_product_id, design_data
+    ''', (time.time(), custom_product_id)).fetchone()
+    conn.commit()
+    return row
+
+
+def render_one(custom_product_id):
+    """Render a pending custom product; returns False if there was nothing to claim"""
+    conn = db_pool.get_connection()
+    try:
+        row = claim(conn, custom_product_id)
+        if row is None:
+            return False
+        product = conn.execute('SELECT length, width, height FROM products WHERE id = ?',
+                               (row['base_product_id'],)).fetchone()
+    finally:
+        # Not held while the image is rendered
+        conn.close()
+    design = json.loads(row['design_data'])
+    image_url = None
+    try:
+        design.update(_run(render_design, design['upload'], print_size(product)))
+        image_url = design['preview']
+        status = 'ready'
+    except Exception as e:
+        logger.warning('Rendering custom product %s failed: %s', custom_product_id, e)
+        design['error'] = str(e)[:200]
+        status = 'failed'
+    conn = db_pool.get_connection()
+    try:
+        conn.execute('''
+        UPDATE custom_products SET design_data = ?, image_url = ?, render_status = ?
+        WHERE id = ?
+        ''', (json.dumps(design), image_url, status, custom_product_id))
+        if image_url:
+            # Cached cart views in every process pick up the preview (see cart_service)
+            conn.execute('''
+            INSERT INTO cart_versions (user_id, version) VALUES (?, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+            ''', (row['user_id'],))
+        conn.commit()
+    finally:
+        conn.close()
+    return True
+
+
+def enqueue(custom_product_id):
+    _queue.put(custom_product_id)
+
+
+def _worker():
+    while True:
+        custom_product_id = _queue.get()
+        try:
+            render_one(custom_product_id)
+        except Exception:
+            logger.exception('Render worker error')
+
+
+def recover_pending():
+    """Queue rows still pending, and renders a dead process left unfinished"""
+    conn = db_pool.get_connection()
+    conn.execute('''
+    UPDATE custom_products SET render_status = 'pending'
+    WHERE render_status = 'rendering' AND render_claimed_at < ?
+    ''', (time.time() - STALE_AFTER,))
+    conn.commit()
+    rows = conn.execute("SELECT id FROM custom_products WHERE render_status = 'pending'").fetchall()
+    conn.close()
+    for row in rows:
+        enqueue(row['id'])
+
+
+def start_workers(count=RENDER_WORKERS):
+    with _threads_lock:
+        if _threads:
+            return
+        recover_pending()
+        for i in range(count):
+            thread = threading.Thread(target=_worker, name=f'design-render-{i}', daemon=True)
+            thread.start()
+            _threads.append(thread)
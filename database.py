@@ -1,12 +1,403 @@
-import sqlite3
 from werkzeug.security import generate_password_hash
 import os
+import sqlite3
+import time
+import db_pool
+import image_pipeline
+import rollups
+
+# Product columns shown in the storefront; stock movements alone don't
+# invalidate the catalog cache.
+CATALOG_PRODUCT_COLUMNS = (
+    'name, slug, description, short_description, price, sale_price, category_id, '
+    'weight, length, width, height, sku, featured, customizable, '
+    'min_customization_price, tax_class, shipping_class'
+)
+
+def _catalog_version_triggers(tables=('products', 'product_images', 'categories')):
+    bump = 'UPDATE catalog_version SET version = version + 1 WHERE id = 1;'
+    statements = []
+    for table in tables:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            target = event
+            if table == 'products' and event == 'UPDATE':
+                target = f'UPDATE OF {CATALOG_PRODUCT_COLUMNS}'
+            statements.append(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_catalog_version
+            AFTER {target} ON {table}
+            BEGIN {bump} END
+            ''')
+    return statements
+
+def _bump_sales_rollups(timestamp, orders, paid_orders, sales):
+    buckets = ("'total'", f"'day:' || strftime('%Y-%m-%d', {timestamp})", f"'hour:' || strftime('%Y-%m-%dT%H', {timestamp})")
+    values = ', '.join(f'({bucket}, {orders}, {paid_orders}, {sales})' for bucket in buckets)
+    return f'''
+    INSERT INTO sales_rollups (bucket, orders, paid_orders, sales) VALUES {values}
+    ON CONFLICT (bucket) DO UPDATE SET orders = orders + excluded.orders,
+        paid_orders = paid_orders + excluded.paid_orders, sales = sales + excluded.sales;
+    '''
+
+def _bump_counter(name, delta):
+    return f"UPDATE store_counters SET value = value + ({delta}) WHERE name = '{name}';"
+
+def _counter_triggers():
+    # COALESCE so a NULL is_admin or stock_quantity counts as 0 instead of nulling the counter
+    is_customer = 'NOT COALESCE({0}.is_admin, 0)'
+    in_stock = 'COALESCE({0}.stock_quantity, 0) > 0'
+    return {
+        'trg_products_insert_counters': ('AFTER INSERT ON products', '',
+            _bump_counter('products', 1) + _bump_counter('active_products', in_stock.format('new'))),
+        'trg_products_delete_counters': ('AFTER DELETE ON products', '',
+            _bump_counter('products', -1) + _bump_counter('active_products', f"-({in_stock.format('old')})")),
+        'trg_products_stock_counters': ('AFTER UPDATE OF stock_quantity ON products',
+            f"WHEN ({in_stock.format('new')}) != ({in_stock.format('old')})",
+            _bump_counter('active_products', f"({in_stock.format('new')}) - ({in_stock.format('old')})")),
+        'trg_users_insert_counters': ('AFTER INSERT ON users', '',
+            _bump_counter('customers', is_customer.format('new'))),
+        'trg_users_delete_counters': ('AFTER DELETE ON users', '',
+            _bump_counter('customers', f"-({is_customer.format('old')})")),
+        'trg_users_admin_counters': ('AFTER UPDATE OF is_admin ON users', '',
+            _bump_counter('customers', f"({is_customer.format('new')}) - ({is_customer.format('old')})")),
+    }
+
+def _create_triggers(triggers):
+    return [f'''
+        CREATE TRIGGER IF NOT EXISTS {name} {event} {condition}
+        BEGIN {body} END
+        ''' for name, (event, condition, body) in triggers.items()]
+
+def _rollup_triggers():
+    paid_at = 'COALESCE(new.paid_at, CURRENT_TIMESTAMP)'
+    old_paid_at = 'COALESCE(old.paid_at, old.created_at)'
+    triggers = {
+        'trg_orders_insert_rollup': ('AFTER INSERT ON orders', '',
+            _bump_sales_rollups('new.created_at', 1, 0, 0)),
+        'trg_orders_insert_paid_rollup': ('AFTER INSERT ON orders', "WHEN new.payment_status = 'paid'",
+            _bump_sales_rollups(paid_at, 0, 1, 'new.total')),
+        'trg_orders_paid_rollup': ('AFTER UPDATE OF payment_status ON orders',
+            "WHEN new.payment_status = 'paid' AND old.payment_status IS NOT 'paid'",
+            _bump_sales_rollups(paid_at, 0, 1, 'new.total')),
+        'trg_orders_unpaid_rollup': ('AFTER UPDATE OF payment_status ON orders',
+            "WHEN old.payment_status = 'paid' AND new.payment_status IS NOT 'paid'",
+            _bump_sales_rollups(old_paid_at, 0, -1, '-old.total')),
+        'trg_orders_delete_rollup': ('AFTER DELETE ON orders', '',
+            _bump_sales_rollups('old.created_at', -1, 0, 0)),
+        'trg_orders_delete_paid_rollup': ('AFTER DELETE ON orders', "WHEN old.payment_status = 'paid'",
+            _bump_sales_rollups(old_paid_at, 0, -1, '-old.total')),
+    }
+    return _create_triggers(triggers) + _create_triggers(_counter_triggers())
+
+# Versioned schema migrations, applied in order on top of the base tables.
+# PRAGMA user_version records how many have already run.
+MIGRATIONS = [
+    # 1: covering indexes for the storefront's hot lookups
+    [
+        'CREATE INDEX IF NOT EXISTS idx_cart_user_product ON cart (user_id, product_id, custom_product_id, quantity)',
+        'CREATE INDEX IF NOT EXISTS idx_product_images_product ON product_images (product_id, is_primary, image_url)',
+        'CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_razorpay ON orders (razorpay_order_id)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_user ON orders (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_products_customizable ON products (customizable)',
+    ],
+    # 2: catalog version stamp for catalog_cache invalidation
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        ''',
+        'INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)',
+    ] + _catalog_version_triggers(),
+    # 3: full-text search index over the catalog, kept in sync by triggers
+    [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, description, short_description, category_name,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        ''',
+        '''
+        INSERT INTO products_fts (rowid, name, description, short_description, category_name)
+        SELECT p.id, p.name, p.description, p.short_description, c.name
+        FROM products p
+        LEFT JOIN categories c ON c.id = p.category_id
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_products_insert_fts AFTER INSERT ON products
+        BEGIN
+            INSERT INTO products_fts (rowid, name, description, short_description, category_name)
+            VALUES (new.id, new.name, new.description, new.short_description,
+                    (SELECT name FROM categories WHERE id = new.category_id));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_products_update_fts
+        AFTER UPDATE OF name, description, short_description, category_id ON products
+        BEGIN
+            DELETE FROM products_fts WHERE rowid = old.id;
+            INSERT INTO products_fts (rowid, name, description, short_description, category_name)
+            VALUES (new.id, new.name, new.description, new.short_description,
+                    (SELECT name FROM categories WHERE id = new.category_id));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_products_delete_fts AFTER DELETE ON products
+        BEGIN
+            DELETE FROM products_fts WHERE rowid = old.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_categories_update_fts AFTER UPDATE OF name ON categories
+        BEGIN
+            UPDATE products_fts SET category_name = new.name
+            WHERE rowid IN (SELECT id FROM products WHERE category_id = new.id);
+        END
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_products_category ON products (category_id)',
+    ],
+    # 4: durable Shiprocket fulfilment queue (see fulfilment.py)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS shipment_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            razorpay_order_id TEXT UNIQUE NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders(id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_shipment_jobs_due ON shipment_jobs (status, next_attempt_at)',
+    ],
+    # 5: per-user cart version stamp for cart_service's view cache
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS cart_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        ''',
+    ] + [f'''
+        CREATE TRIGGER IF NOT EXISTS trg_cart_{event.lower()}_version AFTER {event} ON cart
+        BEGIN
+            INSERT INTO cart_versions (user_id, version) VALUES ({row}.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''' for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old'))],
+    # 6: resized/re-encoded derivatives per image (see image_pipeline.py)
+    [
+        'ALTER TABLE product_images ADD COLUMN variants TEXT',
+    ],
+    # 7: dashboard rollups maintained by triggers (see rollups.py), then backfilled
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS sales_rollups (
+            bucket TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL DEFAULT 0,
+            paid_orders INTEGER NOT NULL DEFAULT 0,
+            sales REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS store_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        'ALTER TABLE orders ADD COLUMN paid_at TIMESTAMP',
+        'CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at, id)',
+    ] + _rollup_triggers() + rollups.REBUILD_STATEMENTS,
+    # 8: seek indexes for the admin listings (see db_manager.list_orders/list_products)
+    [
+        'CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_payment_created ON orders (payment_status, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_products_created ON products (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_products_category_created ON products (category_id, created_at, id)',
+        # Superseded by idx_products_category_created
+        'DROP INDEX IF EXISTS idx_products_category',
+    ],
+    # 9: stock held for unpaid orders (see inventory.py)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS stock_reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'held',
+            expires_at REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_stock_reservations_order ON stock_reservations (order_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_stock_reservations_due ON stock_reservations (status, expires_at)',
+    ],
+    # 10: one cart row per plain product, the conflict target of cart_service.add_item.
+    # Duplicates left by the old SELECT-then-INSERT path are merged into the oldest row first.
+    [
+        '''
+        UPDATE cart SET quantity = (
+            SELECT SUM(d.quantity) FROM cart d
+            WHERE d.user_id = cart.user_id AND d.product_id = cart.product_id AND d.custom_product_id IS NULL
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM cart
+            WHERE custom_product_id IS NULL AND product_id IS NOT NULL
+            GROUP BY user_id, product_id HAVING COUNT(*) > 1
+        )
+        ''',
+        '''
+        DELETE FROM cart
+        WHERE custom_product_id IS NULL AND product_id IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM cart
+            WHERE custom_product_id IS NULL AND product_id IS NOT NULL
+            GROUP BY user_id, product_id
+        )
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_user_product_unique ON cart (user_id, product_id)
+        WHERE custom_product_id IS NULL
+        ''',
+    ],
+    # 11: order summaries written at checkout for the account page (see order_service.order_summary),
+    # backfilled from order_items, and its (user_id, created_at) seek index
+    [
+        'ALTER TABLE orders ADD COLUMN item_count INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE orders ADD COLUMN first_item_name TEXT',
+        'ALTER TABLE orders ADD COLUMN first_item_image TEXT',
+        '''
+        UPDATE orders SET
+            item_count = (SELECT COUNT(*) FROM order_items WHERE order_id = orders.id),
+            first_item_name = (SELECT product_name FROM order_items WHERE order_id = orders.id
+                               ORDER BY id LIMIT 1),
+            first_item_image = (
+                SELECT COALESCE(json_extract(i.variants, '$.thumb.jpeg'), i.image_url)
+                FROM order_items oi
+                LEFT JOIN custom_products cp ON cp.id = oi.custom_product_id
+                JOIN product_images i ON i.product_id = COALESCE(oi.product_id, cp.base_product_id)
+                                     AND i.is_primary = 1
+                WHERE oi.order_id = orders.id
+                ORDER BY oi.id LIMIT 1
+            )
+        ''',
+        # status makes the account overview counts index-only
+        'CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at, id, status)',
+        # Superseded by idx_orders_user_created
+        'DROP INDEX IF EXISTS idx_orders_user',
+    ],
+    # 12: GST and shipping rates per product class (see pricing.py); edits bump catalog_version
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS tax_rates (
+            tax_class TEXT PRIMARY KEY,
+            rate REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT OR IGNORE INTO tax_rates (tax_class, rate)
+        VALUES ('standard', 0.18), ('reduced', 0.12), ('jewelry', 0.03), ('exempt', 0)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS shipping_rates (
+            shipping_class TEXT PRIMARY KEY,
+            base_charge REAL NOT NULL,
+            slab_charge REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT OR IGNORE INTO shipping_rates (shipping_class, base_charge, slab_charge)
+        VALUES ('standard', 99, 40), ('fragile', 149, 60), ('jewelry', 99, 40)
+        ''',
+    ] + _catalog_version_triggers(('tax_rates', 'shipping_rates')),
+    # 13: Shiprocket quotes shared by workers (see shipping_quotes.py)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS shipping_quotes (
+            pincode_prefix TEXT NOT NULL,
+            weight_band INTEGER NOT NULL,
+            quote TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (pincode_prefix, weight_band)
+        ) WITHOUT ROWID
+        ''',
+    ],
+    # 14: photo designs rendered in the background (see custom_designs.py)
+    [
+        'ALTER TABLE custom_products ADD COLUMN render_status TEXT',
+        'ALTER TABLE custom_products ADD COLUMN render_claimed_at REAL',
+        'CREATE INDEX IF NOT EXISTS idx_custom_products_render ON custom_products (render_status, render_claimed_at)',
+    ],
+    # 15: Razorpay orders created for checkouts that never became orders, kept for reconciliation
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS unplaced_payment_orders (
+            razorpay_order_id TEXT PRIMARY KEY,
+            order_number TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            reason TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            resolved_at TIMESTAMP
+        ) WITHOUT ROWID
+        ''',
+    ],
+    # 16: counter triggers that treat a NULL is_admin or stock_quantity as 0, then recount
+    [f'DROP TRIGGER IF EXISTS {name}' for name in _counter_triggers()]
+    + _create_triggers(_counter_triggers()) + [rollups.REBUILD_COUNTERS],
+]
+
+# Workers booting together queue on the write lock while one of them migrates;
+# a long migration can hold it for longer than the busy timeout
+MIGRATION_LOCK_TIMEOUT = 120
+
+def _begin_migration(conn):
+    deadline = time.monotonic() + MIGRATION_LOCK_TIMEOUT
+    while True:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or time.monotonic() > deadline:
+                raise
+
+def migrate(conn):
+    """Apply any migrations newer than the database's user_version
+
+    Safe to run from several processes at once: each migration runs under
+    the write lock after re-reading user_version, so it is applied once.
+    """
+    while conn.execute('PRAGMA user_version').fetchone()[0] < len(MIGRATIONS):
+        _begin_migration(conn)
+        # SQLite DDL is transactional: a failed step leaves neither the schema nor user_version changed
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version < len(MIGRATIONS):
+                for statement in MIGRATIONS[version]:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return len(MIGRATIONS)
+
+def init_db(db_path=None):
+    db_path = db_path or db_pool.DB_PATH
 
-def init_db():
     # Create database directory if it doesn't exist
-    os.makedirs('data', exist_ok=True)
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
     
-    conn = sqlite3.connect('data/inventory.db')
+    conn = db_pool.get_connection(db_path)
     cursor = conn.cursor()
 
     # Enable foreign key constraints
@@ -215,6 +606,8 @@ def init_db():
         ''', (product_id, "bandhan.jpeg", 1))
 
     conn.commit()
+    migrate(conn)
+    image_pipeline.process_pending(conn)
     conn.close()
 
 if __name__ == '__main__':
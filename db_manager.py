@@ -1,12 +1,39 @@
+import argparse
+import csv
+import json
+import re
 import sqlite3
-from tabulate import tabulate
-from werkzeug.security import generate_password_hash
+import sys
+import time
+from contextlib import contextmanager
+from itertools import islice
+import db_pool
+import image_pipeline
+from catalog_cache import primary_images, DEFAULT_IMAGE
+import passwords
+
+# Only the interactive manager prints tables; the admin listings don't need it
+try:
+    from tabulate import tabulate
+except ImportError:
+    tabulate = None
+
+ADMIN_PAGE_SIZE = 50
+IMPORT_CHUNK_SIZE = 5000
+EXPORT_BATCH_SIZE = 5000
+
+# Bulk loads trade crash durability for speed; the pool's PRAGMAS are put back after
+BULK_PRAGMAS = (
+    ('synchronous', 'OFF'),
+    ('cache_size', -64000),         # ~64 MB page cache while loading
+)
+
+TRUE_STRINGS = ('true', 'yes', '1', 'y')
+PASSWORD_HASH_RE = re.compile(r'^(pbkdf2|scrypt)[:\w]*\$')
 
 # Database connection
 def get_db():
-    conn = sqlite3.connect('data/inventory.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.get_connection()
 
 # ==================== CRUD OPERATIONS ====================
 
@@ -20,20 +47,46 @@ def get_all_tables():
     conn.close()
     return [table['name'] for table in tables]
 
+# table name -> (PRAGMA schema_version it was read at, schema)
+_schemas = {}
+
+def get_table_schema(table_name):
+    """Column name -> PRAGMA table_info row, read again after any schema change"""
+    conn = get_db()
+    # schema_version moves on every CREATE, ALTER or DROP, from migrate() or any other process
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    cached = _schemas.get(table_name)
+    if cached is not None and cached[0] == version:
+        conn.close()
+        return cached[1]
+    columns = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+    conn.close()
+    if not columns:
+        raise ValueError(f"Unknown table: {table_name}")
+    schema = {column['name']: dict(column) for column in columns}
+    _schemas[table_name] = (version, schema)
+    return schema
+
 def get_table_columns(table_name):
     """Get column names for a table"""
+    return list(get_table_schema(table_name))
+
+def iter_records(table_name, batch_size=500):
+    """Stream the records of a table in batches"""
     conn = get_db()
-    cursor = conn.execute(f"SELECT * FROM {table_name} LIMIT 1")
-    columns = [description[0] for description in cursor.description]
-    conn.close()
-    return columns
+    try:
+        cursor = conn.execute(f"SELECT * FROM {table_name}")
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        conn.close()
 
 def get_all_records(table_name):
     """Read all records from a table"""
-    conn = get_db()
-    records = conn.execute(f"SELECT * FROM {table_name}").fetchall()
-    conn.close()
-    return records
+    return [record for batch in iter_records(table_name) for record in batch]
 
 def create_record(table_name, data):
     """Create a new record in the specified table"""
@@ -44,12 +97,16 @@ def create_record(table_name, data):
     
     # Handle password hashing for users table
     if table_name == 'users' and 'password' in data:
-        data['password'] = generate_password_hash(data['password'])
+        data['password'] = passwords.hash_password(data['password'])
     
     query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
     cursor.execute(query, tuple(data.values()))
     conn.commit()
     record_id = cursor.lastrowid
+    
+    # Generate resized/WebP derivatives for newly registered images
+    if table_name == 'product_images':
+        image_pipeline.process_image(conn, record_id)
     conn.close()
     return record_id
 
@@ -60,7 +117,7 @@ def update_record(table_name, record_id, data):
     
     # Handle password hashing for users table
     if table_name == 'users' and 'password' in data:
-        data['password'] = generate_password_hash(data['password'])
+        data['password'] = passwords.hash_password(data['password'])
     
     set_clause = ', '.join([f"{key} = ?" for key in data])
     query = f"UPDATE {table_name} SET {set_clause} WHERE id = ?"
@@ -69,6 +126,9 @@ def update_record(table_name, record_id, data):
     cursor.execute(query, tuple(values))
     conn.commit()
     rows_affected = cursor.rowcount
+    
+    if table_name == 'product_images' and data.get('image_url'):
+        image_pipeline.process_image(conn, record_id)
     conn.close()
     return rows_affected
 
@@ -82,22 +142,275 @@ def delete_record(table_name, record_id):
     conn.close()
     return rows_affected
 
+# ==================== BULK IMPORT / EXPORT ====================
+#
+# Everything streams: rows are read one at a time from the file, coerced
+# against the cached schema and written in executemany chunks, so memory
+# stays flat however large the file is. An import is one transaction; any
+# bad row rolls the whole file back. Every row is checked against the table
+# schema: a key that isn't a column is an error on any row, and a missing key
+# or blank cell takes the column's default, or NULL if it has none.
+
+def coerce_value(value, column):
+    """Convert a CSV/JSON value to the column's declared type"""
+    if value is None or value == '':
+        if column['notnull'] and column['dflt_value'] is None and not column['pk']:
+            raise ValueError(f"{column['name']} is required")
+        return None
+    declared = (column['type'] or '').upper()
+    if 'BOOL' in declared:
+        if isinstance(value, str):
+            return int(value.strip().lower() in TRUE_STRINGS)
+        return int(bool(value))
+    if 'INT' in declared:
+        return int(value)
+    if any(name in declared for name in ('REAL', 'FLOA', 'DOUB')):
+        return float(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+@contextmanager
+def open_stream(path, mode):
+    """Open a file, or stdin/stdout for '-'"""
+    if path == '-':
+        yield sys.stdin if mode == 'r' else sys.stdout
+        return
+    with open(path, mode, newline='', encoding='utf-8') as f:
+        yield f
+
+def read_rows(path, fmt=None):
+    """Yield one dict per CSV row or JSONL line"""
+    fmt = detect_format(path, fmt)
+    with open_stream(path, 'r') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"line {number}: invalid JSON ({e.msg} at column {e.colno})") from None
+                if not isinstance(row, dict):
+                    raise ValueError(f"line {number}: expected a JSON object, got {type(row).__name__}")
+                yield row
+
+def column_defaults(conn, schema):
+    """Column name -> value of its DEFAULT expression, evaluated once"""
+    return {name: conn.execute(f"SELECT {column['dflt_value']}").fetchone()[0]
+            for name, column in schema.items() if column['dflt_value'] is not None}
+
+def _coerced_rows(table_name, rows, columns, defaults):
+    schema = get_table_schema(table_name)
+    hash_passwords = table_name == 'users'
+    for line, row in enumerate(rows, 1):
+        # csv.DictReader files cells beyond the header under None
+        unknown = ['(unnamed)' if name is None else name for name in row if name not in schema]
+        if unknown:
+            raise ValueError(f"row {line}: unexpected column(s) {', '.join(sorted(unknown))}")
+        try:
+            values = [defaults[name] if row.get(name) in (None, '') and name in defaults
+                      else coerce_value(row.get(name), schema[name]) for name in columns]
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"row {line}: {e}") from None
+        if hash_passwords:
+            index = columns.index('password')
+            if values[index] and not PASSWORD_HASH_RE.match(values[index]):
+                values[index] = passwords.hash_password(values[index])
+        yield tuple(values)
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _throughput(count, start):
+    seconds = time.perf_counter() - start
+    return {'rows': count, 'seconds': seconds, 'rows_per_sec': count / seconds if seconds else 0.0}
+
+@contextmanager
+def bulk_pragmas(conn):
+    """Relax durability for a bulk load, then restore the pool's settings"""
+    defaults = dict(db_pool.PRAGMAS)
+    for name, value in BULK_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    try:
+        yield conn
+    finally:
+        for name, _ in BULK_PRAGMAS:
+            conn.execute(f"PRAGMA {name} = {defaults[name]}")
+
+def import_rows(table_name, rows, chunk_size=IMPORT_CHUNK_SIZE, replace=False, progress=None):
+    """Insert a stream of dicts in one transaction; returns row count and timing"""
+    schema = get_table_schema(table_name)
+    columns = list(schema)
+    verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+    query = f"{verb} INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+
+    start = time.perf_counter()
+    count = 0
+    conn = get_db()
+    try:
+        with bulk_pragmas(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                values = _coerced_rows(table_name, rows, columns, column_defaults(conn, schema))
+                for chunk in _chunks(values, chunk_size):
+                    conn.executemany(query, chunk)
+                    count += len(chunk)
+                    if progress:
+                        progress(count, time.perf_counter() - start)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        # New images need their resized derivatives
+        if table_name == 'product_images':
+            image_pipeline.process_pending(conn)
+    finally:
+        conn.close()
+    return _throughput(count, start)
+
+def export_rows(table_name, path, fmt=None, batch_size=EXPORT_BATCH_SIZE):
+    """Stream a table out as CSV or JSONL; returns row count and timing"""
+    get_table_schema(table_name)
+    fmt = detect_format(path, fmt)
+    start = time.perf_counter()
+    count = 0
+    with open_stream(path, 'w') as f:
+        writer = None
+        for batch in iter_records(table_name, batch_size):
+            if fmt == 'csv':
+                if writer is None:
+                    writer = csv.writer(f)
+                    writer.writerow(batch[0].keys())
+                writer.writerows(batch)
+            else:
+                f.writelines(json.dumps(dict(record)) + '\n' for record in batch)
+            count += len(batch)
+    return _throughput(count, start)
+
+# ==================== ADMIN LISTINGS ====================
+#
+# Newest-first listings paged by a (created_at, id) seek cursor rather than
+# OFFSET, so page 1000 costs the same as page 1. Each filter has a matching
+# (filter, created_at, id) index from database.MIGRATIONS.
+
+def encode_cursor(row):
+    return f"{row['created_at']}|{row['id']}"
+
+def decode_cursor(cursor):
+    try:
+        created_at, record_id = cursor.rsplit('|', 1)
+        return created_at, int(record_id)
+    except (AttributeError, ValueError):
+        return None
+
+def _seek_page(conn, sql, where, params, order_prefix, after, limit):
+    """Run one keyset page; returns rows, the next cursor and the query time"""
+    after = decode_cursor(after)
+    if after:
+        where.append(f'({order_prefix}.created_at, {order_prefix}.id) < (?, ?)')
+        params += list(after)
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += f' ORDER BY {order_prefix}.created_at DESC, {order_prefix}.id DESC LIMIT ?'
+    params.append(limit + 1)
+
+    start = time.perf_counter()
+    rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+    query_ms = (time.perf_counter() - start) * 1000
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor, query_ms
+
+def list_orders(status=None, payment_status=None, date_from=None, date_to=None,
+                after=None, limit=ADMIN_PAGE_SIZE):
+    """One page of orders, newest first, filtered server-side"""
+    where, params = [], []
+    if status:
+        where.append('o.status = ?')
+        params.append(status)
+    if payment_status:
+        where.append('o.payment_status = ?')
+        params.append(payment_status)
+    if date_from:
+        where.append('o.created_at >= ?')
+        params.append(date_from)
+    if date_to:
+        where.append("o.created_at < date(?, '+1 day')")
+        params.append(date_to)
+
+    sql = '''
+    SELECT o.id, o.order_number, o.status, o.payment_status, o.total, o.created_at, u.username
+    FROM orders o
+    JOIN users u ON u.id = o.user_id
+    '''
+    conn = get_db()
+    rows, next_cursor, query_ms = _seek_page(conn, sql, where, params, 'o', after, limit)
+    conn.close()
+    return {'rows': rows, 'next_cursor': next_cursor, 'query_ms': query_ms}
+
+def list_products(category=None, status=None, after=None, limit=ADMIN_PAGE_SIZE):
+    """One page of products, newest first, with category and primary image"""
+    where, params = [], []
+    if category:
+        where.append('p.category_id = (SELECT id FROM categories WHERE slug = ?)')
+        params.append(category)
+    if status == 'active':
+        where.append('p.stock_quantity > 0')
+    elif status == 'inactive':
+        where.append('p.stock_quantity <= 0')
+
+    sql = '''
+    SELECT p.id, p.name, p.sku, p.price, p.sale_price, p.stock_quantity, p.created_at,
+           c.name AS category_name
+    FROM products p
+    LEFT JOIN categories c ON c.id = p.category_id
+    '''
+    conn = get_db()
+    rows, next_cursor, query_ms = _seek_page(conn, sql, where, params, 'p', after, limit)
+    images = primary_images(conn, [row['id'] for row in rows])
+    conn.close()
+    for row in rows:
+        row['image'] = images.get(row['id'], DEFAULT_IMAGE)
+    return {'rows': rows, 'next_cursor': next_cursor, 'query_ms': query_ms}
+
+def list_categories():
+    """Category names and slugs for the admin filters"""
+    conn = get_db()
+    categories = conn.execute('SELECT name, slug FROM categories ORDER BY name').fetchall()
+    conn.close()
+    return categories
+
 # ==================== USER INTERFACE ====================
 
 def display_table(table_name):
     """Display all records from a table"""
-    columns = get_table_columns(table_name)
-    records = get_all_records(table_name)
+    print(f"\n=== {table_name.upper()} ===")
+    shown = 0
+    for batch in iter_records(table_name, ADMIN_PAGE_SIZE):
+        if shown and input("Press Enter for more, q to stop: ").lower() == 'q':
+            break
+        # Convert Row objects to dictionaries
+        print(tabulate([dict(record) for record in batch], headers="keys", tablefmt="grid"))
+        shown += len(batch)
     
-    if not records:
+    if not shown:
         print(f"\nNo records found in {table_name}")
-        return
-    
-    # Convert Row objects to dictionaries
-    records = [dict(record) for record in records]
-    
-    print(f"\n=== {table_name.upper()} ===")
-    print(tabulate(records, headers="keys", tablefmt="grid"))
 
 def get_user_input(columns):
     """Get user input for creating/updating records"""
@@ -190,7 +503,55 @@ def table_menu(table_name):
         except ValueError:
             print("Please enter a valid number.")
 
+# ==================== COMMAND LINE ====================
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="IGL Clone database manager. Run without arguments for the interactive menu.")
+    commands = parser.add_subparsers(dest='command')
+
+    importer = commands.add_parser('import', help="Load CSV/JSONL rows into a table")
+    importer.add_argument('table')
+    importer.add_argument('path', help="input file, or - for stdin")
+    importer.add_argument('--format', choices=('csv', 'jsonl'), help="default: from the file extension")
+    importer.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    importer.add_argument('--replace', action='store_true', help="INSERT OR REPLACE rows with existing keys")
+
+    exporter = commands.add_parser('export', help="Write a table out as CSV/JSONL")
+    exporter.add_argument('table')
+    exporter.add_argument('path', help="output file, or - for stdout")
+    exporter.add_argument('--format', choices=('csv', 'jsonl'), help="default: from the file extension")
+    exporter.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE)
+    return parser
+
+def report(verb, table_name, stats):
+    print(f"{verb} {stats['rows']} row(s) {'into' if verb == 'Imported' else 'from'} {table_name} "
+          f"in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec)", file=sys.stderr)
+
+def run_command(args):
+    if args.table not in get_all_tables():
+        print(f"Unknown table: {args.table}", file=sys.stderr)
+        return 2
+    try:
+        if args.command == 'import':
+            progress = lambda count, seconds: print(
+                f"  {count} rows ({count / seconds:.0f} rows/sec)", file=sys.stderr)
+            stats = import_rows(args.table, read_rows(args.path, args.format),
+                                chunk_size=args.chunk_size, replace=args.replace, progress=progress)
+            report("Imported", args.table, stats)
+        else:
+            stats = export_rows(args.table, args.path, args.format, batch_size=args.batch_size)
+            report("Exported", args.table, stats)
+    except (ValueError, OSError, csv.Error, sqlite3.Error) as e:
+        print(f"{args.command} failed: {e}", file=sys.stderr)
+        return 1
+    return 0
+
 if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.command:
+        sys.exit(run_command(args))
+    
     # Install tabulate if not already installed
     try:
         from tabulate import tabulate
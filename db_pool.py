@@ -0,0 +1,284 @@
+import os
+import sqlite3
+import threading
+from collections import deque
+
+# Shared SQLite connection layer used by app.py, database.py and db_manager.py.
+# Connections are opened once, tuned with WAL pragmas and handed back to an
+# idle pool when callers close() them, so the existing
+# "conn = get_connection() ... conn.close()" pattern keeps working unchanged.
+#
+# Under cooperative (gevent) workers serving.init_app() installs a bounded
+# executor; statements, row fetches and commits then run on its OS threads
+# so a query, or a wait on the write lock, doesn't stall every other request
+# in the worker. Cursors come from PooledCursor for the same reason, and
+# iterating one fetches ITER_BATCH rows per trip to the executor.
+# Write transactions are capped at the executor's size as well: otherwise a
+# greenlet holding the write lock could queue for a thread behind statements
+# that are all waiting on that same lock. A connection takes a write slot at
+# its first statement that isn't a SELECT and gives it back when it leaves
+# the transaction, so holding a connection for reads or non-DB work doesn't
+# keep anyone else waiting.
+
+DB_PATH = os.environ.get('INVENTORY_DB', 'data/inventory.db')
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 16))
+STATEMENT_CACHE_SIZE = 256
+ITER_BATCH = 256
+BUSY_TIMEOUT_MS = 5000
+
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -20000),         # ~20 MB page cache per connection
+    ('mmap_size', 268435456),       # 256 MB memory-mapped reads
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', BUSY_TIMEOUT_MS),
+)
+
+
+# Set by set_executor(); None runs statements on the calling thread
+_executor = None
+_write_slots = None
+
+
+def run_blocking(fn, *args):
+    """Call fn on the DB executor if one is installed, else inline"""
+    executor = _executor
+    if executor is None:
+        return fn(*args)
+    return executor.submit(fn, *args).result()
+
+
+class PooledCursor(sqlite3.Cursor):
+    """sqlite3 cursor whose statements and row fetches go through run_blocking"""
+
+    # Rows fetched ahead while iterating, handed out before fetching more
+    _rows = ()
+
+    def execute(self, sql, parameters=()):
+        self._rows = ()
+        self.connection.enter_write(sql)
+        try:
+            return run_blocking(super().execute, sql, parameters)
+        finally:
+            self.connection.leave_write()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._rows = ()
+        self.connection.enter_write(sql)
+        try:
+            return run_blocking(super().executemany, sql, seq_of_parameters)
+        finally:
+            self.connection.leave_write()
+
+    def _buffered(self, size):
+        return [self._rows.popleft() for _ in range(min(size, len(self._rows)))]
+
+    def fetchone(self):
+        if self._rows:
+            return self._rows.popleft()
+        return run_blocking(super().fetchone)
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._buffered(size)
+        if len(rows) < size:
+            rows += run_blocking(super().fetchmany, size - len(rows))
+        return rows
+
+    def fetchall(self):
+        return self._buffered(len(self._rows)) + run_blocking(super().fetchall)
+
+    def __next__(self):
+        if not self._rows:
+            self._rows = deque(run_blocking(super().fetchmany, ITER_BATCH))
+            if not self._rows:
+                raise StopIteration
+        return self._rows.popleft()
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() returns it to the pool"""
+
+    pool = None
+    # The write slot semaphore in force when the connection was borrowed, and whether it holds one
+    write_slots = None
+    writing = False
+
+    def enter_write(self, sql):
+        if self.write_slots is not None and not self.writing and sql.lstrip()[:6].upper() != 'SELECT':
+            self.write_slots.acquire()
+            self.writing = True
+
+    def leave_write(self):
+        if self.writing and not self.in_transaction:
+            self.writing = False
+            self.write_slots.release()
+
+    def cursor(self, factory=PooledCursor):
+        return super().cursor(factory)
+
+    # sqlite3's own execute() builds a plain cursor, so go through cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        try:
+            return run_blocking(super().commit)
+        finally:
+            self.leave_write()
+
+    def rollback(self):
+        try:
+            return run_blocking(super().rollback)
+        finally:
+            self.leave_write()
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+            return
+        self.pool.release(self)
+
+    def really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Bounded LIFO pool of tuned SQLite connections"""
+
+    # Swapped for an instrumented subclass by metrics.init_app()
+    connection_factory = PooledConnection
+
+    def __init__(self, db_path=DB_PATH, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            factory=self.connection_factory,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for name, value in PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn.pool = self
+        return conn
+
+    def _check_fork(self):
+        # Connections must never be shared across a fork; start over in the child.
+        if self._pid != os.getpid():
+            self._idle = []
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def acquire(self):
+        self._check_fork()
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if conn is None:
+            conn = self._connect()
+        conn.write_slots = _write_slots
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            if conn.writing:
+                conn.writing = False
+                conn.write_slots.release()
+            conn.write_slots = None
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+            self.discarded += 1
+        conn.really_close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.really_close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'discarded': self.discarded,
+                'idle': len(self._idle),
+                'size': self.size,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=None):
+    db_path = db_path or DB_PATH
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+        return pool
+
+
+def get_connection(db_path=None):
+    """Borrow a pooled connection; close() hands it back"""
+    return get_pool(db_path).acquire()
+
+
+def pool_stats(db_path=None):
+    return get_pool(db_path).stats()
+
+
+def all_pool_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.db_path: pool.stats() for pool in pools}
+
+
+def close_all():
+    """Close the idle connections of every pool, e.g. before forking workers"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+
+def set_connection_factory(factory):
+    """Open future connections with factory, dropping idle ones made by the old one"""
+    ConnectionPool.connection_factory = factory
+    close_all()
+
+
+def set_executor(executor, max_writers=None):
+    """Run statements and commits on executor (a concurrent.futures-style pool), or inline for None
+
+    max_writers, normally the executor's thread count, bounds how many
+    connections can be in a write transaction at once; further writes wait.
+    """
+    global _executor, _write_slots
+    _executor = executor
+    _write_slots = threading.BoundedSemaphore(max_writers) if executor and max_writers else None
@@ -0,0 +1,233 @@
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+import db_pool
+import shiprocket
+import shipping_quotes
+
+# Durable Shiprocket fulfilment queue.
+#
+# payment_success() only records a shipment_jobs row (in the same transaction
+# that marks the order paid) and returns. A small pool of background threads
+# claims due jobs, creates the Shiprocket order and writes the shipment id
+# back. Jobs are keyed by razorpay_order_id, so a replayed payment callback
+# never creates a second shipment, and failed attempts are retried with
+# exponential backoff until MAX_ATTEMPTS. Shipments carry the order's own
+# delivery address and a parcel sized by shipping_quotes.package_for().
+# Workers borrow a connection to claim a job and again to record its outcome,
+# not across the Shiprocket call, and requeue jobs left 'running' by a dead
+# process every RECOVER_EVERY polls.
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('FULFILMENT_WORKERS', 2))
+POLL_INTERVAL = 5.0
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 30 * 60
+STALE_AFTER = 10 * 60
+# Each worker requeues stale jobs on start and every RECOVER_EVERY polls after
+RECOVER_EVERY = 60
+
+_wakeup = threading.Event()
+_stopping = threading.Event()
+_threads = []
+_threads_lock = threading.Lock()
+
+
+def enqueue(conn, order_id, razorpay_order_id):
+    """Queue a shipment for an order; the caller commits"""
+    conn.execute('''
+    INSERT INTO shipment_jobs (order_id, razorpay_order_id, next_attempt_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT (razorpay_order_id) DO NOTHING
+    ''', (order_id, razorpay_order_id, time.time()))
+
+
+def wake():
+    _wakeup.set()
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE ** attempts)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim_job(conn):
+    row = conn.execute('''
+    UPDATE shipment_jobs
+    SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE id = (
+        SELECT id FROM shipment_jobs
+        WHERE status = 'pending' AND next_attempt_at <= ?
+        ORDER BY next_attempt_at
+        LIMIT 1
+    )
+    RETURNING *
+    ''', (time.time(),)).fetchone()
+    conn.commit()
+    return row
+
+
+def build_shipment(conn, job):
+    order = conn.execute('''
+    SELECT o.*, u.username, u.email, u.phone
+    FROM orders o
+    JOIN users u ON o.user_id = u.id
+    WHERE o.id = ?
+    ''', (job['order_id'],)).fetchone()
+
+    order_items = conn.execute('''
+    SELECT oi.product_id, oi.custom_product_id, oi.product_name, oi.product_price, oi.quantity,
+           cp.customization_details, COALESCE(p.weight, oi.weight) AS weight, p.length, p.width, p.height
+    FROM order_items oi
+    LEFT JOIN custom_products cp ON oi.custom_product_id = cp.id
+    LEFT JOIN products p ON p.id = COALESCE(oi.product_id, cp.base_product_id)
+    WHERE oi.order_id = ?
+    ''', (job['order_id'],)).fetchall()
+    package = shipping_quotes.package_for(order_items)
+
+    shipment_items = []
+    for item in order_items:
+        shipment_items.append({
+            "name": item['product_name'] or f"Custom {item['customization_details']}",
+            "sku": str(item['product_id'] or item['custom_product_id']),
+            "units": item['quantity'],
+            "selling_price": str(item['product_price'])
+        })
+
+    shipment_data = {
+        "order_id": job['razorpay_order_id'],
+        "order_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "pickup_location": "Primary",
+        "channel_id": "",
+        "comment": "",
+        "billing_customer_name": order['shipping_first_name'] or order['username'],
+        "billing_last_name": order['shipping_last_name'] or "",
+        "billing_address": order['shipping_address'],
+        "billing_address_2": "",
+        "billing_city": order['shipping_city'],
+        "billing_pincode": order['shipping_pincode'],
+        "billing_state": order['shipping_state'],
+        "billing_country": order['shipping_country'] or "India",
+        "billing_email": order['shipping_email'] or order['email'],
+        "billing_phone": order['shipping_phone'] or order['phone'],
+        "shipping_is_billing": True,
+        "order_items": shipment_items,
+        "payment_method": "Prepaid",
+        "shipping_charges": order['shipping_total'],
+        "giftwrap_charges": 0,
+        "transaction_charges": 0,
+        "total_discount": order['discount_total'] or 0,
+        "sub_total": order['subtotal'],
+        "length": package['length'],
+        "breadth": package['breadth'],
+        "height": package['height'],
+        "weight": package['weight']
+    }
+    return order, shipment_data
+
+
+def run_job(job):
+    """Create the Shiprocket order for a claimed job; returns (order id, shipment id), or None if already shipped"""
+    conn = db_pool.get_connection()
+    try:
+        order, shipment_data = build_shipment(conn, job)
+    finally:
+        conn.close()
+    if order['shiprocket_shipment_id']:
+        # Already shipped by an earlier attempt that died before finishing the job
+        return None
+    # No connection is held while Shiprocket answers
+    response = shiprocket.create_adhoc_order(shipment_data)
+    return order['id'], response.get('shipment_id')
+
+
+def process_one():
+    """Run one due job; returns False when nothing was due"""
+    conn = db_pool.get_connection()
+    try:
+        job = claim_job(conn)
+    finally:
+        conn.close()
+    if job is None:
+        return False
+    try:
+        shipped, error = run_job(job), None
+    except Exception as e:
+        shipped, error = None, e
+        logger.warning('Shipment for %s failed (attempt %d): %s', job['razorpay_order_id'], job['attempts'], e)
+    conn = db_pool.get_connection()
+    try:
+        if error is not None:
+            status = 'failed' if job['attempts'] >= MAX_ATTEMPTS else 'pending'
+            conn.execute('''
+            UPDATE shipment_jobs
+            SET status = ?, next_attempt_at = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            ''', (status, time.time() + backoff(job['attempts']), str(error)[:500], job['id']))
+        else:
+            if shipped is not None:
+                conn.execute('''
+                UPDATE orders SET shiprocket_shipment_id = ?
+                WHERE id = ?
+                ''', (shipped[1], shipped[0]))
+            conn.execute('''
+            UPDATE shipment_jobs
+            SET status = 'done', last_error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            ''', (job['id'],))
+        conn.commit()
+    finally:
+        conn.close()
+    return True
+
+
+def _worker():
+    polls = 0
+    while not _stopping.is_set():
+        try:
+            if polls % RECOVER_EVERY == 0:
+                recover_stale_jobs()
+            while not _stopping.is_set() and process_one():
+                pass
+        except Exception:
+            logger.exception('Fulfilment worker error')
+        polls += 1
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def recover_stale_jobs():
+    # Jobs left 'running' by a process that died mid-attempt go back in the queue
+    conn = db_pool.get_connection()
+    conn.execute('''
+    UPDATE shipment_jobs SET status = 'pending'
+    WHERE status = 'running' AND updated_at < datetime('now', ?)
+    ''', (f'-{STALE_AFTER} seconds',))
+    conn.commit()
+    conn.close()
+
+
+def start_workers(count=WORKERS):
+    with _threads_lock:
+        if _threads:
+            return
+        _stopping.clear()
+        for i in range(count):
+            thread = threading.Thread(target=_worker, name=f'fulfilment-{i}', daemon=True)
+            thread.start()
+            _threads.append(thread)
+
+
+def stop_workers(timeout=5.0):
+    with _threads_lock:
+        _stopping.set()
+        _wakeup.set()
+        for thread in _threads:
+            thread.join(timeout)
+        _threads.clear()
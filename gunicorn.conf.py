@@ -0,0 +1,53 @@
+import multiprocessing
+import os
+
+# Production launcher (app.run() in app.py is the single-process dev server):
+#
+#   gunicorn -c gunicorn.conf.py app:app                     # sync: gthread workers
+#   SERVER_MODE=async gunicorn -c gunicorn.conf.py app:app   # async: gevent workers
+#
+# Settings, all from the environment:
+#   BIND             address to listen on (default 0.0.0.0:8000)
+#   WEB_WORKERS      processes (default 2 x CPUs + 1)
+#   WEB_THREADS      sync: request threads per worker (default 8)
+#   WEB_CONNECTIONS  async: concurrent requests per worker (default 1000)
+#   DB_THREADS       async: OS threads per worker for SQLite work (default 8)
+#   PRELOAD_APP      1 to import the app once in the master and fork workers
+#                    from it (default 1 for sync, 0 for async: gevent has to
+#                    patch the standard library before the app is imported)
+#   SECRET_KEY       must be set, and the same for every worker, or sessions
+#                    signed by one worker are rejected by the others
+#   PROXY_HOPS       proxies in front that append to X-Forwarded-For (default
+#                    0); without it every client behind a proxy shares the
+#                    proxy's address in the login throttle
+#
+# Sizing: a checkout holds its request for about the Razorpay latency, so
+# sync mode needs WEB_WORKERS x WEB_THREADS >= peak checkouts/s x that
+# latency. Async mode is bounded by SQLite and CPU rather than by threads.
+# benchmarks/serving_bench.py measures both against the same stub upstreams.
+# See serving.py for how the modes differ.
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+if os.environ.get('SERVER_MODE', 'sync') == 'async':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('WEB_CONNECTIONS', 1000))
+else:
+    worker_class = 'gthread'
+    threads = int(os.environ.get('WEB_THREADS', 8))
+
+preload_app = os.environ.get('PRELOAD_APP', '0' if worker_class == 'gevent' else '1') == '1'
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+accesslog = os.environ.get('ACCESS_LOG')
+
+
+def when_ready(server):
+    # Runs in the master before any worker forks; with preload_app the app
+    # module is already imported, so warm it once for every worker
+    if preload_app:
+        import app
+        app.warm(app.app)
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+# Derivative pipeline for product images.
+#
+# Each original under Static/images is resized to the widths in VARIANTS and
+# re-encoded as WebP and progressive JPEG. Output goes to
+# Static/images/derived/<content hash>/, so unchanged originals are never
+# re-encoded and changed ones get fresh URLs. The variant map is stored as
+# JSON in product_images.variants and turned into srcset by
+# templates/_images.html.
+
+IMAGES_DIR = os.path.join('Static', 'images')
+DERIVED_DIR = 'derived'
+
+VARIANTS = (
+    ('thumb', 160),
+    ('card', 480),
+    ('detail', 1200),
+)
+
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 6}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+BULK_WORKERS = None  # ProcessPoolExecutor default: one per CPU
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:20]
+
+
+def _save(image, path, fmt, options):
+    tmp_path = f'{path}.tmp'
+    image.save(tmp_path, fmt, **options)
+    os.replace(tmp_path, path)
+
+
+def generate_variants(image_url, images_dir=IMAGES_DIR):
+    """Write all derivatives of one original and return its variant map"""
+    source = os.path.join(images_dir, image_url)
+    relative_dir = f'{DERIVED_DIR}/{content_hash(source)}'
+    out_dir = os.path.join(images_dir, relative_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original).convert('RGB')
+        variants = {}
+        for name, width in VARIANTS:
+            width = min(width, original.width)
+            height = round(original.height * width / original.width)
+            entry = {'width': width, 'height': height}
+            resized = None
+            for ext, fmt, options in FORMATS:
+                filename = f'{name}-{width}.{ext}'
+                entry[ext] = f'{relative_dir}/{filename}'
+                path = os.path.join(out_dir, filename)
+                if os.path.exists(path):
+                    continue
+                if resized is None:
+                    resized = original.resize((width, height), Image.LANCZOS)
+                _save(resized, path, fmt, options)
+            variants[name] = entry
+    return variants
+
+
+def record_variants(conn, image_id, variants):
+    conn.execute('UPDATE product_images SET variants = ? WHERE id = ?', (json.dumps(variants), image_id))
+
+
+def process_image(conn, image_id):
+    """Generate and record derivatives for one product_images row"""
+    row = conn.execute('SELECT image_url FROM product_images WHERE id = ?', (image_id,)).fetchone()
+    if row is None or not os.path.exists(os.path.join(IMAGES_DIR, row['image_url'])):
+        return None
+    variants = generate_variants(row['image_url'])
+    record_variants(conn, image_id, variants)
+    conn.commit()
+    return variants
+
+
+def process_pending(conn, workers=BULK_WORKERS):
+    """Generate derivatives for every image without them, in a process pool"""
+    rows = [row for row in conn.execute('SELECT id, image_url FROM product_images WHERE variants IS NULL')
+            if os.path.exists(os.path.join(IMAGES_DIR, row['image_url']))]
+    if not rows:
+        return 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(generate_variants, [row['image_url'] for row in rows])
+        for row, variants in zip(rows, results):
+            record_variants(conn, row['id'], variants)
+    conn.commit()
+    return len(rows)
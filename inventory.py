@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+import db_pool
+
+# Stock reservations for checkout.
+#
+# place_order() reserves stock inside its BEGIN IMMEDIATE transaction with one
+# conditional UPDATE covering every product in the cart (the quantities go in
+# as a JSON array, and only rows with "stock_quantity >= quantity" change), so
+# there is no read-then-write window and a checkout costs one statement
+# however many SKUs it has. RETURNING names the products that were
+# decremented; the rest are short. The decrement is recorded as a 'held' stock_reservations row that expires after
+# HOLD_SECONDS. payment_success() commits the order's holds; a background
+# sweeper gives expired holds back to stock and cancels their unpaid orders.
+
+logger = logging.getLogger(__name__)
+
+HOLD_SECONDS = int(os.environ.get('INVENTORY_HOLD_SECONDS', 15 * 60))
+SWEEP_INTERVAL = float(os.environ.get('INVENTORY_SWEEP_INTERVAL', 30))
+
+_stopping = threading.Event()
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+class OutOfStock(Exception):
+    """One or more products cannot cover the requested quantity"""
+
+    def __init__(self, product_ids):
+        super().__init__(f'Insufficient stock for product(s) {", ".join(map(str, product_ids))}')
+        self.product_ids = product_ids
+
+
+def quantities(items):
+    """Total quantity per stocked product for cart view items"""
+    totals = Counter()
+    for item in items:
+        if item.get('stock_product_id'):
+            totals[item['stock_product_id']] += item['quantity']
+    return totals
+
+
+def shortages(conn, items):
+    """Product ids whose current stock can't cover items; a read-only precheck"""
+    totals = quantities(items)
+    if not totals:
+        return []
+    placeholders = ','.join(['?'] * len(totals))
+    rows = conn.execute(f'SELECT id, stock_quantity FROM products WHERE id IN ({placeholders})',
+                        list(totals)).fetchall()
+    stock = {row['id']: row['stock_quantity'] or 0 for row in rows}
+    return [product_id for product_id, quantity in totals.items() if stock.get(product_id, 0) < quantity]
+
+
+def reserve(conn, order_id, items, now=None):
+    """Decrement stock and hold it for an order; the caller's transaction commits
+
+    Raises OutOfStock if any product runs short. Callers must roll back in that
+    case, which also undoes the decrements that did succeed.
+    """
+    totals = quantities(items)
+    if not totals:
+        return
+    rows = conn.execute('''
+    UPDATE products SET stock_quantity = stock_quantity - wanted.quantity
+    FROM (SELECT json_extract(value, '$[0]') AS product_id, json_extract(value, '$[1]') AS quantity
+          FROM json_each(?)) AS wanted
+    WHERE products.id = wanted.product_id AND products.stock_quantity >= wanted.quantity
+    RETURNING products.id
+    ''', (json.dumps(sorted(totals.items())),)).fetchall()
+    short = sorted(set(totals) - {row[0] for row in rows})
+    if short:
+        raise OutOfStock(short)
+
+    expires_at = (now or time.time()) + HOLD_SECONDS
+    conn.executemany('''
+    INSERT INTO stock_reservations (order_id, product_id, quantity, expires_at)
+    VALUES (?, ?, ?, ?)
+    ''', [(order_id, product_id, quantity, expires_at) for product_id, quantity in totals.items()])
+
+
+def _restock(conn, released):
+    totals = Counter()
+    for row in released:
+        totals[row['product_id']] += row['quantity']
+    conn.executemany('UPDATE products SET stock_quantity = stock_quantity + ? WHERE id = ?',
+                     [(quantity, product_id) for product_id, quantity in totals.items()])
+
+
+def commit(conn, order_id):
+    """Turn an order's holds into sales on payment; the caller commits
+
+    A hold that already expired is reserved again if stock allows. Returns the
+    product ids that could not be, so the caller can flag the oversell.
+    """
+    conn.execute('''
+    UPDATE stock_reservations SET status = 'committed', updated_at = CURRENT_TIMESTAMP
+    WHERE order_id = ? AND status = 'held'
+    ''', (order_id,))
+    late = conn.execute('''
+    UPDATE stock_reservations SET status = 'committed', updated_at = CURRENT_TIMESTAMP
+    WHERE order_id = ? AND status = 'released'
+    RETURNING product_id, quantity
+    ''', (order_id,)).fetchall()
+    oversold = []
+    for row in late:
+        cursor = conn.execute('''
+        UPDATE products SET stock_quantity = stock_quantity - ?
+        WHERE id = ? AND stock_quantity >= ?
+        ''', (row['quantity'], row['product_id'], row['quantity']))
+        if cursor.rowcount == 0:
+            oversold.append(row['product_id'])
+    if oversold:
+        logger.error('Order %s was paid after its hold expired; product(s) %s oversold', order_id, oversold)
+    return oversold
+
+
+def release(conn, order_id):
+    """Give an order's holds back to stock; the caller commits"""
+    released = conn.execute('''
+    UPDATE stock_reservations SET status = 'released', updated_at = CURRENT_TIMESTAMP
+    WHERE order_id = ? AND status = 'held'
+    RETURNING product_id, quantity
+    ''', (order_id,)).fetchall()
+    _restock(conn, released)
+    return len(released)
+
+
+def release_expired(conn, now=None):
+    """Release every expired hold and cancel its unpaid order, in one transaction"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        released = conn.execute('''
+        UPDATE stock_reservations SET status = 'released', updated_at = CURRENT_TIMESTAMP
+        WHERE status = 'held' AND expires_at <= ?
+        RETURNING order_id, product_id, quantity
+        ''', (now or time.time(),)).fetchall()
+        _restock(conn, released)
+        conn.executemany('''
+        UPDATE orders SET status = 'cancelled'
+        WHERE id = ? AND payment_status != 'paid' AND status = 'pending'
+        ''', [(order_id,) for order_id in {row['order_id'] for row in released}])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(released)
+
+
+def _sweep():
+    while not _stopping.wait(SWEEP_INTERVAL):
+        conn = db_pool.get_connection()
+        try:
+            released = release_expired(conn)
+            if released:
+                logger.info('Released %d expired stock reservation(s)', released)
+        except Exception:
+            logger.exception('Stock reservation sweep failed')
+        finally:
+            conn.close()
+
+
+def start_sweeper():
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is not None:
+            return
+        _stopping.clear()
+        _sweeper = threading.Thread(target=_sweep, name='inventory-sweeper', daemon=True)
+        _sweeper.start()
+
+
+def stop_sweeper(timeout=5.0):
+    global _sweeper
+    with _sweeper_lock:
+        _stopping.set()
+        if _sweeper is not None:
+            _sweeper.join(timeout)
+        _sweeper = None
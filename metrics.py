@@ -0,0 +1,345 @@
+import contextvars
+import cProfile
+import hmac
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+
+from flask import Response, abort, request, session
+
+import db_pool
+import page_cache
+from catalog_cache import catalog
+
+# Request, SQL and external-call instrumentation, plus the catalog and page
+# cache hit counts, exported in Prometheus text format at /metrics.
+#
+# init_app() adds before/after hooks that time every request and swaps the
+# pool's connection factory for InstrumentedConnection, which times each
+# execute()/executemany() and counts statements against the current request.
+# The same SQL text running N_PLUS_ONE_THRESHOLD or more times in one request
+# is reported as a likely N+1; statements slower than SLOW_QUERY_MS are logged
+# with their EXPLAIN QUERY PLAN. Metrics are per process, so scrape each
+# worker (or run one) when serving under gunicorn.
+#
+# With METRICS_PROFILE=1, adding ?_profile=1 to a request writes a cProfile
+# dump to METRICS_PROFILE_DIR and names it in the X-Profile response header.
+#
+# /metrics answers a scraper sending "Authorization: Bearer <METRICS_TOKEN>"
+# or an admin session. Loopback clients are let in only with
+# METRICS_ALLOW_LOOPBACK=1, since behind a reverse proxy every request
+# arrives from loopback.
+
+SLOW_QUERY_MS = float(os.environ.get('METRICS_SLOW_QUERY_MS', 100))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('METRICS_N_PLUS_ONE', 5))
+PROFILE_ENABLED = os.environ.get('METRICS_PROFILE') == '1'
+PROFILE_DIR = os.environ.get('METRICS_PROFILE_DIR', 'profiles')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+ALLOW_LOOPBACK = os.environ.get('METRICS_ALLOW_LOOPBACK') == '1'
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests served, by route and status'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by route'),
+    'sql_statements_per_request': ('histogram', 'SQL statements executed per request'),
+    'sql_query_duration_seconds': ('histogram', 'SQL statement latency by statement kind and table'),
+    'sql_slow_queries_total': ('counter', f'Statements slower than {SLOW_QUERY_MS:g} ms'),
+    'sql_n_plus_one_total': ('counter', 'Requests repeating one statement at least '
+                                        f'{N_PLUS_ONE_THRESHOLD} times'),
+    'external_call_duration_seconds': ('histogram', 'Latency of calls to external services'),
+    'external_call_errors_total': ('counter', 'Failed calls to external services'),
+    'db_pool_checkouts_total': ('counter', 'Pool checkouts served by an idle (hit) or new (miss) connection'),
+    'db_pool_discarded_total': ('counter', 'Connections closed because the pool was full'),
+    'db_pool_idle_connections': ('gauge', 'Idle pooled connections'),
+    'cache_lookups_total': ('counter', 'Catalog and page cache lookups by result'),
+    'cache_evictions_total': ('counter', 'Entries evicted to stay within the cache bounds'),
+    'cache_entries': ('gauge', 'Entries held by the page cache'),
+    'cache_size_bytes': ('gauge', 'Rendered HTML held by the page cache'),
+    'page_cache_not_modified_total': ('counter', 'Page requests answered with 304 Not Modified'),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class Registry:
+    """Thread-safe counters and fixed-bucket histograms keyed by label tuples"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        with self._lock:
+            key = (name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets),
+                                                     'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def samples(self):
+        """(name, labels, suffix, value) for every series"""
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, dict(h, counts=list(h['counts']))) for key, h in self._histograms.items()]
+        for (name, labels), value in counters:
+            yield name, labels, '', value
+        for (name, labels), h in histograms:
+            for bound, count in zip(h['buckets'], h['counts']):
+                yield name, labels + (('le', f'{bound:g}'),), '_bucket', count
+            yield name, labels + (('le', '+Inf'),), '_bucket', h['count']
+            yield name, labels, '_sum', h['sum']
+            yield name, labels, '_count', h['count']
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _pool_samples():
+    for db_path, stats in db_pool.all_pool_stats().items():
+        labels = (('db', db_path),)
+        yield 'db_pool_checkouts_total', labels + (('result', 'hit'),), '', stats['hits']
+        yield 'db_pool_checkouts_total', labels + (('result', 'miss'),), '', stats['misses']
+        yield 'db_pool_discarded_total', labels, '', stats['discarded']
+        yield 'db_pool_idle_connections', labels, '', stats['idle']
+
+
+def _cache_samples():
+    stats = catalog.stats()
+    yield 'cache_lookups_total', (('cache', 'catalog'), ('result', 'hit')), '', stats['hits']
+    yield 'cache_lookups_total', (('cache', 'catalog'), ('result', 'miss')), '', stats['misses']
+    stats = page_cache.pages.stats()
+    for kind in ('fragment', 'page'):
+        labels = (('cache', kind),)
+        yield 'cache_lookups_total', labels + (('result', 'hit'),), '', stats['hits'].get(kind, 0)
+        yield 'cache_lookups_total', labels + (('result', 'miss'),), '', stats['misses'].get(kind, 0)
+    yield 'cache_evictions_total', (('cache', 'page'),), '', stats['evictions']
+    yield 'cache_entries', (('cache', 'page'),), '', stats['entries']
+    yield 'cache_size_bytes', (('cache', 'page'),), '', stats['bytes']
+    yield 'page_cache_not_modified_total', (), '', stats['not_modified']
+
+
+def _format_value(value):
+    # :g keeps 6 significant digits, which turns a counter past a million into 1.23457e+06
+    if isinstance(value, int):
+        return str(value)
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    by_name = {}
+    for name, labels, suffix, value in list(registry.samples()) + list(_pool_samples()) + list(_cache_samples()):
+        by_name.setdefault(name, []).append((labels, suffix, value))
+    lines = []
+    for name, series in by_name.items():
+        kind, help_text = METRICS[name]
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, suffix, value in series:
+            label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+            value = _format_value(value)
+            lines.append(f'{name}{suffix}{{{label_text}}} {value}' if label_text else f'{name}{suffix} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== SQL ====================
+
+class RequestStats:
+    """SQL activity of the request being served on this thread"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.repeats = Counter()
+        self.status = 500
+        self.profiler = None
+
+
+_current = contextvars.ContextVar('metrics_request', default=None)
+
+STATEMENT_RE = re.compile(r'^\s*(?:(UPDATE)(?:\s+OR\s+\w+)?\s+(\w+)|(\w+)(?:.*?\b(?:FROM|INTO|TABLE)\s+(\w+))?)',
+                          re.IGNORECASE | re.DOTALL)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """Low-cardinality label such as 'SELECT products' for a statement"""
+    match = STATEMENT_RE.match(sql)
+    if not match:
+        return 'OTHER'
+    verb = (match.group(1) or match.group(3)).upper()
+    table = match.group(2) or match.group(4)
+    if verb == 'WITH':
+        return 'WITH'
+    return f'{verb} {table}' if table else verb
+
+
+def record_statement(conn, sql, parameters, elapsed, many=False):
+    label = statement_label(sql)
+    registry.observe('sql_query_duration_seconds', elapsed, (('statement', label),))
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.sql_seconds += elapsed
+        stats.repeats[sql] += 1
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        registry.inc('sql_slow_queries_total', (('statement', label),))
+        plan = ''
+        if not many and not sql.lstrip().upper().startswith(('EXPLAIN', 'PRAGMA', 'BEGIN', 'COMMIT')):
+            try:
+                rows = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+                plan = '\n'.join(f'    {row[3]}' for row in rows)
+            except sqlite3.Error as e:
+                plan = f'    (no plan: {e})'
+        logger.warning('Slow query (%.1f ms): %s\n%s', elapsed * 1000, ' '.join(sql.split()), plan)
+
+
+class InstrumentedCursor(db_pool.PooledCursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_statement(self.connection, sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_statement(self.connection, sql, (), time.perf_counter() - start, many=True)
+
+
+class InstrumentedConnection(db_pool.PooledConnection):
+    """Pooled connection that times every statement"""
+
+    # Its execute() and executemany() run through cursor(), so they are timed there
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+
+# ==================== EXTERNAL CALLS ====================
+
+def observe_external(service, operation, seconds, failed=False):
+    labels = (('service', service), ('operation', operation))
+    registry.observe('external_call_duration_seconds', seconds, labels)
+    if failed:
+        registry.inc('external_call_errors_total', labels)
+
+
+@contextmanager
+def external_call(service, operation):
+    """Time a call to an external API; exceptions count as errors"""
+    start = time.perf_counter()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        observe_external(service, operation, time.perf_counter() - start, failed)
+
+
+# ==================== FLASK ====================
+
+def _start_request():
+    stats = RequestStats()
+    _current.set(stats)
+    if PROFILE_ENABLED and request.args.get('_profile'):
+        stats.profiler = cProfile.Profile()
+        stats.profiler.enable()
+
+
+def _finish_response(response):
+    stats = _current.get()
+    if stats is None:
+        return response
+    stats.status = response.status_code
+    if stats.profiler is not None:
+        stats.profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{request.endpoint or "unmatched"}-{os.getpid()}.prof')
+        stats.profiler.dump_stats(path)
+        stats.profiler = None
+        response.headers['X-Profile'] = path
+    return response
+
+
+def _record_request(exc=None):
+    stats = _current.get()
+    if stats is None:
+        return
+    _current.set(None)
+    if stats.profiler is not None:
+        stats.profiler.disable()
+    endpoint = request.endpoint or 'unmatched'
+    elapsed = time.perf_counter() - stats.start
+
+    registry.inc('http_requests_total', (('endpoint', endpoint), ('method', request.method),
+                                         ('status', str(stats.status))))
+    registry.observe('http_request_duration_seconds', elapsed, (('endpoint', endpoint), ('method', request.method)))
+    registry.observe('sql_statements_per_request', stats.statements, (('endpoint', endpoint),),
+                     buckets=COUNT_BUCKETS)
+
+    for sql, count in stats.repeats.items():
+        if count >= N_PLUS_ONE_THRESHOLD:
+            label = statement_label(sql)
+            registry.inc('sql_n_plus_one_total', (('endpoint', endpoint), ('statement', label)))
+            logger.warning('Possible N+1 in %s: %d executions of %s', endpoint, count, ' '.join(sql.split()))
+
+
+def _may_scrape():
+    if METRICS_TOKEN and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return True
+    if session.get('is_admin'):
+        return True
+    return ALLOW_LOOPBACK and request.remote_addr in ('127.0.0.1', '::1')
+
+
+def metrics_view():
+    if not _may_scrape():
+        abort(403)
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Instrument requests and pooled connections, and serve /metrics"""
+    db_pool.set_connection_factory(InstrumentedConnection)
+    app.before_request(_start_request)
+    app.after_request(_finish_response)
+    app.teardown_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,154 @@
+import logging
+import sqlite3
+import uuid
+
+import catalog_cache
+import db_manager
+import inventory
+
+# Order placement for checkout().
+#
+# The Razorpay order is created before any write lock is taken; the order,
+# its items and the emptied cart are then written in one BEGIN IMMEDIATE
+# transaction with a single executemany for the items, so the SQLite write
+# lock is held for a handful of statements regardless of cart size. Stock is
+# reserved in the same transaction (see inventory.py), so an order that can't
+# be fulfilled is never written. Orders and their items keep the amounts the
+# cart view was priced at (see pricing.py), including each line's GST and the
+# chargeable weight of one unit.
+#
+# If the order can't be written after its Razorpay order was created, the
+# Razorpay order id goes into unplaced_payment_orders with the reason, so it
+# can be cancelled, or matched to a payment that arrives for it anyway.
+#
+# Each order also stores a summary (line count, first item's name and
+# thumbnail) so order_history() can list a page of orders from the
+# (user_id, created_at, id) index without touching order_items.
+
+logger = logging.getLogger(__name__)
+
+SHIPPING_FIELDS = ('name', 'email', 'phone', 'address', 'city', 'state', 'pincode')
+HISTORY_PAGE_SIZE = 10
+
+
+class CartChanged(Exception):
+    """The cart was modified after the checkout total was computed"""
+
+
+def new_order_number():
+    return 'OF' + uuid.uuid4().hex[:12].upper()
+
+
+def shipping_details(form):
+    return {field: (form.get(field) or '').strip() for field in SHIPPING_FIELDS}
+
+
+def item_name(item):
+    return item['product_name'] or f"Custom {item['customization_details']}"
+
+
+def order_item_rows(order_id, cart_items):
+    for item in cart_items:
+        yield (
+            order_id,
+            None if item['custom_product_id'] else item['product_id'],
+            item['custom_product_id'],
+            item_name(item),
+            item['unit_price'],
+            item['quantity'],
+            item['line_total'],
+            item['tax_amount'],
+            item['unit_weight'],
+        )
+
+
+def order_summary(conn, cart_items):
+    """(item_count, first_item_name, first_item_image) stored on the order row"""
+    if not cart_items:
+        return 0, None, None
+    first = cart_items[0]
+    image = catalog_cache.primary_images(conn, [first['stock_product_id']]).get(first['stock_product_id'])
+    thumbnail = None
+    if image:
+        thumbnail = image['variants']['thumb']['jpeg'] if image['variants'] else image['image_url']
+    return len(cart_items), item_name(first), thumbnail
+
+
+def place_order(conn, user_id, cart_view, shipping, order_number, razorpay_order_id):
+    """Write the order, its items and clear the cart atomically; returns the order id"""
+    summary = order_summary(conn, cart_view['items'])
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT version FROM cart_versions WHERE user_id = ?', (user_id,)).fetchone()
+        if (row['version'] if row else None) != cart_view['version']:
+            raise CartChanged()
+
+        cursor = conn.execute('''
+        INSERT INTO orders (user_id, order_number, subtotal, shipping_total, tax_total, total,
+                            payment_method, razorpay_order_id, shipping_first_name, shipping_address,
+                            shipping_city, shipping_state, shipping_pincode, shipping_phone, shipping_email,
+                            item_count, first_item_name, first_item_image)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, order_number, cart_view['subtotal'], cart_view['shipping_charges'], cart_view['tax_total'],
+              cart_view['total'], 'razorpay', razorpay_order_id, shipping['name'], shipping['address'],
+              shipping['city'], shipping['state'], shipping['pincode'], shipping['phone'], shipping['email'])
+             + summary)
+        order_id = cursor.lastrowid
+        inventory.reserve(conn, order_id, cart_view['items'])
+
+        conn.executemany('''
+        INSERT INTO order_items (order_id, product_id, custom_product_id, product_name,
+                                 product_price, quantity, subtotal, tax_amount, weight)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', order_item_rows(order_id, cart_view['items']))
+
+        conn.execute('DELETE FROM cart WHERE user_id = ?', (user_id,))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return order_id
+
+
+def record_unplaced(conn, user_id, order_number, razorpay_order_id, amount, reason):
+    """Keep a Razorpay order that no order row refers to for reconciliation"""
+    try:
+        conn.execute('''
+        INSERT OR IGNORE INTO unplaced_payment_orders (razorpay_order_id, order_number, user_id, amount, reason)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (razorpay_order_id, order_number, user_id, amount, reason))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        # The log line is then the only record
+        logger.exception('Could not record unplaced Razorpay order %s for %s', razorpay_order_id, order_number)
+
+
+def order_counts(conn, user_id):
+    """Total, pending and completed orders for a user, from the user index alone"""
+    row = conn.execute('''
+    SELECT COUNT(*) AS total,
+           COALESCE(SUM(status = 'pending'), 0) AS pending,
+           COALESCE(SUM(status = 'completed'), 0) AS completed
+    FROM orders WHERE user_id = ?
+    ''', (user_id,)).fetchone()
+    return dict(row)
+
+
+def order_history(conn, user_id, after=None, limit=HISTORY_PAGE_SIZE):
+    """One page of a user's orders, newest first; returns rows and the next cursor"""
+    # The first page seeks from past the newest possible row, so every page runs the same plan
+    created_at, order_id = db_manager.decode_cursor(after) or ('9999-12-31', 0)
+    rows = conn.execute('''
+    SELECT id, order_number, status, payment_status, total, created_at,
+           item_count, first_item_name, first_item_image
+    FROM orders
+    WHERE user_id = ? AND (created_at, id) < (?, ?)
+    ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', (user_id, created_at, order_id, limit + 1)).fetchall()
+    rows = [dict(row) for row in rows]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = db_manager.encode_cursor(rows[-1])
+    return rows, next_cursor
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+from collections import Counter, OrderedDict
+
+from flask import current_app, render_template, request, session
+from jinja2.utils import concat
+from markupsafe import Markup
+
+import db_pool
+from catalog_cache import catalog
+
+# Rendered-page cache for the catalog pages (the homepage and product pages).
+#
+# Their content only changes with the catalog, so the blocks a page template
+# fills in (title, content, scripts) are rendered once per template,
+# arguments and catalog version and kept as a fragment. The header in
+# base.html depends on the request (login links, flashed messages, the search
+# box echoing request.args), so _cached_page.html renders it around the
+# fragment instead of caching it with the content. When there is nothing
+# request-specific to show (no flashed messages, no query string) the
+# finished page is cached too, once per login state: a repeat view is then a
+# catalog_version lookup and a dict hit, with no other SQL and no Jinja.
+#
+# Pages carry a strong ETag (a hash of the body) and Cache-Control: private,
+# no-cache, so browsers revalidate and get an empty 304 while nothing
+# changed. Entries are evicted least recently used past MAX_BYTES of HTML or
+# MAX_ENTRIES entries, and all dropped when catalog_version moves. Templates
+# served this way must import their macros inside the blocks, which are
+# rendered without the rest of the template.
+
+MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 4096))
+
+BLOCKS = ('title', 'content', 'scripts')
+LAYOUT_TEMPLATE = '_cached_page.html'
+
+
+class PageCache:
+    """LRU of rendered fragments and pages, bounded by total size and entry count"""
+
+    def __init__(self, max_bytes=MAX_BYTES, max_entries=MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.version = None
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        self.not_modified = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def sync(self, version):
+        """Drop every entry if the catalog changed since they were rendered"""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.size = 0
+                self.version = version
+
+    def get(self, kind, key):
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                self.misses[kind] += 1
+                return None
+            self._entries.move_to_end((kind, key))
+            self.hits[kind] += 1
+            return entry[1]
+
+    def put(self, kind, key, value, size):
+        with self._lock:
+            old = self._entries.pop((kind, key), None)
+            if old is not None:
+                self.size -= old[0]
+            if size > self.max_bytes:
+                return
+            self._entries[(kind, key)] = (size, value)
+            self.size += size
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (evicted_size, _) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': dict(self.hits),
+                'misses': dict(self.misses),
+                'evictions': self.evictions,
+                'not_modified': self.not_modified,
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'version': self.version,
+            }
+
+
+def render_blocks(template_name, context):
+    """Markup for each block template_name fills in, rendered without base.html"""
+    app = current_app._get_current_object()
+    template = app.jinja_env.get_template(template_name)
+    app.update_template_context(context)
+    return {name: Markup(concat(template.blocks[name](template.new_context(context))))
+            for name in BLOCKS if name in template.blocks}
+
+
+def etag_for(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def render(template_name, args, load):
+    """Conditional response for template_name, or None if load() found nothing
+
+    load(conn) returns the template context and only runs when the fragment
+    for (template_name, args) isn't cached, so args must identify it.
+    """
+    conn = db_pool.get_connection()
+    version = catalog.sync(conn)
+    pages.sync(version)
+    key = (template_name, args, version)
+    # Flashed messages and query strings show up in the header, so those pages aren't kept
+    cacheable = not request.args and '_flashes' not in session
+    page_key = key + ('user_id' in session,)
+    page = pages.get('page', page_key) if cacheable else None
+    if page is None:
+        blocks = pages.get('fragment', key)
+        if blocks is None:
+            context = load(conn)
+            if context is None:
+                conn.close()
+                return None
+            blocks = render_blocks(template_name, context)
+            pages.put('fragment', key, blocks, sum(len(block) for block in blocks.values()))
+        conn.close()
+        body = render_template(LAYOUT_TEMPLATE, blocks=blocks).encode()
+        page = (etag_for(body), body)
+        if cacheable:
+            pages.put('page', page_key, page, len(body))
+    else:
+        conn.close()
+
+    etag, body = page
+    response = current_app.response_class(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        pages.count_not_modified()
+    return response
+
+
+pages = PageCache()
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+import serving
+
+# Password hashing for login(), register() and db_manager.
+#
+# A PBKDF2 hash costs ~0.1-0.2 s of CPU at the default cost, so it runs on a
+# pool of HASH_WORKERS threads instead of on the request thread: a burst of
+# logins queues there instead of taking every core and stalling the other
+# routes, and under gevent it no longer freezes the worker's hub. Threads are
+# enough because hashlib.pbkdf2_hmac releases the GIL for the whole
+# computation, and they work the same under both serving modes, where a
+# process pool would re-import app.py in every child and block the gevent
+# hub on its pipes. HASH_WORKERS=0 hashes inline.
+#
+# PASSWORD_METHOD sets the algorithm and cost. Hashes made with other
+# parameters still verify, and login() stores a fresh hash when
+# needs_rehash() says so. throttle() meters attempts per client IP with
+# token buckets and is checked before any hash is computed, so a brute-force
+# flood costs a dict lookup per request. Guessing at one account is metered
+# by a stricter bucket per (account, client IP) that record_failure() only
+# charges for wrong passwords, so nobody can lock a user out of their own
+# account by failing logins for it from elsewhere. The client IP is only
+# meaningful behind a proxy if the app trusts its X-Forwarded-For (PROXY_HOPS
+# in app.py).
+
+PASSWORD_METHOD = os.environ.get('PASSWORD_METHOD', f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}')
+SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+
+# Token buckets: BURST attempts at once, then one more every REFILL_SECONDS
+ACCOUNT_BURST = int(os.environ.get('LOGIN_ACCOUNT_BURST', 5))
+ACCOUNT_REFILL_SECONDS = float(os.environ.get('LOGIN_ACCOUNT_REFILL_SECONDS', 12))
+IP_BURST = int(os.environ.get('LOGIN_IP_BURST', 100))
+IP_REFILL_SECONDS = float(os.environ.get('LOGIN_IP_REFILL_SECONDS', 0.5))
+MAX_TRACKED_KEYS = 100000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def normalized_method(method):
+    """The method prefix werkzeug writes into hashes made with method"""
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        hash_name = parts[1] if len(parts) > 1 else 'sha256'
+        iterations = parts[2] if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+CURRENT_METHOD = normalized_method(PASSWORD_METHOD)
+
+
+def _run(fn, *args):
+    global _executor
+    if HASH_WORKERS <= 0:
+        return fn(*args)
+    with _executor_lock:
+        if _executor is None:
+            if serving.cooperative():
+                _executor = serving.OffloadExecutor(HASH_WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='password-hash')
+    return _executor.submit(fn, *args).result()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, CURRENT_METHOD, SALT_LENGTH)
+
+
+def verify(stored_hash, password):
+    return _run(check_password_hash, stored_hash, password)
+
+
+def needs_rehash(stored_hash):
+    """True if stored_hash was made with other parameters than PASSWORD_METHOD"""
+    method, _, rest = stored_hash.partition('$')
+    salt = rest.partition('$')[0]
+    return method != CURRENT_METHOD or len(salt) != SALT_LENGTH
+
+
+class RateLimiter:
+    """Token buckets per key, holding at most max_keys of the most recent keys"""
+
+    def __init__(self, burst, refill_seconds, max_keys=MAX_TRACKED_KEYS):
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None, spend=True):
+        """Spend a token for key; returns 0 if allowed, else seconds until one is due
+
+        With spend=False the bucket is only checked.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) / self.refill_seconds)
+            allowed = tokens >= 1
+            if allowed and spend:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) * self.refill_seconds
+
+
+account_limiter = RateLimiter(ACCOUNT_BURST, ACCOUNT_REFILL_SECONDS)
+ip_limiter = RateLimiter(IP_BURST, IP_REFILL_SECONDS)
+
+
+def _account_key(ip, account):
+    return account.strip().lower(), ip
+
+
+def throttle(ip, account=None):
+    """Seconds the caller must wait before another attempt, or 0 to go ahead"""
+    wait = ip_limiter.take(ip)
+    if account:
+        wait = max(wait, account_limiter.take(_account_key(ip, account), spend=False))
+    return wait
+
+
+def record_failure(ip, account):
+    """Charge a wrong password for account to the caller's bucket for it"""
+    if account:
+        account_limiter.take(_account_key(ip, account))
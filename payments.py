@@ -0,0 +1,27 @@
+import os
+import threading
+
+# Razorpay configuration
+RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID', 'your_razorpay_key_id')
+RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', 'your_razorpay_key_secret')
+# Point at a local stub for load tests (see benchmarks/load_test.py)
+RAZORPAY_BASE_URL = os.environ.get('RAZORPAY_BASE_URL')
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Shared Razorpay client, built (and the SDK imported) on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import razorpay
+            options = {'base_url': RAZORPAY_BASE_URL} if RAZORPAY_BASE_URL else {}
+            _client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET), **options)
+        return _client
+
+
+def preload():
+    """Import the SDK without building a client, so forked workers share it"""
+    import razorpay  # noqa: F401
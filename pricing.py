@@ -0,0 +1,129 @@
+import math
+import threading
+
+import catalog_cache
+
+# Prices, GST and shipping for carts and orders.
+#
+# Rates live in tax_rates and shipping_rates (see database.MIGRATIONS). They
+# are read once into dicts keyed by class and reloaded only when
+# catalog_version moves; edits to either table bump it through triggers, as
+# product edits do. price_cart() then prices every line of a cart in one pass
+# over the rows of cart_service.CART_VIEW_SQL, without further queries:
+#
+# - A unit sells at its sale_price when one is set below the list price.
+#   Custom lines add the base product's min_customization_price, or
+#   CUSTOMIZATION_CHARGE when it has none.
+# - Prices include GST, so a line's tax is the share of its total at its
+#   tax_class rate, rounded to paise. The order's tax_total is their sum.
+# - A unit ships at the greater of its weight and its volumetric weight
+#   (L x W x H in cm / VOLUMETRIC_DIVISOR). The cart ships as one parcel at
+#   the dearest rate among its shipping classes: the base charge covers the
+#   first SLAB_KG and the slab charge each SLAB_KG after that. Carts at or
+#   over FREE_SHIPPING_THRESHOLD ship free.
+
+FREE_SHIPPING_THRESHOLD = 999
+CUSTOMIZATION_CHARGE = 100
+VOLUMETRIC_DIVISOR = 5000
+SLAB_KG = 0.5
+DEFAULT_CLASS = 'standard'
+
+# Used if a class has no row in the rate tables
+FALLBACK_TAX_RATE = 0.18
+FALLBACK_SHIPPING_RATE = (99, 40)
+
+
+def unit_price(product, custom=False):
+    """Selling price of one unit of product, with the customization charge if custom"""
+    price = product['price'] or 0
+    sale_price = product['sale_price']
+    if sale_price is not None and 0 < sale_price < price:
+        price = sale_price
+    if custom:
+        price += product['min_customization_price'] or CUSTOMIZATION_CHARGE
+    return price
+
+
+def chargeable_weight(product):
+    """Weight in kg a unit of product is billed at: actual or volumetric, whichever is greater"""
+    volume = (product['length'] or 0) * (product['width'] or 0) * (product['height'] or 0)
+    return max(product['weight'] or 0, volume / VOLUMETRIC_DIVISOR)
+
+
+class Rates:
+    """tax_rates and shipping_rates held in memory for the current catalog version"""
+
+    def __init__(self):
+        self.version = None
+        self.tax = {}
+        self.shipping = {}
+        self._lock = threading.Lock()
+
+    def sync(self, conn, version=None):
+        """Reload the tables if the catalog version moved; returns self"""
+        if version is None:
+            version = catalog_cache.catalog_version(conn)
+        if version != self.version:
+            tax = {row[0]: row[1] for row in conn.execute('SELECT tax_class, rate FROM tax_rates')}
+            shipping = {row[0]: (row[1], row[2]) for row in conn.execute(
+                'SELECT shipping_class, base_charge, slab_charge FROM shipping_rates')}
+            with self._lock:
+                self.tax, self.shipping, self.version = tax, shipping, version
+        return self
+
+    def shipping_rate(self, shipping_class):
+        """(base_charge, slab_charge) for a shipping class"""
+        return self.shipping.get(shipping_class) or self.shipping.get(DEFAULT_CLASS) or FALLBACK_SHIPPING_RATE
+
+    def shipping_charge(self, shipping_classes, weight, subtotal):
+        """Shipping for a parcel of weight chargeable kg on a cart worth subtotal"""
+        if subtotal <= 0 or subtotal >= FREE_SHIPPING_THRESHOLD:
+            return 0
+        base, per_slab = max(self.shipping_rate(shipping_class) for shipping_class in shipping_classes)
+        # Round to grams first so float noise can't tip a weight into the next slab
+        slabs = max(1, math.ceil(round(weight, 3) / SLAB_KG))
+        return base + per_slab * (slabs - 1)
+
+
+def price_cart(rows, rates):
+    """Cart view totals and priced lines (dicts) for CART_VIEW_SQL rows"""
+    tax_rates = rates.tax
+    default_tax = tax_rates.get(DEFAULT_CLASS, FALLBACK_TAX_RATE)
+    items = []
+    shipping_classes = set()
+    subtotal = tax_total = weight_total = 0
+    count = 0
+    for row in rows:
+        item = dict(row)
+        quantity = item['quantity']
+        price = unit_price(item, item['custom_product_id'] is not None)
+        line_total = round(price * quantity, 2)
+        rate = tax_rates.get(item['tax_class'], default_tax)
+        tax = round(line_total * rate / (1 + rate), 2)
+        weight = chargeable_weight(item)
+        shipping_classes.add(item['shipping_class'] or DEFAULT_CLASS)
+
+        item['unit_price'] = price
+        item['line_total'] = line_total
+        item['tax_rate'] = rate
+        item['tax_amount'] = tax
+        item['unit_weight'] = weight
+        items.append(item)
+        subtotal += line_total
+        tax_total += tax
+        weight_total += weight * quantity
+        count += quantity
+
+    subtotal = round(subtotal, 2)
+    shipping_charges = rates.shipping_charge(shipping_classes, weight_total, subtotal)
+    return {
+        'items': items,
+        'subtotal': subtotal,
+        'tax_total': round(tax_total, 2),
+        'shipping_charges': shipping_charges,
+        'total': round(subtotal + shipping_charges, 2),
+        'count': count,
+        'weight': round(weight_total, 3),
+    }
+
+rates = Rates()
@@ -0,0 +1,124 @@
+import re
+
+from catalog_cache import primary_images, DEFAULT_IMAGE
+
+# Ranked catalog search over the products_fts index (see database.MIGRATIONS).
+#
+# Results are ordered by BM25 score and paged with a keyset cursor of
+# "score:id", so deep pages cost the same as the first one. Without a search
+# term the category listing is paged by product id instead.
+
+PAGE_SIZE = 24
+
+# BM25 column weights: name, description, short_description, category_name
+BM25_WEIGHTS = '10.0, 1.0, 3.0, 2.0'
+
+PRODUCT_COLUMNS = 'p.id, p.name, p.slug, p.short_description, p.price, p.sale_price, p.customizable'
+
+
+def build_match(query):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    tokens = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def parse_cursor(cursor, ranked):
+    if not cursor:
+        return None
+    try:
+        if ranked:
+            score, product_id = cursor.split(':')
+            return float(score), int(product_id)
+        return int(cursor)
+    except ValueError:
+        return None
+
+
+def _ranked_page(conn, match, category, after, limit):
+    sql = f'''
+    SELECT {PRODUCT_COLUMNS}, f.score
+    FROM (
+        SELECT rowid AS id, bm25(products_fts, {BM25_WEIGHTS}) AS score
+        FROM products_fts
+        WHERE products_fts MATCH ?
+    ) f
+    JOIN products p ON p.id = f.id
+    '''
+    params = [match]
+    if category:
+        sql += ' JOIN categories c ON c.id = p.category_id AND c.slug = ?'
+        params.append(category)
+    if after:
+        sql += ' WHERE f.score > ? OR (f.score = ? AND f.id > ?)'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY f.score, f.id LIMIT ?'
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['score']!r}:{rows[-1]['id']}"
+    return rows, next_cursor
+
+
+def _browse_page(conn, category, after, limit):
+    sql = f'SELECT {PRODUCT_COLUMNS} FROM products p'
+    params = []
+    if category:
+        sql += ' JOIN categories c ON c.id = p.category_id AND c.slug = ?'
+        params.append(category)
+    if after:
+        sql += ' WHERE p.id > ?'
+        params.append(after)
+    sql += ' ORDER BY p.id LIMIT ?'
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1]['id'])
+    return rows, next_cursor
+
+
+def category_facets(conn, match):
+    """Match counts per category, ignoring any category filter"""
+    if match:
+        rows = conn.execute('''
+        SELECT c.slug, c.name, COUNT(*) AS product_count
+        FROM products_fts f
+        JOIN products p ON p.id = f.rowid
+        JOIN categories c ON c.id = p.category_id
+        WHERE products_fts MATCH ?
+        GROUP BY c.id
+        ORDER BY product_count DESC, c.name
+        ''', (match,)).fetchall()
+    else:
+        rows = conn.execute('''
+        SELECT c.slug, c.name, COUNT(*) AS product_count
+        FROM products p
+        JOIN categories c ON c.id = p.category_id
+        GROUP BY c.id
+        ORDER BY product_count DESC, c.name
+        ''').fetchall()
+    return [dict(row) for row in rows]
+
+
+def search_products(conn, query, category=None, cursor=None, limit=PAGE_SIZE):
+    """One page of results plus facets and the cursor for the next page"""
+    match = build_match(query)
+    after = parse_cursor(cursor, ranked=bool(match))
+    if match:
+        rows, next_cursor = _ranked_page(conn, match, category, after, limit)
+    else:
+        rows, next_cursor = _browse_page(conn, category, after, limit)
+
+    products = [dict(row) for row in rows]
+    product_imgs = primary_images(conn, [p['id'] for p in products])
+    for product in products:
+        product['image'] = product_imgs.get(product['id'], DEFAULT_IMAGE)
+
+    return {
+        'products': products,
+        'facets': category_facets(conn, match),
+        'next_cursor': next_cursor,
+    }
@@ -0,0 +1,90 @@
+import sys
+
+import db_pool
+
+# Incrementally maintained statistics for the admin dashboard.
+#
+# sales_rollups holds one row per bucket: 'total', 'day:YYYY-MM-DD' and
+# 'hour:YYYY-MM-DDTHH' (UTC). Triggers on orders (see database.MIGRATIONS)
+# add to them inside the same transaction that creates an order in
+# checkout() or marks it paid in payment_success(). store_counters keeps the
+# product and customer counts the same way. The dashboard reads a fixed
+# number of rows however much history there is; rebuild() recomputes
+# everything from the base tables for backfills or repairs.
+
+COUNTERS = ('products', 'active_products', 'customers')
+
+REBUILD_COUNTERS = '''
+INSERT OR REPLACE INTO store_counters (name, value)
+VALUES ('products', (SELECT COUNT(*) FROM products)),
+       ('active_products', (SELECT COUNT(*) FROM products WHERE COALESCE(stock_quantity, 0) > 0)),
+       ('customers', (SELECT COUNT(*) FROM users WHERE NOT COALESCE(is_admin, 0)))
+'''
+
+REBUILD_STATEMENTS = [
+    'DELETE FROM sales_rollups',
+    '''
+    INSERT INTO sales_rollups (bucket, orders, paid_orders, sales)
+    SELECT bucket, SUM(orders), SUM(paid_orders), SUM(sales)
+    FROM (
+        SELECT 'total' AS bucket, 1 AS orders, 0 AS paid_orders, 0 AS sales FROM orders
+        UNION ALL
+        SELECT 'day:' || strftime('%Y-%m-%d', created_at), 1, 0, 0 FROM orders
+        UNION ALL
+        SELECT 'hour:' || strftime('%Y-%m-%dT%H', created_at), 1, 0, 0 FROM orders
+        UNION ALL
+        SELECT 'total', 0, 1, total FROM orders WHERE payment_status = 'paid'
+        UNION ALL
+        SELECT 'day:' || strftime('%Y-%m-%d', COALESCE(paid_at, created_at)), 0, 1, total
+        FROM orders WHERE payment_status = 'paid'
+        UNION ALL
+        SELECT 'hour:' || strftime('%Y-%m-%dT%H', COALESCE(paid_at, created_at)), 0, 1, total
+        FROM orders WHERE payment_status = 'paid'
+    )
+    GROUP BY bucket
+    ''',
+    REBUILD_COUNTERS,
+]
+
+
+def rebuild(conn):
+    """Recompute every rollup and counter from the base tables"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for statement in REBUILD_STATEMENTS:
+            conn.execute(statement)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def dashboard_stats(conn, day):
+    """Totals, today's bucket and the store counters"""
+    rows = conn.execute('''
+    SELECT bucket, orders, paid_orders, sales FROM sales_rollups
+    WHERE bucket IN ('total', ?)
+    ''', (f'day:{day}',)).fetchall()
+    buckets = {row['bucket']: row for row in rows}
+    total = buckets.get('total')
+    today = buckets.get(f'day:{day}')
+    counters = {row['name']: row['value'] for row in conn.execute('SELECT name, value FROM store_counters')}
+    return {
+        'total_sales': total['sales'] if total else 0,
+        'total_orders': total['orders'] if total else 0,
+        'today_sales': today['sales'] if today else 0,
+        'today_orders': today['orders'] if today else 0,
+        'total_products': counters.get('products', 0),
+        'active_products': counters.get('active_products', 0),
+        'total_customers': counters.get('customers', 0),
+    }
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rebuild']:
+        print('usage: python rollups.py rebuild')
+        sys.exit(2)
+    conn = db_pool.get_connection()
+    rebuild(conn)
+    conn.close()
+    print('Dashboard rollups rebuilt.')
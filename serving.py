@@ -0,0 +1,111 @@
+import os
+import sys
+
+import db_pool
+
+# Serving modes, chosen with SERVER_MODE and launched by gunicorn.conf.py.
+#
+# sync (default): gthread workers. A request keeps its OS thread while it
+# waits on Razorpay, so at most WEB_WORKERS x WEB_THREADS checkouts are in
+# flight and the rest queue behind them.
+#
+# async: gevent workers. gunicorn monkey-patches the standard library before
+# the app is imported, so every blocking socket call (the Razorpay client and
+# shiprocket.py both use requests) yields to other requests, and one worker
+# keeps up to WEB_CONNECTIONS requests waiting on upstreams. SQLite calls
+# don't yield, so init_app() hands statements and commits to DB_THREADS OS
+# threads (see db_pool.run_blocking), and at most that many requests hold a
+# write transaction at once. Routes already close their connection before
+# calling Razorpay, so waiting on it doesn't take a database slot.
+#
+# The threads are plain OS threads, and each call wakes the greenlet waiting
+# on it through an async watcher on the hub's loop. The watcher is started
+# before the call is queued: libev drops a send() to a watcher that isn't
+# started yet, and a wakeup lost that way left the greenlet holding the write
+# lock parked while every other writer sat out the 5 s busy_timeout.
+#
+# Flask 2.0 runs "async def" views to completion on the WSGI thread that
+# received the request, so async views alone would not free that thread
+# while Razorpay answers; cooperative workers do, without rewriting routes.
+
+MODE = os.environ.get('SERVER_MODE', 'sync')
+DB_THREADS = int(os.environ.get('DB_THREADS', 8))
+
+
+def cooperative():
+    """True inside a gevent worker, whose sockets yield instead of blocking"""
+    # A worker that patched has imported gevent already; don't import it just to ask
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+class _Call:
+    """One function call handed to an OS thread; result() waits cooperatively"""
+
+    def __init__(self, fn, args):
+        from gevent import get_hub
+        self.fn = fn
+        self.args = args
+        self.done = False
+        self.value = None
+        self.error = None
+        self._waiter = None
+        self._watcher = get_hub().loop.async_()
+        self._watcher.start(self._wake)
+
+    def run(self):
+        try:
+            self.value = self.fn(*self.args)
+        except BaseException as e:
+            self.error = e
+        self.fn = self.args = None
+        self.done = True
+        # The only watcher method that is safe to call from another thread
+        self._watcher.send()
+
+    def _wake(self):
+        # Runs on the hub once run() has finished
+        self._watcher.close()
+        if self._waiter is not None:
+            self._waiter.switch(None)
+
+    def result(self):
+        from gevent.hub import Waiter
+        if not self.done:
+            self._waiter = Waiter()
+            self._waiter.get()
+        value, error, self.value, self.error = self.value, self.error, None, None
+        if error is not None:
+            raise error
+        return value
+
+
+class OffloadExecutor:
+    """Fixed set of real OS threads for blocking calls made from greenlets"""
+
+    def __init__(self, threads):
+        from gevent import monkey
+        self._calls = monkey.get_original('queue', 'SimpleQueue')()
+        start_thread = monkey.get_original('_thread', 'start_new_thread')
+        for _ in range(threads):
+            start_thread(self._work, ())
+
+    def _work(self):
+        while True:
+            call = self._calls.get()
+            call.run()
+            del call
+
+    def submit(self, fn, *args):
+        call = _Call(fn, args)
+        self._calls.put(call)
+        return call
+
+
+def init_app(app):
+    """Send database work to a bounded thread pool when running under gevent"""
+    if cooperative():
+        db_pool.set_executor(OffloadExecutor(DB_THREADS), max_writers=DB_THREADS)
+        app.config['SERVER_MODE'] = 'async'
+    else:
+        app.config['SERVER_MODE'] = 'sync'
@@ -0,0 +1,226 @@
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import db_pool
+import metrics
+import pricing
+import shiprocket
+
+# Delivery quotes (serviceability, courier rate and estimated days) for a
+# pincode, checked at checkout and served to the checkout page.
+#
+# A Shiprocket lookup takes hundreds of milliseconds, so quotes are cached by
+# the pincode's first PINCODE_PREFIX_DIGITS digits (its sorting district)
+# and the parcel's weight band of pricing.SLAB_KG, the unit couriers bill in.
+# A band is quoted at its top weight, so the rate holds for every parcel in
+# it. Entries stay in an in-process LRU for QUOTE_TTL seconds and, unless
+# SHIPPING_QUOTES_PERSIST=0, in the shipping_quotes table, where other
+# workers and restarted processes find them. Concurrent lookups of one key
+# wait on a single upstream call. A failed lookup is remembered as unknown
+# (serviceable None) for ERROR_TTL seconds so an outage isn't hammered, and
+# checkout goes ahead on an unknown quote. A pincode couriers don't serve
+# says nothing about the rest of its district, so a negative quote is also
+# cached under the full pincode, and one found under the prefix is checked
+# again for the pincode at hand before it is believed.
+#
+# package_for() sizes the parcel from product dimensions, both for quotes and
+# for the shipments fulfilment.py creates.
+
+logger = logging.getLogger(__name__)
+
+PICKUP_PINCODE = os.environ.get('SHIPROCKET_PICKUP_PINCODE', '400001')
+PINCODE_PREFIX_DIGITS = 3
+QUOTE_TTL = float(os.environ.get('SHIPPING_QUOTE_TTL', 6 * 3600))
+ERROR_TTL = 60
+MAX_QUOTES = int(os.environ.get('SHIPPING_QUOTE_CACHE_SIZE', 10000))
+PERSIST = os.environ.get('SHIPPING_QUOTES_PERSIST', '1') == '1'
+# Quotes run inside checkout requests, so they give up sooner than shipments do
+QUOTE_TIMEOUT = (shiprocket.CONNECT_TIMEOUT, float(os.environ.get('SHIPPING_QUOTE_READ_TIMEOUT', 5)))
+
+MIN_SIDE_CM = 1
+MIN_WEIGHT_KG = 0.05
+
+PINCODE_RE = re.compile(r'^[1-9][0-9]{5}$')
+UNKNOWN = {'serviceable': None, 'courier': None, 'rate': None, 'etd_days': None}
+
+
+def package_for(items):
+    """Dimensions in cm and weight in kg of one parcel holding items
+
+    Units are stacked on their smallest side, so the parcel is as long and
+    as wide as the largest unit and as tall as the stack. items need
+    quantity, weight, length, width and height.
+    """
+    length = breadth = height = weight = 0
+    for item in items:
+        quantity = item['quantity']
+        sides = sorted((item['length'] or 0, item['width'] or 0, item['height'] or 0), reverse=True)
+        length = max(length, sides[0])
+        breadth = max(breadth, sides[1])
+        height += sides[2] * quantity
+        weight += (item['weight'] or 0) * quantity
+    return {
+        'length': max(MIN_SIDE_CM, round(length, 1)),
+        'breadth': max(MIN_SIDE_CM, round(breadth, 1)),
+        'height': max(MIN_SIDE_CM, round(height, 1)),
+        'weight': max(MIN_WEIGHT_KG, round(weight, 3)),
+    }
+
+
+def weight_band(package):
+    """Slab count covering the greater of the parcel's weight and volumetric weight"""
+    volumetric = package['length'] * package['breadth'] * package['height'] / pricing.VOLUMETRIC_DIVISOR
+    return max(1, math.ceil(round(max(package['weight'], volumetric), 3) / pricing.SLAB_KG))
+
+
+def parse_serviceability(body):
+    """Cheapest courier from a serviceability response, as a quote"""
+    couriers = (body.get('data') or {}).get('available_courier_companies') or []
+    if not couriers:
+        return dict(UNKNOWN, serviceable=False)
+    best = min(couriers, key=lambda courier: float(courier.get('rate') or 0))
+    days = str(best.get('estimated_delivery_days') or '')
+    return {
+        'serviceable': True,
+        'courier': best.get('courier_name'),
+        'rate': float(best.get('rate') or 0),
+        'etd_days': int(days) if days.isdigit() else None,
+    }
+
+
+def _count(result):
+    metrics.registry.inc('cache_lookups_total', (('cache', 'shipping_quote'), ('result', result)))
+
+
+class QuoteCache:
+    """LRU of quotes with per-entry expiry; one upstream fetch per key at a time"""
+
+    def __init__(self, max_entries=MAX_QUOTES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def put(self, key, quote, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, quote)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key, fetch):
+        """Cached quote for key, else the one fetch() returns as (quote, ttl)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                _count('hit')
+                return entry[1]
+            future = self._pending.get(key)
+            leader = future is None
+            if leader:
+                future = self._pending[key] = Future()
+        if not leader:
+            _count('coalesced')
+            return future.result()
+        try:
+            quote, ttl = fetch()
+            self.put(key, quote, ttl)
+            future.set_result(quote)
+            return quote
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+
+def load_stored(key):
+    """(quote, seconds left) from shipping_quotes, or None if absent or expired"""
+    conn = db_pool.get_connection()
+    try:
+        row = conn.execute('''
+        SELECT quote, fetched_at FROM shipping_quotes
+        WHERE pincode_prefix = ? AND weight_band = ? AND fetched_at > ?
+        ''', key + (time.time() - QUOTE_TTL,)).fetchone()
+    except sqlite3.Error as e:
+        # Ask Shiprocket instead
+        logger.warning('Could not load shipping quote for %s: %s', key, e)
+        return None
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return json.loads(row['quote']), row['fetched_at'] + QUOTE_TTL - time.time()
+
+
+def store(key, quote):
+    conn = db_pool.get_connection()
+    try:
+        conn.execute('''
+        INSERT INTO shipping_quotes (pincode_prefix, weight_band, quote, fetched_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (pincode_prefix, weight_band) DO UPDATE SET quote = excluded.quote, fetched_at = excluded.fetched_at
+        ''', key + (json.dumps(quote), time.time()))
+        conn.commit()
+    except sqlite3.Error as e:
+        # The in-process entry still serves this worker
+        conn.rollback()
+        logger.warning('Could not store shipping quote for %s: %s', key, e)
+    finally:
+        conn.close()
+
+
+def _lookup(pincode, key):
+    if PERSIST:
+        stored = load_stored(key)
+        if stored is not None:
+            _count('stored')
+            return stored
+    _count('miss')
+    try:
+        body = shiprocket.get_client().serviceability(PICKUP_PINCODE, pincode, key[1] * pricing.SLAB_KG,
+                                                      timeout=QUOTE_TIMEOUT)
+    except Exception as e:
+        logger.warning('Shipping quote for %s failed: %s', pincode, e)
+        return UNKNOWN, ERROR_TTL
+    quote = parse_serviceability(body)
+    if PERSIST:
+        store(key, quote)
+    if quote['serviceable'] is False and key[0] != pincode:
+        # So quote() doesn't ask again for this pincode
+        exact = (pincode, key[1])
+        quotes.put(exact, quote, QUOTE_TTL)
+        if PERSIST:
+            store(exact, quote)
+    return quote, QUOTE_TTL
+
+
+def quote(pincode, package):
+    """Delivery quote for package (see package_for) to pincode, or None for an invalid pincode"""
+    pincode = (pincode or '').strip()
+    if not PINCODE_RE.match(pincode):
+        return None
+    key = (pincode[:PINCODE_PREFIX_DIGITS], weight_band(package))
+    result = quotes.get(key, lambda: _lookup(pincode, key))
+    if result['serviceable'] is False:
+        # Possibly another pincode of the district; only a negative for this one counts
+        key = (pincode, key[1])
+        result = quotes.get(key, lambda: _lookup(pincode, key))
+    return result
+
+
+quotes = QuoteCache()
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+
+import metrics
+
+# Shiprocket configuration
+SHIPROCKET_EMAIL = os.environ.get('SHIPROCKET_EMAIL', 'your_shiprocket_email')
+SHIPROCKET_PASSWORD = os.environ.get('SHIPROCKET_PASSWORD', 'your_shiprocket_password')
+SHIPROCKET_BASE_URL = os.environ.get('SHIPROCKET_BASE_URL', 'https://apiv2.shiprocket.in/v1/external')
+
+POOL_SIZE = int(os.environ.get('SHIPROCKET_POOL_SIZE', 10))
+CONNECT_TIMEOUT = float(os.environ.get('SHIPROCKET_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.environ.get('SHIPROCKET_READ_TIMEOUT', 15))
+
+# Shiprocket tokens are valid for 10 days; refresh a day early
+TOKEN_TTL = 9 * 24 * 3600
+
+
+class ShiprocketError(Exception):
+    pass
+
+
+class ShiprocketClient:
+    """Shiprocket API client over one pooled keep-alive session"""
+
+    def __init__(self, email=SHIPROCKET_EMAIL, password=SHIPROCKET_PASSWORD,
+                 base_url=SHIPROCKET_BASE_URL, pool_size=POOL_SIZE,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 token_ttl=TOKEN_TTL):
+        self.email = email
+        self.password = password
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.token_ttl = token_ttl
+
+        # Imported here so processes that never ship don't load requests
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = threading.Lock()
+
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+    def _record(self, endpoint, elapsed, failed):
+        with self._metrics_lock:
+            m = self._metrics.setdefault(endpoint, {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            m['calls'] += 1
+            m['errors'] += failed
+            m['total_seconds'] += elapsed
+            m['max_seconds'] = max(m['max_seconds'], elapsed)
+        metrics.observe_external('shiprocket', endpoint, elapsed, failed)
+
+    def _send(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method, f'{self.base_url}/{path}', **kwargs)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self._record(path, time.perf_counter() - start, failed)
+
+    def _login(self):
+        response = self._send('POST', 'auth/login', json={'email': self.email, 'password': self.password})
+        if response.status_code != 200:
+            raise ShiprocketError(f'Shiprocket login failed with {response.status_code}')
+        token = response.json().get('token')
+        if not token:
+            raise ShiprocketError('Shiprocket login returned no token')
+        return token
+
+    def token(self, stale=None):
+        """Current bearer token, logging in again when it expired or equals stale"""
+        with self._token_lock:
+            if self._token and self._token != stale and time.monotonic() < self._token_expires:
+                return self._token
+            self._token = self._login()
+            self._token_expires = time.monotonic() + self.token_ttl
+            return self._token
+
+    def request(self, method, path, **kwargs):
+        token = self.token()
+        response = self._send(method, path, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+        if response.status_code == 401:
+            # Token revoked or expired early: refresh once and retry
+            token = self.token(stale=token)
+            response = self._send(method, path, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+        return response
+
+    def create_adhoc_order(self, shipment_data):
+        """Create a Shiprocket order and return its response body"""
+        response = self.request('POST', 'orders/create/adhoc', json=shipment_data)
+        if response.status_code != 200:
+            raise ShiprocketError(f'orders/create/adhoc returned {response.status_code}: {response.text[:200]}')
+        return response.json()
+
+    def serviceability(self, pickup_postcode, delivery_postcode, weight, cod=False, timeout=None):
+        """Couriers that carry a parcel of weight kg between two pincodes, with their rates"""
+        params = {'pickup_postcode': pickup_postcode, 'delivery_postcode': delivery_postcode,
+                  'weight': weight, 'cod': int(cod)}
+        response = self.request('GET', 'courier/serviceability/', params=params, timeout=timeout or self.timeout)
+        if response.status_code == 404:
+            # No courier serves this route
+            return {'data': {'available_courier_companies': []}}
+        if response.status_code != 200:
+            raise ShiprocketError(f'courier/serviceability returned {response.status_code}: {response.text[:200]}')
+        return response.json()
+
+    def stats(self):
+        with self._metrics_lock:
+            return {endpoint: dict(m) for endpoint, m in self._metrics.items()}
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ShiprocketClient()
+        return _client
+
+
+def create_adhoc_order(shipment_data):
+    return get_client().create_adhoc_order(shipment_data)
@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# db_pool reads INVENTORY_DB on import, so this has to come first
+_scratch = tempfile.TemporaryDirectory()
+os.environ['INVENTORY_DB'] = os.path.join(_scratch.name, 'tests.db')
+os.environ.setdefault('SECRET_KEY', 'tests')
+
+
+@pytest.fixture(scope='session')
+def storefront():
+    """The app module, against a scratch database built by init_db()"""
+    os.chdir(ROOT)
+    import database
+    database.init_db()
+    import app
+    return app
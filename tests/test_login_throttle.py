@@ -0,0 +1,38 @@
+import pytest
+
+import passwords
+
+PROXY = {'REMOTE_ADDR': '127.0.0.1'}
+
+
+@pytest.fixture
+def client(storefront, monkeypatch):
+    monkeypatch.setattr(passwords, 'ip_limiter', passwords.RateLimiter(passwords.IP_BURST, passwords.IP_REFILL_SECONDS))
+    monkeypatch.setattr(passwords, 'account_limiter',
+                        passwords.RateLimiter(passwords.ACCOUNT_BURST, passwords.ACCOUNT_REFILL_SECONDS))
+    app = storefront.create_app({'TESTING': True, 'PROXY_HOPS': 1})
+    client = app.test_client()
+    for name in ('alice', 'bob'):
+        client.post('/register', data={'username': name, 'email': f'{name}@example.com', 'password': 'right'},
+                    environ_base=PROXY, headers={'X-Forwarded-For': '192.0.2.1'})
+    return client
+
+
+def login(client, ip, email, password):
+    return client.post('/login', data={'email': email, 'password': password},
+                       environ_base=PROXY, headers={'X-Forwarded-For': ip})
+
+
+def test_failures_from_one_ip_lock_out_only_that_ip(client):
+    statuses = [login(client, '203.0.113.9', 'alice@example.com', 'wrong').status_code
+                for _ in range(passwords.ACCOUNT_BURST + 1)]
+    assert statuses[-1] == 429
+    # Same account from another client, and another account, are unaffected
+    assert login(client, '198.51.100.7', 'alice@example.com', 'right').status_code == 302
+    assert login(client, '198.51.100.7', 'bob@example.com', 'right').status_code == 302
+    assert login(client, '203.0.113.9', 'bob@example.com', 'right').status_code == 302
+
+
+def test_successful_logins_are_not_charged_to_the_account(client):
+    for _ in range(passwords.ACCOUNT_BURST * 2):
+        assert login(client, '198.51.100.7', 'alice@example.com', 'right').status_code == 302
@@ -0,0 +1,28 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, 'registry', registry)
+    return registry
+
+
+def test_large_counters_keep_every_digit(registry):
+    registry.inc('http_requests_total', (('route', 'index'), ('status', '200')), amount=123456789)
+    assert 'http_requests_total{route="index",status="200"} 123456789\n' in metrics.render()
+
+
+def test_float_values_round_trip(registry):
+    registry.observe('http_request_duration_seconds', 1234.5678901, (('route', 'index'),))
+    text = metrics.render()
+    assert 'http_request_duration_seconds_sum{route="index"} 1234.5678901\n' in text
+    assert 'http_request_duration_seconds_bucket{route="index",le="+Inf"} 1\n' in text
+
+
+def test_special_float_spellings():
+    assert metrics._format_value(float('inf')) == '+Inf'
+    assert metrics._format_value(float('-inf')) == '-Inf'
+    assert metrics._format_value(float('nan')) == 'NaN'
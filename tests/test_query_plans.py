@@ -0,0 +1,29 @@
+import os
+
+import cart_service
+import check_query_plans
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def statements(path):
+    return [sql for lineno, sql in check_query_plans.extract_statements(path)]
+
+
+def test_cart_view_constant_is_checked():
+    assert ' '.join(cart_service.CART_VIEW_SQL.split()) in statements(os.path.join(ROOT, 'cart_service.py'))
+    assert check_query_plans.check([os.path.join(ROOT, 'cart_service.py')], strict=True) == 0
+
+
+def test_constants_named_in_execute_calls_are_resolved(tmp_path):
+    (tmp_path / 'slow_queries.py').write_text("ALL_CARTS = 'SELECT * FROM cart'\n")
+    (tmp_path / 'views.py').write_text(
+        'import slow_queries\n'
+        "ORDER_LINES = 'SELECT * FROM order_items'\n"
+        '\n'
+        'def load(conn):\n'
+        '    conn.execute(ORDER_LINES)\n'
+        '    conn.execute(slow_queries.ALL_CARTS)\n'
+    )
+    assert statements(tmp_path / 'views.py') == ['SELECT * FROM order_items', 'SELECT * FROM cart']
+    assert check_query_plans.check([tmp_path / 'views.py']) == 2